@@ -1,6 +1,8 @@
-import datetime
 import os.path
+import threading
+import time
 import config
+from services import calendar_mirror
 from google.auth import exceptions
 from google.auth.exceptions import RefreshError
 from google.auth.transport.requests import Request
@@ -12,9 +14,32 @@ from googleapiclient.errors import HttpError
 # --- CONFIGURATION ---
 SCOPES = ["https://www.googleapis.com/auth/calendar"]
 
+# Le client est construit une seule fois (lecture du jeton + document de découverte embarqué)
+# puis réutilisé ; il est reconstruit si les identifiants deviennent invalides.
+_service = None
+_service_lock = threading.Lock()
+# Les lectures sont servies par la copie locale (services/calendar_mirror.py), rafraîchie par syncToken.
+# Le transport HTTP du client (httplib2) n'est pas thread-safe : un seul appel à l'API à la fois.
+_api_lock = threading.Lock()
+_refresher = None
+
 
 def get_calendar_service():
-    """Se connecte à l'API et retourne un objet 'service' pour interagir."""
+    """Se connecte à l'API et retourne un objet 'service' pour interagir (construit une seule fois)."""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = _build_calendar_service()
+        return _service
+
+
+def _reset_calendar_service():
+    global _service
+    with _service_lock:
+        _service = None
+
+
+def _build_calendar_service():
     creds = None
     if os.path.exists(config.TOKEN_PATH):
         try:
@@ -47,7 +72,7 @@ def get_calendar_service():
             with open(config.TOKEN_PATH, "w", encoding="utf-8") as token:
                 token.write(creds.to_json())
 
-    return build("calendar", "v3", credentials=creds)
+    return build("calendar", "v3", credentials=creds, static_discovery=True, cache_discovery=False)
 
 
 def add_event(summary, due_date_str):
@@ -59,69 +84,96 @@ def add_event(summary, due_date_str):
         'end': {'date': due_date_str, 'timeZone': 'Europe/Paris'},
     }
     try:
-        created_event = service.events().insert(calendarId='primary', body=event).execute()
+        with _api_lock:
+            created_event = service.events().insert(calendarId='primary', body=event).execute()
+        # L'agenda principal a pour identifiant l'adresse de son propriétaire (organisateur de l'événement).
+        calendar_id = created_event.get('organizer', {}).get('email', 'primary')
+        calendar_mirror.store_event(calendar_id, created_event)
         print(f"Agent Agenda: Événement '{summary}' créé avec succès.")
         return True
     except HttpError as error:
         print(f"Agent Agenda: Erreur lors de la création de l'événement: {error}")
         return False
 
-def get_upcoming_events(max_results=10):
-    """Shows basic usage of the Google Calendar API.
-    Prints the start and name of the next 10 events on the user's calendar.
+def refresh_calendar_mirror():
+    """Synchronise (incrémentalement) la copie locale des agendas. Retourne True si elle a réussi."""
+    with _api_lock:
+        try:
+            count = calendar_mirror.sync_calendars(get_calendar_service())
+            print(f"Agent Agenda: {count} agenda(s) synchronisé(s).")
+            return True
+        except RefreshError as error:
+            _reset_calendar_service()
+            print(f"Agent Agenda: Identifiants expirés, reconnexion nécessaire : {error}")
+        except HttpError as error:
+            print(f"Agent Agenda: Erreur lors de la synchronisation de l'agenda: {error}")
+        return False
+
+
+def _refresh_in_background():
+    if _api_lock.locked():
+        return
+    threading.Thread(target=refresh_calendar_mirror, name="calendar-refresh", daemon=True).start()
+
+
+def _ensure_mirror():
+    """Synchronise avant la première lecture ; ensuite, une copie trop ancienne est rafraîchie en arrière-plan."""
+    last_sync = calendar_mirror.last_sync_time()
+    if last_sync is None:
+        refresh_calendar_mirror()
+    elif time.time() - last_sync > config.CALENDAR_REFRESH_INTERVAL:
+        _refresh_in_background()
+
+
+def _refresher_loop():
+    while True:
+        time.sleep(config.CALENDAR_REFRESH_INTERVAL)
+        refresh_calendar_mirror()
+
+
+def start_calendar_refresher():
     """
-    try:
-        service = get_calendar_service()
+    Rafraîchit la copie locale des agendas toutes les CALENDAR_REFRESH_INTERVAL secondes.
+    Ne démarre que si l'utilisateur s'est déjà authentifié (pas de fenêtre OAuth en arrière-plan).
+    """
+    global _refresher
+    if _refresher is not None or not os.path.exists(config.TOKEN_PATH):
+        return
+    _refresh_in_background()
+    _refresher = threading.Thread(target=_refresher_loop, name="calendar-refresher", daemon=True)
+    _refresher.start()
 
-        calendar_list = service.calendarList().list().execute()
-        all_events = []
 
-        for calendar_list_entry in calendar_list.get('items', []):
-            calendar_id = calendar_list_entry['id']
-            now = datetime.datetime.utcnow().isoformat() + 'Z'
-            events_result = service.events().list(calendarId=calendar_id, timeMin=now,
-                                                  maxResults=max_results, singleEvents=True,
-                                                  orderBy='startTime').execute()
-            events = events_result.get('items', [])
-            all_events.extend(events)
+def get_upcoming_events(max_results=10):
+    """
+    Retourne les 'max_results' prochains événements de tous les agendas de l'utilisateur,
+    sous forme de liste de dictionnaires (id, summary, start, calendar_id), lus dans la copie locale.
+    """
+    _ensure_mirror()
+    return calendar_mirror.get_upcoming_events(max_results)
 
-        if not all_events:
-            return "Aucun événement à venir trouvé."
 
-        all_events.sort(key=lambda x: x['start'].get('dateTime', x['start'].get('date')))
+def get_today_events():
+    """Événements du jour (copie locale)."""
+    _ensure_mirror()
+    return calendar_mirror.get_events_for_day()
 
-        all_events = all_events[:max_results]
 
-        event_list = ""
-        for event in all_events:
-            start = event['start'].get('dateTime', event['start'].get('date'))
-            event_list += f"{start} - {event['summary']}\n"
-        return event_list
+def find_events(keyword):
+    """Événements à venir dont le titre contient `keyword` (copie locale)."""
+    _ensure_mirror()
+    return calendar_mirror.find_events(keyword)
 
+def delete_event(calendar_id, event_id, summary=""):
+    """Supprime exactement l'événement choisi (agenda + identifiant), sans nouvelle recherche par nom."""
+    label = summary or event_id
+    try:
+        service = get_calendar_service()
+        with _api_lock:
+            service.events().delete(calendarId=calendar_id, eventId=event_id).execute()
+        calendar_mirror.remove_event(calendar_id, event_id)
+        print(f"Agent Agenda: Événement '{label}' supprimé avec succès.")
+        return True
     except HttpError as error:
-        return f"An error occurred: {error}"
-
-def delete_event(summary_to_delete):
-    """Trouve un événement par son nom et le supprime."""
-    print(f"Agent Agenda: Recherche de l'événement contenant '{summary_to_delete}'...")
-    service = get_calendar_service()
-    all_events = get_upcoming_events(max_events=50) 
-    
-    event_to_delete = None
-    for event in all_events:
-        if summary_to_delete.lower() in event['summary'].lower():
-            event_to_delete = event
-            print(f"Agent Agenda: Événement trouvé : '{event['summary']}'")
-            break
-
-    if event_to_delete:
-        try:
-            service.events().delete(calendarId='primary', eventId=event_to_delete['id']).execute()
-            print(f"Agent Agenda: Événement '{event_to_delete['summary']}' supprimé avec succès.")
-            return True
-        except HttpError as error:
-            print(f"Agent Agenda: Erreur lors de la suppression de l'événement: {error}")
-            return False
-    else:
-        print(f"Agent Agenda: Aucun événement correspondant à '{summary_to_delete}' n'a été trouvé.")
+        print(f"Agent Agenda: Erreur lors de la suppression de l'événement: {error}")
         return False
@@ -0,0 +1,161 @@
+# agents/context_snapshot.py
+
+import hashlib
+import json
+import threading
+import time
+from datetime import date
+import config
+from agents import email_agent, agenda_agent, task_agent
+
+# Photographie du contexte utilisé par les recommandations : e-mails analysés, événements
+# (à venir et du jour) et tâches ouvertes. Un thread d'arrière-plan la rafraîchit toutes les
+# CONTEXT_SNAPSHOT_INTERVAL secondes, ou plus tôt pour une section signalée comme modifiée
+# (request_refresh ; les tâches, simple requête locale, sont rechargées aussitôt par refresh_tasks).
+# Chaque section porte une empreinte de son contenu : la version de la photographie n'augmente
+# que si quelque chose a réellement changé.
+# Les recommandations lisent cette photographie au lieu d'interroger IMAP, VirusTotal et le LLM.
+
+
+def _load_emails():
+    return email_agent.get_email_analysis(config.CONTEXT_SNAPSHOT_EMAIL_COUNT)
+
+
+def _load_events():
+    return {"upcoming": agenda_agent.get_upcoming_events(max_results=10),
+            "today": agenda_agent.get_today_events(),
+            "day": date.today().isoformat()}
+
+
+def _load_tasks():
+    return task_agent.get_tasks(status_filter=['à faire', 'en cours'], limit=config.TASK_LIST_LIMIT)
+
+
+SECTIONS = {"emails": _load_emails, "events": _load_events, "tasks": _load_tasks}
+
+_snapshot = None
+_lock = threading.Lock()
+_refresh_lock = threading.Lock()
+_requested = set()
+_wake = threading.Event()
+_worker = None
+snapshot_stats = {"refreshes": 0, "changes": 0}
+
+
+def _fingerprint(value):
+    return hashlib.sha1(json.dumps(value, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def _refresh(sections):
+    """
+    Recharge les sections demandées ; une section en erreur garde son contenu précédent.
+    Les sections sont chargées hors verrou puis appliquées à la photographie la plus récente : une
+    section rechargée entre-temps par un autre appel (refresh_tasks) n'est pas écrasée par une lecture
+    plus ancienne.
+    """
+    global _snapshot
+    loaded = {}
+    for name in sections:
+        started = time.time()
+        try:
+            loaded[name] = (started, SECTIONS[name]())
+        except Exception as e:
+            print(f"[Contexte] Section '{name}' non rafraîchie : {e}")
+    changed = []
+    with _lock:
+        current = _snapshot or {"version": 0, "taken_at": {}, "fingerprints": {}, "emails": [],
+                                "events": {"upcoming": [], "today": [], "day": None}, "tasks": []}
+        updated = dict(current, taken_at=dict(current["taken_at"]), fingerprints=dict(current["fingerprints"]))
+        for name, (started, value) in loaded.items():
+            if started < updated["taken_at"].get(name, 0):
+                continue
+            fingerprint = _fingerprint(value)
+            updated["taken_at"][name] = started
+            if fingerprint != updated["fingerprints"].get(name):
+                updated["fingerprints"][name] = fingerprint
+                updated[name] = value
+                changed.append(name)
+        if changed:
+            updated["version"] += 1
+            snapshot_stats["changes"] += 1
+        snapshot_stats["refreshes"] += 1
+        _snapshot = updated
+    return changed
+
+
+def refresh_snapshot(sections=None):
+    """Rafraîchit la photographie (toutes les sections par défaut). Retourne les sections modifiées."""
+    with _refresh_lock:
+        return _refresh(list(sections or SECTIONS))
+
+
+def refresh_tasks():
+    """
+    Recharge aussitôt les tâches, après une modification : c'est une requête locale, la recommandation
+    suivante les voit à jour. N'attend pas un rafraîchissement en cours (e-mails, agenda).
+    """
+    with _lock:
+        built = _snapshot is not None
+    if not built:
+        # Première photographie en cours de construction : les tâches seront relues par le thread.
+        request_refresh("tasks")
+        return []
+    return _refresh(["tasks"])
+
+
+def request_refresh(*sections):
+    """Signale des sections modifiées (ex. "tasks" après un ajout) : le thread les recharge aussitôt."""
+    with _lock:
+        _requested.update(sections or SECTIONS)
+    _wake.set()
+
+
+def get_snapshot():
+    """
+    Retourne la photographie courante (dictionnaire emails / events / tasks, version, taken_at).
+    Seule la toute première est construite immédiatement ; ensuite la lecture n'attend jamais un
+    rafraîchissement en cours. Si la date a changé, les événements sont redemandés au thread
+    d'arrière-plan et la photographie précédente est servie en attendant.
+    """
+    with _lock:
+        snapshot = _snapshot
+    if snapshot is None:
+        with _refresh_lock:
+            if _snapshot is None:
+                _refresh(list(SECTIONS))
+            with _lock:
+                return _snapshot
+    if snapshot["events"]["day"] != date.today().isoformat():
+        request_refresh("events")
+    return snapshot
+
+
+def snapshot_age(snapshot, section):
+    """Âge (en secondes) d'une section de la photographie, None si elle n'a jamais été chargée."""
+    taken_at = snapshot["taken_at"].get(section)
+    return time.time() - taken_at if taken_at else None
+
+
+def _refresher_loop():
+    while True:
+        triggered = _wake.wait(timeout=config.CONTEXT_SNAPSHOT_INTERVAL)
+        _wake.clear()
+        with _lock:
+            sections = list(_requested) if triggered else list(SECTIONS)
+            _requested.clear()
+        try:
+            changed = refresh_snapshot(sections)
+            if changed:
+                print(f"[Contexte] Mis à jour : {', '.join(changed)}.")
+        except Exception as e:
+            print(f"[Contexte] Rafraîchissement impossible : {e}")
+
+
+def start_context_snapshot():
+    """Construit la première photographie en arrière-plan puis la tient à jour."""
+    global _worker
+    if _worker is not None:
+        return
+    request_refresh()
+    _worker = threading.Thread(target=_refresher_loop, name="context-snapshot", daemon=True)
+    _worker.start()
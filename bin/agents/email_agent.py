@@ -1,121 +1,133 @@
 # agents/email_agent.py
 
 import email
-from email.header import decode_header
-import imaplib
+import hashlib
+import json
+from email.header import decode_header, make_header
+from email.parser import BytesHeaderParser
+import queue
+import threading
 from bs4 import BeautifulSoup
-import fitz
 import config
-from services.mistral_service import get_json_from_mistral, call_mistral, llm
+from services.mistral_service import get_json_from_mistral, max_tokens_for_schema
 from services.security_service import scan_file_with_virustotal
+from services import email_analysis_store, imap_sync, pdf_service, summarizer, user_profile
+from services.imap_session import ImapSession
+from services.prompt_builder import PromptBuilder
 
-CHUNK_SIZE = 3000 
+# Connexion IMAP partagée (TLS + LOGIN une seule fois), rouverte automatiquement si elle tombe.
+imap_session = ImapSession()
+_prefetch_queue = queue.Queue()
+_prefetch_worker = None
+_analysis_lock = threading.Lock()
+# Pièces jointes scannées en arrière-plan (mode DEFERRED_SECURITY_SCAN), une tâche par message.
+# Threads démons démarrés à la première tâche : les scans en attente ne retiennent pas la sortie.
+_attachment_queue = queue.Queue()
+_attachment_workers = []
+_deferred_keys = set()
+_deferred_lock = threading.Lock()
+
+EMAIL_ANALYSIS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "resume": {"type": "string", "maxLength": 250},
+        "importance": {"enum": [1, 2, 3, 4, 5]},
+        "action_requise": {"type": "string", "maxLength": 60},
+    },
+    "required": ["resume", "importance", "action_requise"],
+}
 
 def get_emails(max_count=5):
     """
-    Se connecte à la boîte mail et récupère les 'max_count' derniers e-mails.
+    Se connecte à la boîte mail, synchronise les nouveaux messages et retourne les 'max_count' derniers e-mails.
+    Seuls les UID inconnus sont téléchargés ; les autres proviennent du cache local.
     """
     try:
-        mail = imaplib.IMAP4_SSL('imap.gmail.com')
-        mail.login(config.EMAIL_ADDRESS, config.EMAIL_PASSWORD)
-        mail.select('inbox')
-        status, data = mail.search(None, 'ALL')
-        
-        if status != 'OK':
-            return []
+        new_uids = imap_session.run(lambda mail: imap_sync.sync_mailbox(mail, 'inbox'))
+        print(f"Agent E-mail: {len(new_uids)} nouveau(x) message(s) synchronisé(s).")
+    except Exception as e:
+        print(f"Erreur lors de la synchronisation des e-mails (cache local utilisé): {e}")
+    return imap_sync.get_latest_messages('inbox', max_count)
 
-        mail_ids = data[0].split()
-        latest_mail_ids = mail_ids[-max_count:]
-        emails = []
+def _download_attachment(message, attachment):
+    """Télécharge une pièce jointe à la demande, uniquement quand l'analyse en a besoin."""
+    return imap_session.run(lambda mail: imap_sync.fetch_attachment(
+        mail, message['mailbox'], message['uid'], attachment, message['uidvalidity']))
 
-        for mail_id in reversed(latest_mail_ids):
-            status, data = mail.fetch(mail_id, '(RFC822)')
-            if status == 'OK':
-                emails.append(data[0][1])
-        
-        mail.logout()
-        return emails
+def _read_attachments(message):
+    """
+    Télécharge les PDF du message, les fait analyser par VirusTotal et retourne le texte de ceux jugés sûrs.
+    Bloquant : attend le verdict de chaque pièce jointe.
+    """
+    pdf_text = ""
+    for attachment in message['attachments']:
+        filename = attachment['filename']
+        print(f"      -> Pièce jointe PDF trouvée: {filename}")
+        if attachment['size'] > config.EMAIL_MAX_ATTACHMENT_BYTES:
+            print(f"      -> Le fichier '{filename}' est trop volumineux ({attachment['size']} octets), il est ignoré.")
+            pdf_text += f"\n\n--- PIECE JOINTE '{filename}' IGNORÉE CAR TROP VOLUMINEUSE ---\n"
+            continue
+        try:
+            pdf_data = _download_attachment(message, attachment)
+        except Exception as e:
+            print(f"      -> Impossible de télécharger '{filename}' : {e}")
+            continue
+
+        is_safe = scan_file_with_virustotal(pdf_data)
         
-    except Exception as e:
-        print(f"Erreur lors de la récupération des e-mails: {e}")
-        return []
+        if is_safe:
+            print(f"      -> Le fichier '{filename}' est sûr. Lecture du contenu.")
+            try:
+                pdf_text += pdf_service.extract_pdf_text(pdf_data) + "\n"
+            except Exception as e:
+                print(f"      -> Erreur lors de la lecture du PDF pourtant jugé sûr : {e}")
+        else:
+            print(f"      -> ATTENTION : Le fichier '{filename}' a été jugé non sûr et sera ignoré.")
+            pdf_text += f"\n\n--- PIECE JOINTE '{filename}' IGNORÉE CAR POTENTIELLEMENT DANGEREUSE ---\n"
+    return pdf_text
 
-def parse_email(raw_email):
+def parse_email(message, defer_attachments=False):
     """
-    Parse un e-mail brut pour extraire l'expéditeur, le sujet, le corps et le contenu des PDF analysés comme sûrs.
+    Parse un e-mail synchronisé (en-têtes + extrait du corps texte) pour extraire l'expéditeur, le sujet,
+    le corps et le contenu des PDF analysés comme sûrs. Les PDF ne sont téléchargés qu'à ce moment-là.
+    Avec `defer_attachments`, les pièces jointes ne sont ni téléchargées ni scannées : elles sont
+    remplacées par une mention « en attente d'analyse ».
     """
-    msg = email.message_from_bytes(raw_email)
+    msg = email.message_from_bytes(message['header'])
     
-    sender, encoding = decode_header(msg.get('From'))[0]
-    if isinstance(sender, bytes):
-        sender = sender.decode(encoding if encoding else 'utf-8')
+    # Le nom affiché peut être encodé (=?utf-8?...?=) : on décode l'en-tête complet avant d'en extraire l'adresse.
+    sender = str(make_header(decode_header(msg.get('From', ''))))
     sender_email = email.utils.parseaddr(sender)[1]
 
     subject, encoding = decode_header(msg['Subject'])[0]
     if isinstance(subject, bytes):
         subject = subject.decode(encoding if encoding else 'utf-8')
 
-    body = ""
-    pdf_text = ""
-
-    if msg.is_multipart():
-        for part in msg.walk():
-            content_type = part.get_content_type()
-            content_disposition = str(part.get("Content-Disposition"))
-
-            if "attachment" not in content_disposition:
-                if content_type == "text/plain" and not body:
-                    try: body = part.get_payload(decode=True).decode()
-                    except: continue
-                elif content_type == "text/html":
-                    try:
-                        html_body = part.get_payload(decode=True).decode()
-                        if not body: body = BeautifulSoup(html_body, "html.parser").get_text()
-                    except: continue
-            
-            elif "attachment" in content_disposition and part.get_filename() and part.get_filename().lower().endswith('.pdf'):
-                filename = part.get_filename()
-                print(f"      -> Pièce jointe PDF trouvée: {filename}")
-                pdf_data = part.get_payload(decode=True)
-                
-                is_safe = scan_file_with_virustotal(pdf_data)
-                
-                if is_safe:
-                    print(f"      -> Le fichier '{filename}' est sûr. Lecture du contenu.")
-                    try:
-                        with fitz.open(stream=pdf_data, filetype="pdf") as doc:
-                            for page in doc:
-                                pdf_text += page.get_text() + "\n"
-                    except Exception as e:
-                        print(f"      -> Erreur lors de la lecture du PDF pourtant jugé sûr : {e}")
-                else:
-                    print(f"      -> ATTENTION : Le fichier '{filename}' a été jugé non sûr et sera ignoré.")
-                    pdf_text += f"\n\n--- PIECE JOINTE '{filename}' IGNORÉE CAR POTENTIELLEMENT DANGEREUSE ---\n"
+    body = _body_text(message)
 
+    if defer_attachments:
+        pdf_text = "".join(
+            f"\n\n--- PIECE JOINTE '{attachment['filename']}' EN ATTENTE D'ANALYSE ---\n"
+            for attachment in message['attachments']
+        )
     else:
-        try: body = msg.get_payload(decode=True).decode()
-        except: body = "Corps de l'e-mail illisible."
+        pdf_text = _read_attachments(message)
     
     full_body = f"{body}\n\n{pdf_text}"
     return sender_email, subject, full_body.strip()
 
-def _summarize_long_body(body_text):
-    print("      -> Le corps de l'e-mail est très long, résumé par morceaux en cours...")
-    tokens = llm.tokenize(body_text.encode('utf-8', errors='ignore'))
-    chunks = [llm.detokenize(tokens[i:i + CHUNK_SIZE]).decode('utf-8', errors='ignore') for i in range(0, len(tokens), CHUNK_SIZE)]
-    summaries = []
-    for i, chunk in enumerate(chunks):
-        print(f"      -> Résumé du morceau {i+1}/{len(chunks)}...")
-        prompt = f"[INST]Résume le morceau de texte suivant de manière concise:\n\n{chunk}[/INST]"
-        summary = call_mistral(prompt)
-        if summary: summaries.append(summary)
-    print("      -> Combinaison des résumés...")
-    combined_summary = "\n\n".join(summaries)
-    final_prompt = f"[INST]Combine les résumés partiels suivants en un seul résumé global et cohérent:\n\n{combined_summary}[/INST]"
-    return call_mistral(final_prompt) or "Résumé impossible à générer."
+def _body_text(message):
+    body = message['body_text']
+    if message['body_subtype'] == 'html':
+        try: body = BeautifulSoup(body, "html.parser").get_text()
+        except Exception: pass
+    if not body and not message['attachments']:
+        body = "Corps de l'e-mail illisible."
+    if message['body_truncated']:
+        body += "\n[... corps tronqué ...]"
+    return body
 
-def analyze_email_with_llm(sender, subject, body):
-    analysis_prompt = f"""
+EMAIL_ANALYSIS_PROMPT_PREFIX = """
 [INST]
 Tu es un assistant IA expert qui analyse des e-mails. Ta tâche est de lire un e-mail (expéditeur, sujet et corps) et de renvoyer une analyse au format JSON. L'expéditeur est un indice crucial pour déterminer l'importance.
 
@@ -126,70 +138,279 @@ Corps: A new issue has been created in your repository...
 
 Réponse attendue:
 ```json
-{{
+{
   "resume": "Un nouveau ticket (bug UI) a été ouvert sur le dépôt CodeReader de GitHub.",
   "importance": 4,
   "action_requise": "Consulter"
-}}
+}
 ```
 
 ### E-MAIL À ANALYSER ###
-Expéditeur: {sender}
-Sujet: {subject}
-Corps: {body}
-
-Réponse attendue:
-[/INST]
 """
-    prompt_tokens = llm.tokenize(analysis_prompt.encode('utf-8', errors='ignore'))
-    if len(prompt_tokens) > (config.N_CTX - 500):
-        body = _summarize_long_body(body)
-        analysis_prompt = f"""
-[INST]
-Tu es un assistant IA expert qui analyse des e-mails. Ta tâche est de lire un e-mail (expéditeur, sujet et corps) et de renvoyer une analyse au format JSON. L'expéditeur est un indice crucial pour déterminer l'importance.
 
-### EXEMPLE PARFAIT ###
-Expéditeur: notifications@github.com
-Sujet: [CodeReader] New issue: "Bug in UI"
-Corps: A new issue has been created in your repository...
+def _build_analysis_prompt(sender, subject, body):
+    """Suffixe du prompt d'analyse (le préfixe fixe est envoyé à part), corps ajusté au budget de tokens."""
+    builder = PromptBuilder(max_new_tokens=max_tokens_for_schema(EMAIL_ANALYSIS_SCHEMA))
+    builder.reserve(EMAIL_ANALYSIS_PROMPT_PREFIX)
+    builder.add("entete", f"Expéditeur: {sender}\nSujet: {subject}\nCorps: ")
+    builder.add("corps", body, priority=1)
+    builder.add("fin", "\n\nRéponse attendue:\n[/INST]\n", static=True)
+    return builder
 
-Réponse attendue:
-```json
-{{
-  "resume": "Un nouveau ticket (bug UI) a été ouvert sur le dépôt CodeReader de GitHub.",
-  "importance": 4,
-  "action_requise": "Consulter"
-}}
-```
+def analyze_email_with_llm(sender, subject, body):
+    builder = _build_analysis_prompt(sender, subject, body)
+    analysis_suffix = builder.build()
+    if "corps" in builder.truncated:
+        print("      -> Le corps de l'e-mail est très long, résumé par morceaux en cours...")
+        analysis_suffix = _build_analysis_prompt(sender, subject, summarizer.summarize(body)).build()
+    return get_json_from_mistral(analysis_suffix, prefix=EMAIL_ANALYSIS_PROMPT_PREFIX, schema=EMAIL_ANALYSIS_SCHEMA)
 
-### E-MAIL À ANALYSER ###
-Expéditeur: {sender}
-Sujet: {subject}
-Corps: {body}
+# Toute modification du prompt ou du schéma invalide les analyses mises en cache.
+ANALYSIS_PROMPT_VERSION = hashlib.sha256(
+    (EMAIL_ANALYSIS_PROMPT_PREFIX + json.dumps(EMAIL_ANALYSIS_SCHEMA, sort_keys=True)).encode('utf-8')
+).hexdigest()[:16]
 
-Réponse attendue:
-[/INST]
-"""
-    return get_json_from_mistral(analysis_prompt)
+_stale_analyses_purged = False
 
-def get_email_analysis(max_count=5):
-    print(f"Agent E-mail: Récupération des {max_count} derniers e-mails...")
-    raw_emails = get_emails(max_count)
-    if not raw_emails:
-        print("Agent E-mail: Aucun e-mail trouvé ou erreur de connexion.")
-        return []
-    print(f"Agent E-mail: {len(raw_emails)} e-mail(s) trouvé(s). Analyse en cours...")
-    all_analyses = []
-    for raw_email in raw_emails:
-        sender, subject, body = parse_email(raw_email)
+def get_message_key(message):
+    """
+    Identifiant stable d'un message : son Message-ID, ou à défaut l'empreinte SHA-256 de son corps.
+    Seuls les en-têtes sont parsés, le message n'est pas décodé.
+    """
+    headers = BytesHeaderParser().parsebytes(message['header'])
+    message_id = (headers.get('Message-ID') or '').strip()
+    if message_id:
+        return f"mid:{message_id}"
+    return f"sha:{hashlib.sha256(message['body_text'].encode('utf-8', errors='ignore')).hexdigest()}"
+
+def _purge_stale_analyses_once():
+    global _stale_analyses_purged
+    if not _stale_analyses_purged:
+        email_analysis_store.purge_stale_analyses(ANALYSIS_PROMPT_VERSION)
+        _stale_analyses_purged = True
+
+def _infer_analysis(message_key, sender, subject, body, attachments_pending=False, refresh=False):
+    """
+    Étape d'inférence : analyse LLM d'un message déjà préparé, puis enregistrement.
+    `refresh` remplace une analyse existante (analyse provisoire complétée par les pièces jointes).
+    """
+    with _analysis_lock:
+        # Le message a pu être analysé entre-temps par le thread de préchargement.
+        known = email_analysis_store.get_analyses([message_key], ANALYSIS_PROMPT_VERSION)
+        if message_key in known and not (refresh and known[message_key]['attachments_pending']):
+            return known[message_key]
         print(f"Agent E-mail: Analyse de '{subject}' de '{sender}'...")
         try:
             analysis = analyze_email_with_llm(sender, subject, body)
             if analysis:
                 analysis['subject'] = subject
-                all_analyses.append(analysis)
-            else:
-                print(f"      -> Échec de l'analyse pour '{subject}'. Aucune réponse JSON valide reçue.")
+                analysis['sender'] = sender
+                analysis['attachments_pending'] = attachments_pending
+                email_analysis_store.save_analysis(message_key, ANALYSIS_PROMPT_VERSION, analysis, attachments_pending)
+                user_profile.record_email(message_key, sender, analysis.get('importance'))
+                return analysis
+            print(f"      -> Échec de l'analyse pour '{subject}'. Aucune réponse JSON valide reçue.")
         except Exception as e:
             print(f"      -> Une erreur inattendue est survenue lors de l'analyse de '{subject}': {e}")
-    return all_analyses
+        return None
+
+def _defers_attachments(message):
+    """Vrai si les pièces jointes du message doivent être scannées après coup (DEFERRED_SECURITY_SCAN)."""
+    return config.DEFERRED_SECURITY_SCAN and bool(message['attachments'])
+
+def _analyze_message(message_key, message):
+    """Prépare puis analyse un message, hors pipeline (préchargement en arrière-plan)."""
+    if message_key in email_analysis_store.get_analyses([message_key], ANALYSIS_PROMPT_VERSION):
+        return None
+    deferred = _defers_attachments(message)
+    analysis = _infer_analysis(message_key, *parse_email(message, defer_attachments=deferred),
+                               attachments_pending=deferred)
+    if analysis and analysis.get('attachments_pending'):
+        _schedule_attachment_analysis(message_key, message)
+    return analysis
+
+def _complete_with_attachments(message_key, message):
+    """
+    Tâche d'arrière-plan du mode DEFERRED_SECURITY_SCAN : scanne les pièces jointes puis, si leur
+    contenu est exploitable, remplace l'analyse provisoire par une analyse complète.
+    """
+    try:
+        sender, subject, _ = parse_email(message, defer_attachments=True)
+        pdf_text = _read_attachments(message)
+        body = f"{_body_text(message)}\n\n{pdf_text}".strip()
+        if _infer_analysis(message_key, sender, subject, body, refresh=True):
+            print(f"Agent E-mail: analyse de '{subject}' mise à jour avec ses pièces jointes.")
+    except Exception as e:
+        print(f"Agent E-mail: analyse des pièces jointes impossible : {e}")
+    finally:
+        with _deferred_lock:
+            _deferred_keys.discard(message_key)
+
+def _attachment_loop():
+    while True:
+        message_key, message = _attachment_queue.get()
+        try:
+            _complete_with_attachments(message_key, message)
+        finally:
+            _attachment_queue.task_done()
+
+def _schedule_attachment_analysis(message_key, message):
+    with _deferred_lock:
+        if message_key in _deferred_keys:
+            return
+        _deferred_keys.add(message_key)
+        if not _attachment_workers:
+            for _ in range(config.VIRUSTOTAL_MAX_CONCURRENT_SCANS):
+                worker = threading.Thread(target=_attachment_loop, name="email-attachments", daemon=True)
+                worker.start()
+                _attachment_workers.append(worker)
+    _attachment_queue.put((message_key, message))
+
+def iter_email_analysis(max_count=5):
+    """
+    Générateur produisant (rang, analyse) dès qu'une analyse est prête.
+    Pipeline : les analyses connues sortent immédiatement ; les autres messages sont préparés
+    (pièces jointes, scan de sécurité, extraction PDF) par plusieurs threads, puis consommés
+    dans leur ordre d'arrivée par un unique thread d'inférence. La file bornée entre les deux
+    étapes limite le nombre de messages préparés en attente du modèle.
+    En mode DEFERRED_SECURITY_SCAN, les messages avec pièces jointes sont analysés sur leur seul
+    corps et complétés en arrière-plan : la latence ne dépend plus du scan VirusTotal.
+    """
+    print(f"Agent E-mail: Récupération des {max_count} derniers e-mails...")
+    messages = get_emails(max_count)
+    if not messages:
+        print("Agent E-mail: Aucun e-mail trouvé ou erreur de connexion.")
+        return
+
+    _purge_stale_analyses_once()
+    message_keys = [get_message_key(message) for message in messages]
+    known_analyses = email_analysis_store.get_analyses(message_keys, ANALYSIS_PROMPT_VERSION)
+    print(f"Agent E-mail: {len(messages)} e-mail(s) trouvé(s), "
+          f"{len(known_analyses)} déjà analysé(s). Analyse en cours...")
+
+    pending = []
+    for index, (message_key, message) in enumerate(zip(message_keys, messages)):
+        if message_key in known_analyses:
+            if known_analyses[message_key]['attachments_pending']:
+                _schedule_attachment_analysis(message_key, message)
+            yield index, known_analyses[message_key]
+        else:
+            pending.append((index, message_key, message))
+    if not pending:
+        return
+
+    ready = queue.Queue(maxsize=config.EMAIL_PIPELINE_QUEUE_SIZE)
+    results = queue.Queue()
+    todo = queue.Queue()
+    for item in pending:
+        todo.put(item)
+    # Levé quand le générateur s'arrête (fin, délai dépassé ou consommateur qui l'abandonne) :
+    # les threads du pipeline cessent d'attendre les files et se terminent.
+    stop = threading.Event()
+
+    def prepare(index, message_key, message):
+        deferred = _defers_attachments(message)
+        parsed = None
+        try:
+            parsed = parse_email(message, defer_attachments=deferred)
+        except Exception as e:
+            print(f"      -> Impossible de préparer le message {message.get('uid')}: {e}")
+        # File bornée : l'attente d'une place est abandonnée si plus personne ne consomme.
+        while not stop.is_set():
+            try:
+                ready.put((index, message_key, message, parsed, deferred), timeout=0.2)
+                return
+            except queue.Full:
+                pass
+
+    def preparer():
+        while not stop.is_set():
+            try:
+                item = todo.get_nowait()
+            except queue.Empty:
+                return
+            prepare(*item)
+
+    def next_prepared():
+        while not stop.is_set():
+            try:
+                return ready.get(timeout=0.2)
+            except queue.Empty:
+                pass
+        return None
+
+    def inference_worker():
+        for _ in range(len(pending)):
+            item = next_prepared()
+            if item is None:
+                return
+            index, message_key, message, parsed, deferred = item
+            analysis = None
+            try:
+                analysis = _infer_analysis(message_key, *parsed, attachments_pending=deferred) if parsed else None
+                if analysis and analysis.get('attachments_pending'):
+                    _schedule_attachment_analysis(message_key, message)
+            except Exception as e:
+                print(f"      -> Analyse du message {index} interrompue : {e}")
+                analysis = None
+            finally:
+                # Un résultat par message, quoi qu'il arrive : le générateur ne reste jamais bloqué.
+                results.put((index, analysis))
+
+    # Threads démons : un pipeline abandonné ne retient pas la fin du programme.
+    threads = [threading.Thread(target=inference_worker, name="email-inference", daemon=True)]
+    threads += [threading.Thread(target=preparer, name="email-prepare", daemon=True)
+                for _ in range(min(config.EMAIL_PIPELINE_WORKERS, len(pending)))]
+    try:
+        for thread in threads:
+            thread.start()
+        for _ in range(len(pending)):
+            try:
+                index, analysis = results.get(timeout=config.EMAIL_PIPELINE_RESULT_TIMEOUT)
+            except queue.Empty:
+                print("Agent E-mail: analyse trop longue, les messages restants seront analysés plus tard.")
+                return
+            if analysis:
+                yield index, analysis
+    finally:
+        stop.set()
+
+def get_email_analysis(max_count=5):
+    """Analyse les derniers e-mails et retourne les analyses, du plus récent au plus ancien."""
+    return [analysis for _, analysis in sorted(iter_email_analysis(max_count), key=lambda item: item[0])]
+
+def _on_new_mail():
+    """Appelé par le thread IDLE : synchronise la boîte et place les nouveaux messages en file d'analyse."""
+    try:
+        new_uids = imap_session.run(lambda mail: imap_sync.sync_mailbox(mail, 'inbox'))
+    except Exception as e:
+        print(f"Agent E-mail: synchronisation après notification impossible : {e}")
+        return
+    if new_uids:
+        print(f"Agent E-mail: {len(new_uids)} nouveau(x) message(s) reçu(s), analyse en arrière-plan.")
+    for message in imap_sync.get_messages('inbox', new_uids):
+        _prefetch_queue.put(message)
+
+def _prefetch_loop():
+    while True:
+        message = _prefetch_queue.get()
+        try:
+            _purge_stale_analyses_once()
+            _analyze_message(get_message_key(message), message)
+        except Exception as e:
+            print(f"Agent E-mail: analyse en arrière-plan impossible : {e}")
+        finally:
+            _prefetch_queue.task_done()
+
+def start_mail_watcher():
+    """
+    Active la surveillance IMAP IDLE (si IMAP_IDLE_ENABLED) : les nouveaux messages sont
+    synchronisés et analysés avant même que l'utilisateur ne le demande.
+    """
+    global _prefetch_worker
+    if not config.IMAP_IDLE_ENABLED or not config.EMAIL_ADDRESS:
+        return
+    if _prefetch_worker is None:
+        _prefetch_worker = threading.Thread(target=_prefetch_loop, name="email-prefetch", daemon=True)
+        _prefetch_worker.start()
+    imap_session.start_idle(_on_new_mail, 'inbox')
@@ -1,78 +1,316 @@
 # agents/task_agent.py
 
+import heapq
+import itertools
 import sqlite3
-import os
 from datetime import datetime
 import config
+from services.database import get_connection, migrate, fts_query, FTS_TOKENIZE
+from services import embedding_store, user_profile
 
+# Schéma versionné (PRAGMA user_version) : chaque migration ne s'applique qu'une fois et
+# conserve les données. La version 1 reprend la table créée par les anciennes versions.
+MIGRATIONS = [
+    (1, [
+        '''
+        CREATE TABLE IF NOT EXISTS tasks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            description TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'à faire', -- 'à faire', 'en cours', 'terminé'
+            priority INTEGER DEFAULT 3, -- 1=Haute, 2=Moyenne, 3=Basse
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            due_date DATETIME, -- Date limite pour la tâche (optionnel)
+            source TEXT DEFAULT 'manuel' -- D'où vient la tâche ? 'manuel', 'email_agent', etc.
+        )
+        ''',
+    ]),
+    (2, [
+        # Filtre par statut puis tri par priorité et échéance : servis directement par l'index.
+        "CREATE INDEX IF NOT EXISTS idx_tasks_status_priority_due ON tasks (status, priority, due_date)",
+        # Liste complète (sans filtre), triée de la même façon.
+        "CREATE INDEX IF NOT EXISTS idx_tasks_priority_due ON tasks (priority, due_date)",
+    ]),
+    (3, [
+        # Recherche plein texte sur les descriptions, maintenue par triggers.
+        f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS tasks_fts USING fts5(
+            description, content='tasks', content_rowid='id',
+            tokenize='{FTS_TOKENIZE}', prefix='2 3'
+        )
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS tasks_fts_insert AFTER INSERT ON tasks BEGIN
+            INSERT INTO tasks_fts (rowid, description) VALUES (new.id, new.description);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS tasks_fts_delete AFTER DELETE ON tasks BEGIN
+            INSERT INTO tasks_fts (tasks_fts, rowid, description) VALUES ('delete', old.id, old.description);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS tasks_fts_update AFTER UPDATE OF description ON tasks BEGIN
+            INSERT INTO tasks_fts (tasks_fts, rowid, description) VALUES ('delete', old.id, old.description);
+            INSERT INTO tasks_fts (rowid, description) VALUES (new.id, new.description);
+        END
+        """,
+        "INSERT INTO tasks_fts (tasks_fts) VALUES ('rebuild')",
+    ]),
+]
 
 
 def setup_database():
-    with sqlite3.connect(config.DB_PATH) as conn:
-        
-        
-        """
-        Initialise la base de données et la table 'tasks' avec une structure de données enrichie.
-        Cette fonction remplace l'ancienne 'initialize_database'.
-        """
-        conn = sqlite3.connect(config.DB_PATH)
-        c = conn.cursor()
-        c.execute('DROP TABLE IF EXISTS tasks')
-        c.execute('''
-            CREATE TABLE tasks (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                description TEXT NOT NULL,
-                status TEXT NOT NULL DEFAULT 'à faire', -- 'à faire', 'en cours', 'terminé'
-                priority INTEGER DEFAULT 3, -- 1=Haute, 2=Moyenne, 3=Basse
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                due_date DATETIME, -- Date limite pour la tâche (optionnel)
-                source TEXT DEFAULT 'manuel' -- D'où vient la tâche ? 'manuel', 'email_agent', etc.
-            )
-        ''')
-        conn.commit()
-        conn.close()
-        print("[Task Agent] Base de données initialisée avec la nouvelle structure.")
+    """
+    Initialise la base de données et la table 'tasks', ou la met à jour vers le dernier schéma.
+    Les tâches existantes sont conservées.
+    """
+    version = migrate(get_connection(config.DB_PATH), MIGRATIONS)
+    print(f"[Task Agent] Base de données prête (schéma v{version}).")
 
 def add_task(description, priority=3, due_date=None, source='manuel'):
     """
     Ajoute une nouvelle tâche avec des détails enrichis.
     """
-    conn = sqlite3.connect(config.DB_PATH)
-    c = conn.cursor()
-    c.execute(
-        "INSERT INTO tasks (description, priority, due_date, source) VALUES (?, ?, ?, ?)",
-        (description, priority, due_date, source)
-    )
-    conn.commit()
-    conn.close()
+    conn = get_connection(config.DB_PATH)
+    with conn:
+        conn.execute(
+            "INSERT INTO tasks (description, priority, due_date, source) VALUES (?, ?, ?, ?)",
+            (description, priority, due_date, source)
+        )
+    embedding_store.notify_changed("task")
     print(f"[Task Agent] Tâche ajoutée : '{description}' (Priorité: {priority})")
 
-def get_tasks(status_filter=None):
+def get_tasks(status_filter=None, limit=None):
     """
-    Récupère une liste de tâches, avec un filtre optionnel par statut.
+    Récupère une liste de tâches, avec un filtre optionnel par statut (ou liste de statuts).
     Retourne une liste de dictionnaires pour une utilisation facile.
     """
-    conn = sqlite3.connect(config.DB_PATH)
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
-
     query = "SELECT * FROM tasks"
     params = []
     if status_filter:
         if isinstance(status_filter, list):
-            placeholders = ','.join('?' for status in status_filter)
-            query += f" WHERE status IN ({placeholders})"
-            params.extend(status_filter)
-        else:
-            query += " WHERE status = ?"
-            params.append(status_filter)
+            # Une requête par statut, chacune servie dans l'ordre par l'index
+            # (status, priority, due_date), puis fusion : pas de tri global sur la table.
+            if len(status_filter) > 1:
+                return _merge_sorted(
+                    [get_tasks(status, limit) for status in status_filter], limit
+                )
+            status_filter = status_filter[0]
+        query += " WHERE status = ?"
+        params.append(status_filter)
     
     query += " ORDER BY priority ASC, due_date ASC"
+    if limit:
+        query += " LIMIT ?"
+        params.append(limit)
+
+    rows = get_connection(config.DB_PATH).execute(query, params).fetchall()
+    return [dict(row) for row in rows]
+
+def _task_sort_key(task):
+    # SQLite trie les NULL en premier : même ordre ici.
+    return (task['priority'] is not None, task['priority'] or 0,
+            task['due_date'] is not None, task['due_date'] or '')
+
+def _merge_sorted(task_lists, limit=None):
+    merged = heapq.merge(*task_lists, key=_task_sort_key)
+    return list(itertools.islice(merged, limit)) if limit else list(merged)
+
+def search_tasks(keyword, statuses=('à faire', 'en cours'), limit=None):
+    """
+    Recherche plein texte dans les descriptions (préfixes, sans tenir compte des accents),
+    triée par pertinence (bm25) puis par priorité. Retourne une liste de dictionnaires.
+    """
+    query = fts_query(keyword)
+    if query is None:
+        return []
+    placeholders = ','.join('?' for _ in statuses)
+    rows = get_connection(config.DB_PATH).execute(
+        "SELECT tasks.* FROM tasks_fts JOIN tasks ON tasks.id = tasks_fts.rowid "
+        f"WHERE tasks_fts MATCH ? AND tasks.status IN ({placeholders}) "
+        "ORDER BY bm25(tasks_fts), tasks.priority LIMIT ?",
+        (query, *statuses, limit or config.SEARCH_MAX_RESULTS)
+    ).fetchall()
+    return [dict(row) for row in rows]
+
+# --- Opérations groupées : une seule transaction (un seul commit) pour tout le lot ---
+
+VALID_STATUSES = ('à faire', 'en cours', 'terminé')
+# Nombre maximal de paramètres par requête SQLite (IN (...)).
+_SQL_VARIABLES_LIMIT = 900
+
+def _existing_ids(conn, task_ids):
+    existing = set()
+    for start in range(0, len(task_ids), _SQL_VARIABLES_LIMIT):
+        chunk = task_ids[start:start + _SQL_VARIABLES_LIMIT]
+        placeholders = ','.join('?' for _ in chunk)
+        existing.update(row[0] for row in conn.execute(f"SELECT id FROM tasks WHERE id IN ({placeholders})", chunk))
+    return existing
+
+def add_tasks(tasks):
+    """
+    Ajoute plusieurs tâches en une seule transaction.
+    `tasks` : itérable de dictionnaires (description, priority, due_date, source).
+    Retourne un résultat par tâche : {"description", "ok", "id"} ou {"description", "ok": False, "error"}.
+    """
+    results, rows = [], []
+    for task in tasks:
+        description = (task.get('description') or '').strip()
+        priority = task.get('priority', 3)
+        if not description:
+            results.append({"description": description, "ok": False, "error": "description vide"})
+        elif priority not in (1, 2, 3):
+            results.append({"description": description, "ok": False, "error": f"priorité invalide : {priority}"})
+        else:
+            result = {"description": description, "ok": True}
+            results.append(result)
+            rows.append((result, (description, priority, task.get('due_date'), task.get('source', 'manuel'))))
+
+    if rows:
+        conn = get_connection(config.DB_PATH)
+        try:
+            with conn:
+                # Identifiant renvoyé par chaque insertion (RETURNING), sans supposer qu'ils se suivent.
+                ids = [conn.execute(
+                    "INSERT INTO tasks (description, priority, due_date, source) VALUES (?, ?, ?, ?) RETURNING id",
+                    values
+                ).fetchall()[0][0] for _, values in rows]
+        except sqlite3.Error as e:
+            for result, _ in rows:
+                result.update(ok=False, error=str(e))
+        else:
+            for (result, _), task_id in zip(rows, ids):
+                result["id"] = task_id
+
+    added = sum(1 for result in results if result["ok"])
+    if added:
+        embedding_store.notify_changed("task")
+    print(f"[Task Agent] {added} tâche(s) ajoutée(s) sur {len(results)}.")
+    return results
+
+def update_tasks_status(updates):
+    """
+    Met à jour le statut de plusieurs tâches en une seule transaction.
+    `updates` : itérable de (task_id, nouveau_statut). Retourne un résultat par élément.
+    """
+    updates = list(updates)
+    results = [{"id": task_id, "status": status, "ok": status in VALID_STATUSES} for task_id, status in updates]
+    for result in results:
+        if not result["ok"]:
+            result["error"] = f"statut non valide : {result['status']}"
+
+    conn = get_connection(config.DB_PATH)
+    try:
+        with conn:
+            # Verrou d'écriture pris avant la vérification : une tâche ne peut pas disparaître entre les deux.
+            conn.execute("BEGIN IMMEDIATE")
+            existing = _existing_ids(conn, [result["id"] for result in results if result["ok"]])
+            for result in results:
+                if result["ok"] and result["id"] not in existing:
+                    result.update(ok=False, error="tâche introuvable")
+            conn.executemany(
+                "UPDATE tasks SET status = ? WHERE id = ?",
+                [(result["status"], result["id"]) for result in results if result["ok"]]
+            )
+    except sqlite3.Error as e:
+        for result in results:
+            if result["ok"]:
+                result.update(ok=False, error=str(e))
+
+    updated = sum(1 for result in results if result["ok"])
+    if updated:
+        embedding_store.notify_changed("task")
+        completed = [result["id"] for result in results if result["ok"] and result["status"] == 'terminé']
+        if completed:
+            user_profile.record_completed_tasks(get_tasks_by_ids(completed, statuses=('terminé',)))
+    print(f"[Task Agent] {updated} tâche(s) mise(s) à jour sur {len(results)}.")
+    return results
+
+def delete_tasks(task_ids):
+    """Supprime plusieurs tâches en une seule transaction. Retourne un résultat par identifiant."""
+    task_ids = list(task_ids)
+    results = [{"id": task_id, "ok": True} for task_id in task_ids]
+    conn = get_connection(config.DB_PATH)
+    try:
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            existing = _existing_ids(conn, task_ids)
+            for result in results:
+                if result["id"] not in existing:
+                    result.update(ok=False, error="tâche introuvable")
+            conn.executemany("DELETE FROM tasks WHERE id = ?", [(task_id,) for task_id in existing])
+    except sqlite3.Error as e:
+        for result in results:
+            result.update(ok=False, error=str(e))
+
+    deleted = sum(1 for result in results if result["ok"])
+    if deleted:
+        embedding_store.notify_changed("task")
+    print(f"[Task Agent] {deleted} tâche(s) supprimée(s) sur {len(results)}.")
+    return results
+
+def update_status_where(new_status, source=None, current_status=None, older_than_days=None, due_before=None):
+    """
+    Met à jour en une requête toutes les tâches correspondant aux filtres, par exemple
+    update_status_where('terminé', source='email_agent', older_than_days=7).
+    Retourne le nombre de tâches modifiées.
+    """
+    if new_status not in VALID_STATUSES:
+        print(f"[Task Agent] Erreur : Statut '{new_status}' non valide.")
+        return 0
+
+    conditions, params = ["status <> ?"], [new_status]
+    if source is not None:
+        conditions.append("source = ?")
+        params.append(source)
+    if current_status is not None:
+        conditions.append("status = ?")
+        params.append(current_status)
+    if older_than_days is not None:
+        conditions.append("created_at < datetime('now', ?)")
+        params.append(f"-{int(older_than_days)} days")
+    if due_before is not None:
+        conditions.append("due_date < ?")
+        params.append(due_before)
+
+    conn = get_connection(config.DB_PATH)
+    try:
+        with conn:
+            updated = [row[0] for row in conn.execute(
+                f"UPDATE tasks SET status = ? WHERE {' AND '.join(conditions)} RETURNING id", [new_status, *params]
+            ).fetchall()]
+    except sqlite3.Error as e:
+        print(f"[Task Agent] Erreur lors de la mise à jour groupée des tâches : {e}")
+        return 0
+    if updated:
+        embedding_store.notify_changed("task")
+        if new_status == 'terminé':
+            for start in range(0, len(updated), _SQL_VARIABLES_LIMIT):
+                user_profile.record_completed_tasks(
+                    get_tasks_by_ids(updated[start:start + _SQL_VARIABLES_LIMIT], statuses=('terminé',)))
+    print(f"[Task Agent] {len(updated)} tâche(s) passée(s) au statut '{new_status}'.")
+    return len(updated)
+
+def get_tasks_by_ids(task_ids, statuses=('à faire', 'en cours')):
+    """Tâches dont l'identifiant est dans `task_ids` (et le statut dans `statuses`), dans l'ordre demandé."""
+    task_ids = list(task_ids)[:_SQL_VARIABLES_LIMIT]
+    if not task_ids:
+        return []
+    placeholders = ','.join('?' for _ in task_ids)
+    status_placeholders = ','.join('?' for _ in statuses)
+    rows = get_connection(config.DB_PATH).execute(
+        f"SELECT * FROM tasks WHERE id IN ({placeholders}) AND status IN ({status_placeholders})",
+        (*task_ids, *statuses)
+    ).fetchall()
+    by_id = {row['id']: dict(row) for row in rows}
+    return [by_id[task_id] for task_id in task_ids if task_id in by_id]
+
+def _embedding_texts():
+    """Tâches ouvertes à indexer pour la recherche sémantique (les plus prioritaires d'abord)."""
+    tasks = get_tasks(status_filter=['à faire', 'en cours'], limit=config.EMBEDDING_MAX_ITEMS_PER_SOURCE)
+    return {str(task['id']): task['description'] for task in tasks}
 
-    c.execute(query, params)
-    tasks = [dict(row) for row in c.fetchall()]
-    conn.close()
-    return tasks
+embedding_store.register_source("task", _embedding_texts)
 
 def display_tasks(tasks):
     """Affiche joliment une liste de tâches."""
@@ -103,27 +341,27 @@ def update_task_status(task_id, new_status):
         print(f"[Task Agent] Erreur : Statut '{new_status}' non valide.")
         return
 
-    conn = sqlite3.connect(config.DB_PATH)
-    c = conn.cursor()
-    c.execute("UPDATE tasks SET status = ? WHERE id = ?", (new_status, task_id))
-    conn.commit()
+    conn = get_connection(config.DB_PATH)
+    with conn:
+        c = conn.execute("UPDATE tasks SET status = ? WHERE id = ?", (new_status, task_id))
     if c.rowcount > 0:
+        embedding_store.notify_changed("task")
+        if new_status == 'terminé':
+            user_profile.record_completed_tasks(get_tasks_by_ids([task_id], statuses=('terminé',)))
         print(f"[Task Agent] Le statut de la tâche {task_id} est maintenant '{new_status}'.")
     else:
         print(f"[Task Agent] Aucune tâche trouvée avec l'ID {task_id}.")
-    conn.close()
 
 def delete_task(task_id):
     """Supprime une tâche en utilisant son ID unique."""
-    conn = sqlite3.connect(config.DB_PATH)
-    c = conn.cursor()
-    c.execute("DELETE FROM tasks WHERE id = ?", (task_id,))
-    conn.commit()
+    conn = get_connection(config.DB_PATH)
+    with conn:
+        c = conn.execute("DELETE FROM tasks WHERE id = ?", (task_id,))
     if c.rowcount > 0:
+        embedding_store.notify_changed("task")
         print(f"[Task Agent] La tâche {task_id} a été supprimée.")
     else:
         print(f"[Task Agent] Aucune tâche trouvée avec l'ID {task_id}.")
-    conn.close()
 
 
 if __name__ == '__main__':
@@ -11,12 +11,123 @@ load_dotenv(dotenv_path=dotenv_path)
 EMAIL_ADDRESS = os.getenv("EMAIL_ADDRESS")
 EMAIL_PASSWORD = os.getenv("EMAIL_PASSWORD")
 
+# Synchronisation IMAP incrémentale (UIDVALIDITY + dernier UID vu)
+IMAP_HOST = os.getenv("IMAP_HOST", 'imap.gmail.com')
+IMAP_PORT = int(os.getenv("IMAP_PORT", "993"))
+IMAP_USE_SSL = os.getenv("IMAP_USE_SSL", "1") != "0"
+# Session persistante : NOOP de contrôle si la connexion est inutilisée depuis plus de N secondes.
+IMAP_NOOP_INTERVAL = 300
+# IMAP IDLE : préchargement et analyse des nouveaux messages dès leur arrivée.
+IMAP_IDLE_ENABLED = False
+IMAP_IDLE_TIMEOUT = 25 * 60
+IMAP_SYNC_UNSEEN_ONLY = False
+IMAP_INITIAL_SYNC_COUNT = 20
+IMAP_FETCH_BATCH_SIZE = 50
+IMAP_LOCAL_CACHE_SIZE = 200
+# Lecture partielle : seuls les N premiers octets du corps texte sont téléchargés,
+# les pièces jointes PDF le sont à la demande (et ignorées au-delà de cette taille).
+EMAIL_BODY_MAX_BYTES = 32768
+EMAIL_MAX_ATTACHMENT_BYTES = 15 * 1024 * 1024
+# Pipeline d'analyse : préparation parallèle (PDF, scan de sécurité), inférence sur un seul thread.
+EMAIL_PIPELINE_WORKERS = 4
+EMAIL_PIPELINE_QUEUE_SIZE = 2
+# Attente maximale (secondes) d'une analyse du pipeline avant d'abandonner les messages restants.
+EMAIL_PIPELINE_RESULT_TIMEOUT = 300
+# Scan différé : l'e-mail est d'abord analysé sans ses pièces jointes, l'analyse est complétée
+# en arrière-plan une fois les PDF jugés sûrs par VirusTotal.
+DEFERRED_SECURITY_SCAN = True
+# Extraction du texte des PDF : budget de pages et de caractères.
+PDF_MAX_PAGES = 30
+PDF_MAX_CHARS = 40000
+PDF_CACHE_MAX_ENTRIES = 500
+
 MODEL_PATH = os.path.join(PROJECT_ROOT, 'model', 'mistral-7b-instruct-v0.2.Q4_K_M.gguf')
 N_CTX = 4096
+# Longueur maximale (en tokens) de chaque résumé partiel produit par services/summarizer.py.
+SUMMARY_MAX_TOKENS = 300
+# Assemblage des prompts (services/prompt_builder.py) : marge de sécurité sous N_CTX
+# et longueur de réponse réservée pour les recommandations.
+PROMPT_SAFETY_MARGIN = 32
+RECOMMENDATION_MAX_TOKENS = 500
+
+# Mémoire de conversation (services/conversation_memory.py) : tokens réservés aux derniers
+# échanges dans les prompts, plafond par échange et longueur du résumé des échanges plus anciens.
+CONVERSATION_WINDOW_TOKENS = 600
+CONVERSATION_TURN_MAX_TOKENS = 200
+CONVERSATION_SUMMARY_MAX_TOKENS = 200
+
+# Profil de l'utilisateur (services/user_profile.py) : taille fixe du condensé injecté dans les
+# prompts, nombre de valeurs conservées par catégorie et nombre de faits maintenus par le LLM.
+PROFILE_DIGEST_MAX_TOKENS = 160
+PROFILE_MAX_KEYS_PER_CATEGORY = 200
+PROFILE_MAX_FACTS = 8
+# Durée (en jours) pendant laquelle un élément déjà compté (e-mail, tâche, événement) est mémorisé.
+PROFILE_OBSERVATIONS_MAX_AGE_DAYS = 180
+
+# Réutilisation de l'état du modèle après les préfixes de prompt statiques (instructions + exemples).
+PREFIX_CACHE_MAX_ENTRIES = 3
+PREFIX_CACHE_ON_DISK = False
+PREFIX_CACHE_DIR = os.path.join(PROJECT_ROOT, 'data', 'prefix_cache')
+
+# Copie locale des agendas : intervalle de synchronisation incrémentale (syncToken), en secondes.
+CALENDAR_REFRESH_INTERVAL = 300
+
+# Contexte des recommandations (agents/context_snapshot.py) : e-mails analysés, événements et tâches
+# ouvertes rafraîchis en arrière-plan toutes les CONTEXT_SNAPSHOT_INTERVAL secondes.
+CONTEXT_SNAPSHOT_INTERVAL = 180
+CONTEXT_SNAPSHOT_EMAIL_COUNT = 5
 
 CREDENTIALS_PATH = os.path.join(PROJECT_ROOT, 'config', 'credentials.json')
 TOKEN_PATH = os.path.join(PROJECT_ROOT, 'token.json')
 
 DB_PATH = os.path.join(PROJECT_ROOT, 'tasks.db')
+MEMORY_DB_PATH = os.path.join(PROJECT_ROOT, 'data', 'memory.db')
+# Nombre de requêtes préparées conservées par connexion SQLite (services/database.py).
+SQLITE_CACHED_STATEMENTS = 256
+# Nombre maximal de tâches affichées par une commande de listing (les plus prioritaires).
+TASK_LIST_LIMIT = 100
+# Nombre maximal de résultats proposés par une recherche plein texte (tâches, événements).
+SEARCH_MAX_RESULTS = 8
+
+# Index sémantique (services/embedding_store.py) : vecteurs float16 + table des identifiants.
+EMBEDDING_ENABLED = True
+EMBEDDING_INDEX_DIR = os.path.join(PROJECT_ROOT, 'data', 'embeddings')
+# Modèle GGUF utilisé en mode embedding (par défaut le même fichier que le modèle de génération).
+EMBEDDING_MODEL_PATH = os.getenv("EMBEDDING_MODEL_PATH", MODEL_PATH)
+EMBEDDING_N_CTX = 512
+# 0 : embeddings calculés sur CPU (les poids du fichier, mappés en mémoire, sont partagés).
+EMBEDDING_GPU_LAYERS = 0
+EMBEDDING_BATCH_SIZE = 16
+# Nombre maximal d'éléments indexés par source (tâches ouvertes, e-mails analysés, événements à venir).
+EMBEDDING_MAX_ITEMS_PER_SOURCE = 5000
+# Similarité cosinus minimale pour qu'un résultat sémantique soit proposé.
+EMBEDDING_MIN_SCORE = 0.35
+# Au-delà de ce score, un résultat sémantique unique est retenu sans demander confirmation.
+EMBEDDING_AUTO_SELECT_SCORE = 0.75
+# Délai de regroupement des mises à jour de l'index après une modification (secondes).
+EMBEDDING_REFRESH_DELAY = 2.0
+# Nombre d'éléments pertinents injectés dans les prompts de recommandation.
+RECOMMENDATION_RETRIEVED_ITEMS = 8
+# Attente maximale (secondes) du modèle d'embedding pour ces recommandations ; au-delà, les tâches
+# les plus prioritaires sont utilisées.
+RECOMMENDATION_EMBEDDING_TIMEOUT = 0.05
+
+# Routeur d'intentions : en dessous de ce niveau de confiance, la demande est confiée au LLM.
+INTENT_ROUTER_MIN_CONFIDENCE = 0.8
+# Cache des intentions calculées par le LLM (expire chaque jour à minuit).
+INTENT_CACHE_SIZE = 256
+INTENT_CACHE_PERSIST = True
 
-VIRUSTOTAL_API_KEY = os.getenv("VIRUSTOTAL_API_KEY")
\ No newline at end of file
+VIRUSTOTAL_API_KEY = os.getenv("VIRUSTOTAL_API_KEY")
+VIRUSTOTAL_API_URL = os.getenv("VIRUSTOTAL_API_URL", "https://www.virustotal.com/api/v3")
+# Quota de l'API publique : 4 requêtes par minute.
+VIRUSTOTAL_REQUESTS_PER_MINUTE = 4
+VIRUSTOTAL_MAX_RETRIES = 3
+VIRUSTOTAL_BACKOFF_SECONDS = 15
+VIRUSTOTAL_POLL_INTERVAL = 10
+VIRUSTOTAL_MAX_POLLS = 12
+VIRUSTOTAL_MAX_CONCURRENT_SCANS = 4
+# Attente maximale d'un verdict par un appel bloquant (quota, envoi et interrogations compris).
+VIRUSTOTAL_SCAN_TIMEOUT = 300
+# Durée de validité d'un verdict en cache (7 jours).
+VIRUSTOTAL_CACHE_TTL = 7 * 24 * 3600
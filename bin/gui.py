@@ -5,6 +5,7 @@ from PIL import Image
 from enum import Enum
 import threading  # <--- On importe le module de threading
 import manager
+from services.mistral_service import warm_up_model, mark_startup_complete
 
 
 class ColorMode(Enum):
@@ -23,6 +24,19 @@ class AssistantApp(customtkinter.CTk):
         self.setup_home_view()
         # NOUVEAU : Initialiser la base de données au lancement de la GUI
         manager.task_agent.setup_database()
+        # Pas de console : les choix entre plusieurs éléments passent par une boîte de dialogue.
+        manager.set_choice_prompt(self.ask_choice)
+        # Le modèle se charge en arrière-plan : la fenêtre s'affiche sans attendre
+        warm_up_model()
+        manager.email_agent.start_mail_watcher()
+        manager.agenda_agent.start_calendar_refresher()
+        manager.embedding_store.refresh_in_background()
+        manager.context_snapshot.start_context_snapshot()
+        self.after(0, self.report_startup_time)
+
+    def report_startup_time(self):
+        """Appelé à la première itération de la boucle Tk, quand la fenêtre est affichée."""
+        print(f"Interface prête en {mark_startup_complete():.2f} s (chargement du modèle en arrière-plan).")
 
     def load_assets(self):
         """Charge toutes les images et polices nécessaires."""
@@ -103,15 +117,49 @@ class AssistantApp(customtkinter.CTk):
         NOUVELLE FONCTION : Appelle le manager dans un thread séparé
         pour ne pas geler la GUI.
         """
-        response = manager.process_user_query(user_input)
+        # Chaque morceau de texte généré est transmis à la GUI dès son arrivée
+        def on_token(chunk):
+            self.after(0, self.update_chat_with_response, chunk, True)
+
+        response = manager.process_user_query(user_input, on_token=on_token)
         # Une fois la réponse obtenue, on demande à la GUI de se mettre à jour
         # .after(0, ...) est une façon sûre de communiquer avec le thread principal de la GUI
         self.after(0, self.update_chat_with_response, response)
 
-    def update_chat_with_response(self, response):
+    def ask_choice(self, options, count):
+        """
+        Appelé depuis le thread de réponse : ouvre la boîte de dialogue sur le thread de la GUI
+        et attend le numéro saisi (0 = annuler).
+        """
+        answer = {}
+        done = threading.Event()
+
+        def show_dialog():
+            try:
+                dialog = customtkinter.CTkInputDialog(
+                    title="Choix", text=f"{options}\n\nEntrez le numéro de votre choix (0 pour annuler) :")
+                answer["value"] = dialog.get_input()
+            finally:
+                done.set()
+
+        self.after(0, show_dialog)
+        done.wait()
+        try:
+            choice = int((answer.get("value") or "0").strip())
+        except ValueError:
+            return 0
+        return choice if 0 <= choice <= count else 0
+
+    def update_chat_with_response(self, response, append=False):
         """
         NOUVELLE FONCTION : Met à jour la GUI avec la réponse de l'assistant.
+        Avec append=True, `response` est un morceau de réponse ajouté au message en cours.
         """
+        if append:
+            self.streamed_response += response
+            response = self.streamed_response
+        elif response is None and self.streamed_response:
+            response = self.streamed_response
         # On supprime l'indicateur "..." en modifiant le dernier message
         self.last_assistant_message.configure(text=response)
         # On force la mise à jour pour que le scroll fonctionne bien
@@ -173,6 +221,7 @@ class AssistantApp(customtkinter.CTk):
                                            font=self.font_regular)
             label.pack(anchor="w", padx=10, pady=5, ipadx=8, ipady=5)
             self.last_assistant_message = label
+            self.streamed_response = ""
 
         self.after(100, self.chat_frame._parent_canvas.yview_moveto, 1.0)
 
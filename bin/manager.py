@@ -1,16 +1,43 @@
 # manager.py
 
 import config
-from agents import email_agent, agenda_agent, task_agent
+from agents import email_agent, agenda_agent, task_agent, context_snapshot
+import time
 from datetime import datetime, timedelta
-from services.mistral_service import get_json_from_mistral, call_mistral
-
-
-internal_memory = []
-
-def clear_internal_memory():
-    global internal_memory
-    internal_memory = []
+from services.mistral_service import get_json_from_mistral, call_mistral, stream_mistral, warm_up_model, mark_startup_complete, is_model_ready
+from services.intent_router import route_intent, fold
+from services.intent_cache import get_cached_intent, store_intent, get_cache_stats
+from services.prompt_builder import PromptBuilder
+from services import conversation_memory, embedding_store, user_profile
+
+
+INTENT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "intent": {"type": "string", "enum": [
+            "get_emails", "get_agenda", "add_event", "delete_event",
+            "add_task", "get_tasks", "update_task_status", "delete_task",
+            "get_general_recommendation", "get_urgent_recommendation", "unknown",
+        ]},
+        "summary": {"type": "string", "maxLength": 120},
+        "date": {"type": "string", "format": "date"},
+        "priority": {"enum": [1, 2, 3]},
+        "status": {"enum": ["à faire", "en cours", "terminé"]},
+    },
+    "required": ["intent"],
+}
+
+intent_path_stats = {"router": 0, "cache": 0, "llm": 0}
+
+# Section de la photographie du contexte (agents/context_snapshot.py) modifiée par chaque commande.
+SNAPSHOT_SECTIONS_BY_INTENT = {
+    "add_task": "tasks", "update_task_status": "tasks", "delete_task": "tasks",
+    "add_event": "events", "delete_event": "events", "get_emails": "emails",
+}
+
+# Requêtes de recherche sémantique utilisées quand la recommandation n'est pas liée à une demande précise.
+GENERAL_RECOMMENDATION_QUERY = "prochaines actions importantes : échéances, réponses à envoyer, préparation des rendez-vous"
+URGENT_RECOMMENDATION_QUERY = "à faire aujourd'hui en urgence : échéance immédiate, relance, problème bloquant"
 
 def format_tasks_as_string(tasks):
     if not tasks:
@@ -62,8 +89,44 @@ def format_emails_as_string(analyzed_emails):
     return response.strip()
 
 def parse_user_intent(user_query):
-    today_date = datetime.now().strftime("%Y-%m-%d")
-    prompt = f"""
+    """
+    Détermine l'intention de l'utilisateur. Les commandes courantes sont résolues par le
+    routeur à règles ; le LLM n'est appelé que si la confiance du routeur est trop faible.
+    """
+    start = time.perf_counter()
+    parsed, confidence = route_intent(user_query)
+    if parsed and confidence >= config.INTENT_ROUTER_MIN_CONFIDENCE:
+        intent_path_stats["router"] += 1
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        print(f"Manager: intention '{parsed['intent']}' résolue par le routeur rapide "
+              f"(confiance {confidence:.2f}, {elapsed_ms:.2f} ms).")
+        return parsed
+
+    cached = get_cached_intent(user_query)
+    if cached:
+        intent_path_stats["cache"] += 1
+        cache_stats = get_cache_stats()
+        print(f"Manager: intention '{cached.get('intent')}' trouvée dans le cache "
+              f"({cache_stats['hits']} succès / {cache_stats['misses']} échecs, "
+              f"{cache_stats['llm_seconds_saved']:.1f} s de LLM économisées).")
+        return cached
+
+    intent_path_stats["llm"] += 1
+    parsed = _parse_user_intent_with_llm(user_query)
+    elapsed = time.perf_counter() - start
+    if parsed:
+        store_intent(user_query, parsed, elapsed)
+    parsed = parsed or {"intent": "unknown"}
+    print(f"Manager: intention '{parsed.get('intent')}' résolue par le LLM "
+          f"(confiance du routeur {confidence:.2f}, {elapsed * 1000:.0f} ms).")
+    return parsed
+
+def _intent_prompt_prefix(today):
+    """
+    Partie statique du prompt d'analyse d'intention (instructions + exemples).
+    Elle ne change qu'avec la date : l'état du modèle après ce préfixe est réutilisé.
+    """
+    return f"""
 [INST]
 Tu es un expert en traitement du langage. Ta mission est de décomposer la demande de l'utilisateur en une intention et des entités précises.
 Réponds UNIQUEMENT avec un objet JSON.
@@ -82,27 +145,65 @@ Réponds UNIQUEMENT avec un objet JSON.
 ### EXEMPLES ###
 Demande: "analyse mes emails" -> {{"intent": "get_emails"}}
 Demande: "montre-moi mon agenda" -> {{"intent": "get_agenda"}}
-Demande: "ajoute 'Rdv docteur' le 25 décembre" -> {{"intent": "add_event", "summary": "Rdv docteur", "date": "{datetime.now().year}-12-25"}}
+Demande: "ajoute 'Rdv docteur' le 25 décembre" -> {{"intent": "add_event", "summary": "Rdv docteur", "date": "{today.year}-12-25"}}
 Demande: "supprime l'événement 'réunion projet'" -> {{"intent": "delete_event", "summary": "réunion projet"}}
-Demande: "ajoute la tâche urgente 'Finir le rapport' pour demain" -> {{"intent": "add_task", "summary": "Finir le rapport", "priority": 1, "date": "{(datetime.now() + timedelta(days=1)).strftime('%Y-%m-%d')}"}}
+Demande: "ajoute la tâche urgente 'Finir le rapport' pour demain" -> {{"intent": "add_task", "summary": "Finir le rapport", "priority": 1, "date": "{(today + timedelta(days=1)).strftime('%Y-%m-%d')}"}}
 Demande: "montre-moi les tâches terminées" -> {{"intent": "get_tasks", "status": "terminé"}}
 Demande: "passe la tâche 'répondre à l'email' au statut en cours" -> {{"intent": "update_task_status", "summary": "répondre à l'email", "status": "en cours"}}
 Demande: "donne-moi une recommandation" -> {{"intent": "get_general_recommendation"}}
 Demande: "qu'est ce que j'ai d'urgent à faire aujourd'hui" -> {{"intent": "get_urgent_recommendation"}}
+"""
 
+def _parse_user_intent_with_llm(user_query):
+    now = datetime.now()
+    # Le profil évolue souvent : il suit le préfixe pour ne pas en invalider l'état mis en cache.
+    profile = user_profile.get_digest()
+    profile_section = f"\n### PROFIL DE L'UTILISATEUR ###\n{profile}" if profile else ""
+    prompt = f"""{profile_section}
 ### DEMANDE À ANALYSER ###
-Date actuelle: {today_date}
+Date actuelle: {now.strftime("%Y-%m-%d")}
 Demande: "{user_query}"
 Réponse JSON:
 [/INST]
 """
-    return get_json_from_mistral(prompt) or {"intent": "unknown"}
+    return get_json_from_mistral(prompt, prefix=_intent_prompt_prefix(now), schema=INTENT_SCHEMA)
 
-def process_user_query(user_query: str) -> str:
+def generate_response(prompt, on_token=None, max_token=500):
+    """
+    Appelle le LLM. Si `on_token` est fourni, la réponse est diffusée morceau par morceau
+    à ce callback au fil de la génération ; le texte complet est retourné dans tous les cas.
+    """
+    if on_token is None:
+        return call_mistral(prompt, max_token=max_token)
+    chunks = []
+    for chunk in stream_mistral(prompt, max_token=max_token):
+        chunks.append(chunk)
+        on_token(chunk)
+    return "".join(chunks).strip()
+
+def process_user_query(user_query: str, on_token=None) -> str:
     """
     Prend une requête utilisateur, la traite et retourne une réponse textuelle.
+    on_token : callback optionnel recevant la réponse du LLM en flux (console, GUI).
+    L'échange est enregistré dans la mémoire de conversation (services/conversation_memory.py).
     """
     parsed_command = parse_user_intent(user_query)
+    response = _execute_command(parsed_command, user_query, on_token)
+    changed_section = SNAPSHOT_SECTIONS_BY_INTENT.get(parsed_command.get("intent"))
+    if changed_section == "tasks":
+        context_snapshot.refresh_tasks()
+    elif changed_section:
+        context_snapshot.request_refresh(changed_section)
+    conversation_memory.add_turn("user", user_query)
+    conversation_memory.add_turn("assistant", response or _describe_action(parsed_command))
+    return response
+
+def _describe_action(parsed_command):
+    """Trace d'une commande sans réponse textuelle (ajout de tâche, listing...) pour la mémoire de conversation."""
+    details = ", ".join(f"{key}: {value}" for key, value in parsed_command.items() if key != "intent" and value)
+    return f"(Commande « {parsed_command.get('intent')} » traitée{' — ' + details if details else ''}.)"
+
+def _execute_command(parsed_command, user_query, on_token=None):
     intent = parsed_command.get("intent")
 
     if intent == "add_task":
@@ -120,23 +221,26 @@ def process_user_query(user_query: str) -> str:
         tasks = []
         if status_filter:
             print(f"Manager: Voici la liste de vos tâches '{status_filter}':")
-            tasks = task_agent.get_tasks(status_filter=status_filter)
+            tasks = task_agent.get_tasks(status_filter=status_filter, limit=config.TASK_LIST_LIMIT)
         else:
             print("Manager: Voici la liste de toutes vos tâches non terminées:")
-            tasks = task_agent.get_tasks(status_filter=['à faire', 'en cours'])
+            tasks = task_agent.get_tasks(status_filter=['à faire', 'en cours'], limit=config.TASK_LIST_LIMIT)
         task_agent.display_tasks(tasks)
+        if len(tasks) == config.TASK_LIST_LIMIT:
+            print(f"(Seules les {config.TASK_LIST_LIMIT} tâches les plus prioritaires sont affichées.)")
 
     elif intent == "update_task_status":
         new_status = parsed_command.get("status")
         if not new_status:
             print("Manager: Veuillez préciser le nouveau statut.")
             return
-        print("Manager: Quelle tâche voulez-vous mettre à jour ?")
-        populate_memory_with_tasks()
-        
-        all_tasks = [item for item in internal_memory if item['source'] == 'task']
-        
-        selected_item = handle_item_selection(all_tasks)
+        summary = parsed_command.get("summary")
+        if summary:
+            candidates = find_task_items(summary)
+        else:
+            print("Manager: Quelle tâche voulez-vous mettre à jour ?")
+            candidates = task_items(task_agent.get_tasks(status_filter=['à faire', 'en cours']))
+        selected_item = handle_item_selection(candidates)
 
         if selected_item:
             task_agent.update_task_status(selected_item['id'], new_status)
@@ -146,25 +250,28 @@ def process_user_query(user_query: str) -> str:
         if not summary:
             print("Manager: Veuillez préciser quelle tâche supprimer.")
             return
-        populate_memory_with_tasks()
-        selected_item = handle_item_selection(find_items_in_memory(summary))
+        selected_item = handle_item_selection(find_task_items(summary))
         if selected_item:
             task_agent.delete_task(selected_item['id'])
 
     elif intent == "get_emails":
         print("Manager: Compris. Je demande à l'agent e-mail de faire une analyse.")
-        analyzed_emails = email_agent.get_email_analysis() 
-        
-        if not analyzed_emails:
-            print("Aucun e-mail à analyser ou une erreur est survenue.")
-        else:
-            print("\n--- Analyse des E-mails ---")
-            for i, analysis in enumerate(analyzed_emails):
-                print(f"Email {i+1}:")
-                print(f"  Résumé: {analysis.get('resume', 'N/A')}")
-                print(f"  Importance: {analysis.get('importance', 'N/A')}/5")
-                print(f"  Action suggérée: {analysis.get('action_requise', 'N/A')}")
+        analysis_found = False
+        # Chaque analyse est affichée dès qu'elle est prête, sans attendre les suivantes.
+        for index, analysis in email_agent.iter_email_analysis():
+            if not analysis_found:
+                print("\n--- Analyse des E-mails ---")
+                analysis_found = True
+            print(f"Email {index+1}:")
+            print(f"  Résumé: {analysis.get('resume', 'N/A')}")
+            print(f"  Importance: {analysis.get('importance', 'N/A')}/5")
+            print(f"  Action suggérée: {analysis.get('action_requise', 'N/A')}")
+            if analysis.get('attachments_pending'):
+                print("  (Pièce jointe en attente d'analyse : le résumé sera complété en arrière-plan.)")
+        if analysis_found:
             print("-" * 27)
+        else:
+            print("Aucun e-mail à analyser ou une erreur est survenue.")
 
     elif intent == "get_agenda":
         print("Manager: Compris. Je consulte l'agenda.")
@@ -195,162 +302,245 @@ def process_user_query(user_query: str) -> str:
         if not summary:
             print("Manager: Veuillez préciser le nom de l'événement à supprimer.")
             return
-        populate_memory_with_events()
-        selected_item = handle_item_selection(find_items_in_memory(summary))
+        selected_item = handle_item_selection(find_event_items(summary))
         if selected_item:
-            agenda_agent.delete_event(selected_item['summary']) 
+            agenda_agent.delete_event(selected_item['calendar_id'], selected_item['id'], selected_item['summary'])
 
     elif intent == "get_general_recommendation":
-        print("Fonction de recommandation générale à implémenter.")
-        get_general_recommendation()
+        return get_general_recommendation(on_token=on_token, query=user_query)
 
     elif intent == "get_urgent_recommendation":
-        print("Fonction de recommandation urgente à implémenter.")
-        get_urgent_recommendation()
+        return get_urgent_recommendation(on_token=on_token, query=user_query)
 
     else:
-        prompt = f"[INST]Réponds de manière concise à la question suivante : {user_query}[/INST]"
-        response = call_mistral(prompt)
+        builder = PromptBuilder(max_new_tokens=500)
+        builder.add("instructions", "[INST]Tu es un assistant personnel. Réponds de manière concise à la question "
+                    "de l'utilisateur, en t'appuyant sur la conversation précédente si elle est utile.\n", static=True)
+        conversation_memory.add_to_prompt(builder, priority=1)
+        builder.add("question", f"\n### QUESTION ###\n{user_query}[/INST]")
+        response = generate_response(builder.build(), on_token)
         return response if response else "Désolé, je ne suis pas sûr de comprendre. Pouvez-vous reformuler ?"
 
-def find_items_in_memory(summary_keyword):
-    """Recherche dans la mémoire interne les éléments correspondant à un mot-clé."""
-    return [item for item in internal_memory if summary_keyword.lower() in item['summary'].lower()]
+def task_items(tasks):
+    return [{"id": task['id'], "summary": task['description'], "source": "task"} for task in tasks]
+
+def _narrow_to_exact(items, keyword):
+    """Si un élément porte exactement le nom demandé (casse et accents ignorés), lui seul est proposé."""
+    exact = [item for item in items if fold(item['summary']).strip() == fold(keyword).strip()]
+    return exact or items
+
+def find_task_items(summary_keyword):
+    """
+    Tâches ouvertes correspondant au mot-clé (index plein texte, les plus pertinentes d'abord).
+    Sans résultat, l'index sémantique est consulté (« le truc du dentiste » -> « Rdv docteur »).
+    """
+    tasks = task_agent.search_tasks(summary_keyword)
+    if tasks:
+        return _narrow_to_exact(task_items(tasks), summary_keyword)
+    hits = embedding_store.search(summary_keyword, kinds=("task",))
+    scores = {int(hit['ref']): hit['score'] for hit in hits}
+    tasks = task_agent.get_tasks_by_ids(list(scores))
+    # Résultats approchés : handle_item_selection ne les retient d'office qu'avec un score élevé.
+    return [dict(item, semantic=True, score=scores[item['id']]) for item in task_items(tasks)]
+
+def find_event_items(summary_keyword):
+    """Événements à venir correspondant au mot-clé (plein texte, puis index sémantique à défaut)."""
+    events = agenda_agent.find_events(summary_keyword)
+    if events:
+        items = [{"id": event['id'], "calendar_id": event['calendar_id'], "summary": event['summary'],
+                  "source": "agenda"} for event in events]
+        return _narrow_to_exact(items, summary_keyword)
+    # Référence sémantique : « agenda/identifiant » (l'identifiant d'agenda peut contenir des « / »).
+    items = []
+    for hit in embedding_store.search(summary_keyword, kinds=("event",)):
+        calendar_id, event_id = hit['ref'].rsplit('/', 1)
+        items.append({"id": event_id, "calendar_id": calendar_id, "summary": hit['text'],
+                      "source": "agenda", "semantic": True, "score": hit['score']})
+    return items
+
+def recommendation_query(base_query, user_query=None):
+    """
+    Requête sémantique d'une recommandation : la requête de référence (ce qu'on cherche toujours),
+    complétée par la demande de l'utilisateur quand elle précise un sujet.
+    """
+    return f"{base_query} ; {user_query}" if user_query and user_query.strip() else base_query
+
+def relevant_task_lines(query, open_tasks):
+    """
+    Tâches ouvertes les plus proches de la demande (index sémantique), une ligne par tâche.
+    À défaut (index vide, modèle d'embedding non chargé ou occupé), les premières de `open_tasks`
+    (les plus prioritaires) : la recommandation n'attend jamais l'indexation.
+    """
+    hits = embedding_store.search(query, k=config.RECOMMENDATION_RETRIEVED_ITEMS, kinds=("task",),
+                                  timeout=config.RECOMMENDATION_EMBEDDING_TIMEOUT)
+    tasks = task_agent.get_tasks_by_ids([int(hit['ref']) for hit in hits])
+    if not tasks:
+        tasks = open_tasks[:config.RECOMMENDATION_RETRIEVED_ITEMS]
+    return [f"- {task['description']} (priorité {task['priority']}, échéance {task.get('due_date') or 'N/A'})\n"
+            for task in tasks]
+
+def _console_choice(options, count):
+    """Saisie du choix dans la console : retourne un numéro entre 0 (annuler) et `count`."""
+    while True:
+        try:
+            choice = int(input("Entrez le numéro de votre choix (0 pour annuler) : "))
+            if 0 <= choice <= count:
+                return choice
+            print("Numéro invalide. Veuillez réessayer.")
+        except ValueError:
+            print("Veuillez entrer un numéro.")
+
+# Fonction (options, nombre) -> numéro choisi ; l'interface graphique installe sa boîte de dialogue.
+_choice_prompt = _console_choice
+
+def set_choice_prompt(prompt):
+    """Remplace la saisie console du choix (appelé par l'interface graphique, qui n'a pas de console)."""
+    global _choice_prompt
+    _choice_prompt = prompt
 
 def handle_item_selection(items):
-    """Gère le cas où plusieurs éléments correspondent à la recherche."""
+    """
+    Gère le cas où plusieurs éléments correspondent à la recherche. Un résultat approché (index
+    sémantique) n'est retenu d'office que s'il est le seul au-dessus d'EMBEDDING_AUTO_SELECT_SCORE ;
+    sinon l'utilisateur confirme ou annule.
+    """
     if not items:
         print("Manager: Désolé, je n'ai trouvé aucun élément correspondant.")
         return None
-    if len(items) == 1:
+    semantic = any(item.get('semantic') for item in items)
+    if len(items) == 1 and not semantic:
         return items[0]
-
-    print("Manager: J'ai trouvé plusieurs éléments. Lequel vouliez-vous ?")
+    if semantic:
+        confident = [item for item in items if item.get('score', 0) >= config.EMBEDDING_AUTO_SELECT_SCORE]
+        if len(confident) == 1:
+            print(f"Manager: « {confident[0]['summary']} » retenu (correspondance approchée).")
+            return confident[0]
+
+    if semantic:
+        print("Manager: Aucun élément ne porte exactement ce nom. Voici les plus proches, lequel vouliez-vous ?")
+    else:
+        print("Manager: J'ai trouvé plusieurs éléments. Lequel vouliez-vous ?")
+    lines = []
     for i, item in enumerate(items):
         source_label = "Tâche" if item['source'] == 'task' else "Agenda"
         if item['source'] == 'task':
-             print(f"  {i + 1}. [{source_label}] {item['summary']} (ID: {item['id']})")
+            lines.append(f"  {i + 1}. [{source_label}] {item['summary']} (ID: {item['id']})")
         else:
-             print(f"  {i + 1}. [{source_label}] {item['summary']}")
+            lines.append(f"  {i + 1}. [{source_label}] {item['summary']}")
+    print("\n".join(lines))
 
-    while True:
-        try:
-            choice = int(input("Entrez le numéro de votre choix : "))
-            if 1 <= choice <= len(items):
-                return items[choice - 1]
-            else:
-                print("Numéro invalide. Veuillez réessayer.")
-        except ValueError:
-            print("Veuillez entrer un numéro.")
+    choice = _choice_prompt("\n".join(lines), len(items))
+    if not choice:
+        print("Manager: Action annulée.")
+        return None
+    return items[choice - 1]
 
-def populate_memory_with_tasks():
-    """Charge les tâches ouvertes dans la mémoire interne en utilisant la nouvelle fonction get_tasks."""
-    clear_internal_memory()
-    tasks_a_faire = task_agent.get_tasks(status_filter='à faire')
-    tasks_en_cours = task_agent.get_tasks(status_filter='en cours')
-    
-    for task in tasks_a_faire + tasks_en_cours:
-        internal_memory.append({
-            "id": task['id'],
-            "summary": task['description'],
-            "source": "task"
-        })
-        
-def populate_memory_with_events():
-    """Charge les événements à venir dans la mémoire interne."""
-    clear_internal_memory()
-    events = agenda_agent.get_upcoming_events(max_events=50)
-    for event in events:
-        internal_memory.append({
-            "id": event['id'],
-            "summary": event['summary'],
-            "source": "agenda"
-        })
+def _print_snapshot_age(snapshot):
+    age = context_snapshot.snapshot_age(snapshot, "emails")
+    if age is not None:
+        print(f"Manager: Contexte mis à jour il y a {age:.0f} s (e-mails, agenda et tâches).")
 
-def get_general_recommendation():
+def get_general_recommendation(on_token=None, query=None):
     
     print("Manager: Je consulte mes agents pour vous suggérer sur quoi vous avancer...")
-    raw_emails = email_agent.get_email_analysis()
-    upcoming_events = agenda_agent.get_upcoming_events(max_events=10)
-
-    prompt = """
+    # E-mails, événements et tâches viennent de la photographie tenue à jour en arrière-plan :
+    # seul l'appel final au LLM reste à faire.
+    snapshot = context_snapshot.get_snapshot()
+    _print_snapshot_age(snapshot)
+    raw_emails = snapshot["emails"]
+    upcoming_events = snapshot["events"]["upcoming"]
+
+    # Les sections sont ajustées au contexte du modèle : instructions d'abord, puis les événements,
+    # puis autant d'e-mails (déjà résumés par l'agent e-mail) que la place le permet.
+    builder = PromptBuilder(max_new_tokens=config.RECOMMENDATION_MAX_TOKENS)
+    builder.add("instructions", """
 [INST]
 Tu es un assistant personnel expert. Analyse les informations ci-dessous pour créer un plan d'action priorisé des tâches importantes à venir.
 
 ### E-MAILS NON LUS ###
-"""
-    if raw_emails:
-        for i, mail in enumerate(raw_emails):
-            prompt += f"--- Email {i+1} ---\n"
-            prompt += f"Sujet: {mail['subject']}\n"
-            prompt += f"Corps: {mail['body'][:500]}...\n"
-    else:
-        prompt += "Aucun nouvel e-mail.\n"
-
-    prompt += "\n### ÉVÉNEMENTS À VENIR ###\n"
-    if upcoming_events:
-        for event in upcoming_events:
-            prompt += f"- {event['start']}: {event['summary']}\n"
-    else:
-        prompt += "Aucun événement à venir.\n"
-
-    prompt += """
+""", static=True)
+    builder.add_items("emails", [
+        f"--- Email {i+1} ---\n"
+        f"De: {mail.get('sender', '')}\n"
+        f"Sujet: {mail['subject']}\n"
+        f"Importance: {mail.get('importance', '?')}/5\n"
+        f"Résumé: {mail.get('resume', '')}\n"
+        f"Action suggérée: {mail.get('action_requise', '')}\n"
+        for i, mail in enumerate(raw_emails or [])
+    ], priority=2, item_max_tokens=150, empty_text="Aucun nouvel e-mail.\n")
+    builder.add("titre_evenements", "\n### ÉVÉNEMENTS À VENIR ###\n", static=True)
+    builder.add_items("evenements", [
+        f"- {event['start']}: {event['summary']}\n" for event in upcoming_events or []
+    ], priority=1, item_max_tokens=60, empty_text="Aucun événement à venir.\n")
+    builder.add("titre_taches", "\n### TÂCHES EN COURS LES PLUS PERTINENTES ###\n", static=True)
+    task_lines = relevant_task_lines(recommendation_query(GENERAL_RECOMMENDATION_QUERY, query), snapshot["tasks"])
+    builder.add_items("taches", task_lines, priority=3, item_max_tokens=60, empty_text="Aucune tâche en cours.\n")
+    user_profile.add_to_prompt(builder)
+    conversation_memory.add_to_prompt(builder)
+    builder.add("tache", """
 ---
 TÂCHE FINALE : En te basant sur TOUT ce qui précède, crée une liste de tâches, numérotée et ordonnée de la plus urgente à la moins importante. Ignore les publicités. Sois concis. Commence par "Pour vous avancer, voici vos prochaines actions prioritaires :".
 [/INST]
-"""
+""", static=True)
+    prompt = builder.build()
     
     print("Manager: Je réfléchis à vos priorités (1 seul appel API)...")
-    recommendation = call_mistral(prompt)
     print("\n--- Plan d'Action Recommandé ---")
-    print(recommendation)
+    recommendation = generate_response(prompt, on_token, max_token=config.RECOMMENDATION_MAX_TOKENS)
+    print(recommendation if on_token is None else "")
     print("-" * 33)
+    return recommendation
 
-def get_urgent_recommendation():
+def get_urgent_recommendation(on_token=None, query=None):
 
     print("Manager: Je consulte mes agents pour les urgences du jour...")
-    raw_emails = email_agent.get_email_analysis()
-    upcoming_events = agenda_agent.get_upcoming_events(max_events=10)
+    snapshot = context_snapshot.get_snapshot()
+    _print_snapshot_age(snapshot)
+    raw_emails = snapshot["emails"]
+    today_events = snapshot["events"]["today"]
     today_str = datetime.now().strftime("%Y-%m-%d")
 
-    prompt = f"""
+    builder = PromptBuilder(max_new_tokens=config.RECOMMENDATION_MAX_TOKENS)
+    builder.add("instructions", f"""
 [INST]
 Tu es un assistant personnel expert. Analyse les informations ci-dessous pour identifier les tâches critiques à faire IMPÉRATIVEMENT aujourd'hui ({today_str}).
 
 ### E-MAILS IMPORTANTS NON LUS ###
-"""
+""")
+    urgent_emails = [
+        f"- Sujet: {analysis['subject']}\n  Résumé: {analysis.get('resume', '')}\n"
+        for analysis in raw_emails or []
+        if "alerte" in analysis['subject'].lower() or "urgent" in analysis['subject'].lower()
+    ]
     if raw_emails:
-        email_found = False
-        for analysis in raw_emails:
-            if "alerte" in analysis['subject'].lower() or "urgent" in analysis['subject'].lower():
-                prompt += f"- Sujet: {analysis['subject']}\n"
-                email_found = True
-        if not email_found:
-             prompt += "- Aucun e-mail urgent ne requiert votre attention immédiate.\n"
+        empty_emails = "- Aucun e-mail urgent ne requiert votre attention immédiate.\n"
     else:
-        prompt += "- Aucun e-mail important.\n"
-
-    prompt += f"\n### ÉVÉNEMENTS DU JOUR ({today_str}) ###\n"
-    event_found = False
-    if upcoming_events:
-        for event in upcoming_events:
-            if today_str in event['start']:
-                prompt += f"- {event['start']}: {event['summary']}\n"
-                event_found = True
-    if not event_found:
-        prompt += "- Aucun événement prévu pour aujourd'hui.\n"
-
-    prompt += """
+        empty_emails = "- Aucun e-mail important.\n"
+    builder.add_items("emails", urgent_emails, priority=2, item_max_tokens=120, empty_text=empty_emails)
+
+    builder.add("titre_evenements", f"\n### ÉVÉNEMENTS DU JOUR ({today_str}) ###\n")
+    builder.add_items("evenements", [
+        f"- {event['start']}: {event['summary']}\n" for event in today_events
+    ], priority=1, item_max_tokens=60, empty_text="- Aucun événement prévu pour aujourd'hui.\n")
+    builder.add("titre_taches", "\n### TÂCHES EN COURS LES PLUS PERTINENTES ###\n", static=True)
+    task_lines = relevant_task_lines(recommendation_query(URGENT_RECOMMENDATION_QUERY, query), snapshot["tasks"])
+    builder.add_items("taches", task_lines, priority=3, item_max_tokens=60, empty_text="- Aucune tâche en cours.\n")
+
+    user_profile.add_to_prompt(builder)
+    conversation_memory.add_to_prompt(builder)
+    builder.add("tache", """
 ---
 TÂCHE FINALE : En te basant sur ces informations, liste les actions à faire aujourd'hui. Si rien n'est urgent, dis-le clairement. Commence par "Pour aujourd'hui, voici vos priorités :".
 [/INST]
-"""
+""", static=True)
+    prompt = builder.build()
     
     print("Manager: Je réfléchis à vos priorités (1 seul appel API)...")
-    recommendation = call_mistral(prompt)
     print("\n--- Urgences du jour ---")
-    print(recommendation)
+    recommendation = generate_response(prompt, on_token, max_token=config.RECOMMENDATION_MAX_TOKENS)
+    print(recommendation if on_token is None else "")
     print("-" * 33)
+    return recommendation
 
 
 
@@ -358,6 +548,9 @@ def main_console():
     print("="*50)
     print("🤖 Assistant Manager Opérationnel. Tapez 'quitter' pour arrêter.")
     print("="*50)
+    startup_seconds = mark_startup_complete()
+    model_state = "prêt" if is_model_ready() else "en cours de chargement en arrière-plan"
+    print(f"Démarrage en {startup_seconds:.2f} s (modèle {model_state}).")
 
     while True:
         user_input = input("\n> ")
@@ -365,9 +558,25 @@ def main_console():
             print("Au revoir !")
             break
 
-        response = process_user_query(user_input)
-        print(f"\nAssistant: {response}")
+        streamed = []
+
+        def print_token(chunk):
+            if not streamed:
+                print("\nAssistant: ", end="")
+            streamed.append(chunk)
+            print(chunk, end="", flush=True)
+
+        response = process_user_query(user_input, on_token=print_token)
+        if streamed:
+            print()
+        else:
+            print(f"\nAssistant: {response}")
 
 if __name__ == "__main__":
+    warm_up_model()
     task_agent.setup_database()
+    email_agent.start_mail_watcher()
+    agenda_agent.start_calendar_refresher()
+    embedding_store.refresh_in_background()
+    context_snapshot.start_context_snapshot()
     main_console()
\ No newline at end of file
@@ -0,0 +1,289 @@
+# services/calendar_mirror.py
+
+import time
+from datetime import date, datetime, timedelta
+import config
+from services import embedding_store, user_profile
+from services.database import get_connection, fts_query, FTS_TOKENIZE
+
+# Copie locale des agendas Google dans data/memory.db.
+# La première synchronisation d'un agenda récupère tous ses événements et mémorise le
+# nextSyncToken renvoyé par l'API ; les suivantes ne demandent que les changements depuis ce jeton
+# (créations, modifications, annulations). Si le jeton a expiré (HTTP 410), l'agenda est resynchronisé.
+# Les lectures (prochains événements, événements du jour, recherche par mot-clé) sont locales.
+
+# L'API Calendar accepte au plus 50 requêtes par lot (batch HTTP).
+BATCH_LIMIT = 50
+PAGE_SIZE = 250
+
+
+MIGRATIONS = [
+    (1, [
+        '''
+        CREATE TABLE IF NOT EXISTS calendar_sync_state (
+            calendar_id TEXT PRIMARY KEY,
+            sync_token TEXT,
+            synced_at REAL
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS calendar_events (
+            id INTEGER PRIMARY KEY,
+            calendar_id TEXT NOT NULL,
+            event_id TEXT NOT NULL,
+            summary TEXT,
+            start TEXT NOT NULL,
+            start_ts REAL NOT NULL,
+            end_ts REAL NOT NULL,
+            UNIQUE (calendar_id, event_id)
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_calendar_events_start ON calendar_events (start_ts)",
+        "CREATE INDEX IF NOT EXISTS idx_calendar_events_summary ON calendar_events (summary COLLATE NOCASE)",
+        # Index plein texte des titres, maintenu par triggers. Il est indexé sur la clé entière explicite
+        # `id` : le rowid implicite d'une table à clé composite peut être renuméroté par VACUUM.
+        f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS calendar_events_fts USING fts5(
+            summary, content='calendar_events', content_rowid='id',
+            tokenize='{FTS_TOKENIZE}', prefix='2 3'
+        )
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS calendar_events_fts_insert AFTER INSERT ON calendar_events BEGIN
+            INSERT INTO calendar_events_fts (rowid, summary) VALUES (new.id, new.summary);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS calendar_events_fts_delete AFTER DELETE ON calendar_events BEGIN
+            INSERT INTO calendar_events_fts (calendar_events_fts, rowid, summary) VALUES ('delete', old.id, old.summary);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS calendar_events_fts_update AFTER UPDATE OF summary ON calendar_events BEGIN
+            INSERT INTO calendar_events_fts (calendar_events_fts, rowid, summary) VALUES ('delete', old.id, old.summary);
+            INSERT INTO calendar_events_fts (rowid, summary) VALUES (new.id, new.summary);
+        END
+        """,
+        "INSERT INTO calendar_events_fts (calendar_events_fts) VALUES ('rebuild')",
+    ]),
+]
+
+
+def _connect():
+    return get_connection(config.MEMORY_DB_PATH, "calendar_mirror", MIGRATIONS)
+
+
+# --- Conversion des événements de l'API ---
+
+def _timestamp(value):
+    """Horodatage d'un champ start/end : dateTime (avec fuseau) ou date (minuit, heure locale)."""
+    if 'dateTime' in value:
+        return datetime.fromisoformat(value['dateTime'].replace('Z', '+00:00')).timestamp()
+    return datetime.combine(date.fromisoformat(value['date']), datetime.min.time()).timestamp()
+
+
+def _event_row(calendar_id, event):
+    start = event['start']
+    end = event.get('end', start)
+    start_ts, end_ts = _timestamp(start), _timestamp(end)
+    if end_ts <= start_ts and 'date' in start:
+        # Événement d'une journée dont la fin n'est pas exclusive : il couvre toute la journée.
+        end_ts = start_ts + 24 * 3600
+    return (
+        calendar_id,
+        event['id'],
+        event.get('summary', 'Sans titre'),
+        start.get('dateTime', start.get('date')),
+        start_ts,
+        end_ts,
+    )
+
+
+def _row_to_event(row):
+    return {
+        'id': row['event_id'],
+        'summary': row['summary'],
+        'start': row['start'],
+        'calendar_id': row['calendar_id'],
+    }
+
+
+def store_event(calendar_id, event):
+    """Ajoute ou met à jour un événement (après une création depuis l'assistant, par exemple)."""
+    conn = _connect()
+    with conn:
+        _apply_items(conn, calendar_id, [event])
+    embedding_store.notify_changed("event")
+    user_profile.record_events(calendar_id, [event])
+
+
+def remove_event(calendar_id, event_id):
+    conn = _connect()
+    with conn:
+        conn.execute("DELETE FROM calendar_events WHERE calendar_id = ? AND event_id = ?", (calendar_id, event_id))
+    embedding_store.notify_changed("event")
+
+
+def _apply_items(conn, calendar_id, items):
+    """Applique des résultats de l'API : les événements annulés sont supprimés, les autres remplacés."""
+    cancelled = [(calendar_id, item['id']) for item in items if item.get('status') == 'cancelled']
+    rows = [_event_row(calendar_id, item) for item in items
+            if item.get('status') != 'cancelled' and 'start' in item]
+    conn.executemany("DELETE FROM calendar_events WHERE calendar_id = ? AND event_id = ?", cancelled)
+    # Upsert plutôt que INSERT OR REPLACE : un REPLACE supprime la ligne sans déclencher le
+    # trigger de suppression, ce qui désynchroniserait l'index plein texte.
+    conn.executemany(
+        "INSERT INTO calendar_events (calendar_id, event_id, summary, start, start_ts, end_ts) "
+        "VALUES (?, ?, ?, ?, ?, ?) "
+        "ON CONFLICT (calendar_id, event_id) DO UPDATE SET "
+        "summary = excluded.summary, start = excluded.start, start_ts = excluded.start_ts, end_ts = excluded.end_ts",
+        rows
+    )
+
+
+# --- Synchronisation ---
+
+def _http_status(exception):
+    resp = getattr(exception, 'resp', None)
+    return getattr(resp, 'status', None)
+
+
+def _events_request(service, calendar_id, sync_token, page_token=None):
+    params = {'calendarId': calendar_id, 'singleEvents': True, 'maxResults': PAGE_SIZE,
+              'fields': 'items(id,status,summary,start,end),nextPageToken,nextSyncToken'}
+    if sync_token:
+        params['syncToken'] = sync_token
+    if page_token:
+        params['pageToken'] = page_token
+    return service.events().list(**params)
+
+
+def _finish_calendar(conn, service, calendar_id, sync_token, response):
+    """
+    Suit la pagination à partir de la première page déjà reçue, puis applique toutes les pages et
+    enregistre le nouveau jeton dans une seule transaction courte : aucun appel réseau n'a lieu
+    pendant que la base est verrouillée en écriture.
+    """
+    items = list(response.get('items', []))
+    while response.get('nextPageToken'):
+        response = _events_request(service, calendar_id, sync_token, response['nextPageToken']).execute()
+        items.extend(response.get('items', []))
+    with conn:
+        if not sync_token:
+            conn.execute("DELETE FROM calendar_events WHERE calendar_id = ?", (calendar_id,))
+        _apply_items(conn, calendar_id, items)
+        conn.execute(
+            "INSERT OR REPLACE INTO calendar_sync_state (calendar_id, sync_token, synced_at) VALUES (?, ?, ?)",
+            (calendar_id, response.get('nextSyncToken'), time.time())
+        )
+    # Après la transaction : le profil ouvre la sienne sur la même connexion.
+    user_profile.record_events(calendar_id, items)
+
+
+def sync_calendars(service):
+    """
+    Synchronise tous les agendas de l'utilisateur. La première page de chaque agenda est demandée
+    dans un même lot HTTP ; seuls les agendas qui ont changé demandent des pages supplémentaires.
+    Retourne le nombre d'agendas synchronisés.
+    """
+    calendar_list = service.calendarList().list(fields='items(id)').execute()
+    calendar_ids = [entry['id'] for entry in calendar_list.get('items', [])]
+
+    conn = _connect()
+    tokens = {row['calendar_id']: row['sync_token']
+              for row in conn.execute("SELECT calendar_id, sync_token FROM calendar_sync_state")}
+    # Agendas désabonnés : leurs événements ne doivent plus apparaître.
+    removed = [calendar_id for calendar_id in tokens if calendar_id not in calendar_ids]
+    with conn:
+        for calendar_id in removed:
+            conn.execute("DELETE FROM calendar_events WHERE calendar_id = ?", (calendar_id,))
+            conn.execute("DELETE FROM calendar_sync_state WHERE calendar_id = ?", (calendar_id,))
+
+    responses = {}
+
+    def on_response(request_id, response, exception):
+        responses[request_id] = (response, exception)
+
+    for start in range(0, len(calendar_ids), BATCH_LIMIT):
+        batch = service.new_batch_http_request(callback=on_response)
+        for calendar_id in calendar_ids[start:start + BATCH_LIMIT]:
+            batch.add(_events_request(service, calendar_id, tokens.get(calendar_id)), request_id=calendar_id)
+        batch.execute()
+
+    synced = 0
+    for calendar_id in calendar_ids:
+        sync_token = tokens.get(calendar_id)
+        response, exception = responses.get(calendar_id, (None, None))
+        try:
+            if exception is not None and _http_status(exception) == 410:
+                print(f"Agent Agenda: jeton de synchronisation expiré pour '{calendar_id}', resynchronisation complète.")
+                sync_token = None
+                response = _events_request(service, calendar_id, None).execute()
+            elif exception is not None:
+                raise exception
+            _finish_calendar(conn, service, calendar_id, sync_token, response)
+            synced += 1
+        except Exception as e:
+            print(f"Agent Agenda: Agenda '{calendar_id}' non synchronisé : {e}")
+    embedding_store.notify_changed("event")
+    return synced
+
+
+def last_sync_time():
+    """Horodatage de la synchronisation la plus ancienne (None si aucun agenda n'a été synchronisé)."""
+    row = _connect().execute("SELECT MIN(synced_at) FROM calendar_sync_state").fetchone()
+    return row[0]
+
+
+# --- Lectures locales ---
+
+def get_upcoming_events(max_results=10, now=None):
+    """Événements pas encore terminés, du plus proche au plus lointain."""
+    now = now or time.time()
+    rows = _connect().execute(
+        "SELECT * FROM calendar_events WHERE end_ts > ? ORDER BY start_ts LIMIT ?",
+        (now, max_results)
+    ).fetchall()
+    return [_row_to_event(row) for row in rows]
+
+
+def get_events_for_day(day=None):
+    """Événements qui ont lieu (au moins en partie) le jour donné, heure locale."""
+    day = day or date.today()
+    day_start = datetime.combine(day, datetime.min.time()).timestamp()
+    day_end = datetime.combine(day + timedelta(days=1), datetime.min.time()).timestamp()
+    rows = _connect().execute(
+        "SELECT * FROM calendar_events WHERE start_ts < ? AND end_ts > ? ORDER BY start_ts",
+        (day_end, day_start)
+    ).fetchall()
+    return [_row_to_event(row) for row in rows]
+
+
+def find_events(keyword, upcoming_only=True, limit=None):
+    """
+    Recherche plein texte dans les titres (préfixes, sans tenir compte de la casse ni des accents),
+    triée par pertinence (bm25) puis par date.
+    """
+    query = fts_query(keyword)
+    if query is None:
+        return []
+    sql = ("SELECT calendar_events.* FROM calendar_events_fts "
+           "JOIN calendar_events ON calendar_events.id = calendar_events_fts.rowid "
+           "WHERE calendar_events_fts MATCH ?")
+    params = [query]
+    if upcoming_only:
+        sql += " AND calendar_events.end_ts > ?"
+        params.append(time.time())
+    sql += " ORDER BY bm25(calendar_events_fts), calendar_events.start_ts LIMIT ?"
+    params.append(limit or config.SEARCH_MAX_RESULTS)
+    rows = _connect().execute(sql, params).fetchall()
+    return [_row_to_event(row) for row in rows]
+
+
+def _embedding_texts():
+    """Événements à venir à indexer pour la recherche sémantique (référence : agenda/identifiant)."""
+    return {f"{event['calendar_id']}/{event['id']}": event['summary']
+            for event in get_upcoming_events(config.EMBEDDING_MAX_ITEMS_PER_SOURCE)}
+
+
+embedding_store.register_source("event", _embedding_texts)
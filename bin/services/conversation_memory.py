@@ -0,0 +1,211 @@
+# services/conversation_memory.py
+
+import threading
+import uuid
+import config
+from services.database import get_connection
+from services.mistral_service import call_mistral, is_model_ready, release_llm, try_reserve_llm
+from services.prompt_builder import PromptBuilder, count_tokens
+from services import user_profile
+
+# Mémoire des échanges d'une session, conservée dans data/memory.db.
+# Seuls les derniers échanges qui tiennent dans CONVERSATION_WINDOW_TOKENS sont injectés dans les
+# prompts ; les plus anciens sont condensés en arrière-plan dans un résumé glissant (un par session).
+# La taille du contexte ajouté aux prompts reste donc bornée, quelle que soit la durée de la session.
+# Le résumé n'est refait que lorsque la fenêtre déborde, et seulement si le modèle est libre ; il ne
+# garde alors que la moitié de la fenêtre, pour que le résumé suivant n'ait lieu qu'une demi-fenêtre
+# plus tard (et non à chaque échange). Les faits du profil sont mis à jour au même rythme.
+
+SUMMARY_INSTRUCTION = (
+    "[INST]Voici le résumé d'une conversation entre un utilisateur et son assistant personnel, "
+    "suivi de nouveaux échanges. Réécris un résumé unique, concis, qui conserve les faits utiles "
+    "(demandes, décisions, tâches et rendez-vous évoqués, préférences exprimées).\n\n"
+)
+
+MIGRATIONS = [
+    (1, [
+        '''
+        CREATE TABLE IF NOT EXISTS conversation_turns (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id TEXT NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            n_tokens INTEGER,
+            summarized INTEGER NOT NULL DEFAULT 0,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_conversation_turns_session ON conversation_turns (session_id, summarized, id)",
+        '''
+        CREATE TABLE IF NOT EXISTS conversation_summaries (
+            session_id TEXT PRIMARY KEY,
+            summary TEXT NOT NULL,
+            last_turn_id INTEGER NOT NULL,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+    ]),
+]
+
+_session_id = uuid.uuid4().hex
+_compaction_lock = threading.Lock()
+compaction_stats = {"runs": 0, "turns_summarized": 0, "skipped_busy": 0}
+
+
+def _connect():
+    return get_connection(config.MEMORY_DB_PATH, "conversation_memory", MIGRATIONS)
+
+
+def new_session():
+    """Démarre une nouvelle conversation (les échanges précédents restent en base)."""
+    global _session_id
+    _session_id = uuid.uuid4().hex
+    return _session_id
+
+
+def _label(role):
+    return "Utilisateur" if role == "user" else "Assistant"
+
+
+def _turn_tokens(conn, turn):
+    """
+    Nombre de tokens d'un échange, calculé une seule fois puis conservé en base.
+    Tant que le modèle n'est pas chargé, une estimation (4 caractères par token) est utilisée sans être
+    conservée : une commande traitée sans le modèle n'attend jamais son chargement.
+    """
+    if turn["n_tokens"] is not None:
+        return turn["n_tokens"]
+    text = f"{_label(turn['role'])}: {turn['content']}\n"
+    if not is_model_ready():
+        return min(len(text) // 4 + 1, config.CONVERSATION_TURN_MAX_TOKENS)
+    n_tokens = min(count_tokens(text), config.CONVERSATION_TURN_MAX_TOKENS)
+    with conn:
+        conn.execute("UPDATE conversation_turns SET n_tokens = ? WHERE id = ?", (n_tokens, turn["id"]))
+    return n_tokens
+
+
+def _pending_turns(conn, session_id):
+    return conn.execute(
+        "SELECT id, role, content, n_tokens FROM conversation_turns "
+        "WHERE session_id = ? AND summarized = 0 ORDER BY id",
+        (session_id,)
+    ).fetchall()
+
+
+def _split_window(conn, turns, budget=None):
+    """Sépare les échanges non résumés en (plus anciens, fenêtre récente qui tient dans le budget)."""
+    budget = budget or config.CONVERSATION_WINDOW_TOKENS
+    used, start = 0, len(turns)
+    for index in range(len(turns) - 1, -1, -1):
+        n_tokens = _turn_tokens(conn, turns[index])
+        if used + n_tokens > budget:
+            break
+        used += n_tokens
+        start = index
+    return turns[:start], turns[start:]
+
+
+def add_turn(role, content):
+    """Enregistre un échange ("user" ou "assistant") ; si la fenêtre déborde, les plus anciens sont résumés en arrière-plan."""
+    if not content or not content.strip():
+        return
+    conn = _connect()
+    with conn:
+        conn.execute(
+            "INSERT INTO conversation_turns (session_id, role, content) VALUES (?, ?, ?)",
+            (_session_id, role, content.strip())
+        )
+    if role != "assistant" or _compaction_lock.locked():
+        return
+    older, _ = _split_window(conn, _pending_turns(conn, _session_id))
+    if older:
+        threading.Thread(target=compact, args=(_session_id,), name="conversation-compaction", daemon=True).start()
+
+
+def compact(session_id=None):
+    """
+    Si la fenêtre déborde, condense dans le résumé de la session les échanges anciens, de sorte que
+    les échanges restants occupent au plus la moitié de la fenêtre. Ne fait rien si le modèle est
+    occupé (la demande suivante de l'utilisateur passe avant) : le prochain échange réessaiera.
+    Retourne le nombre d'échanges résumés.
+    """
+    session_id = session_id or _session_id
+    if not _compaction_lock.acquire(blocking=False):
+        return 0
+    if not try_reserve_llm():
+        _compaction_lock.release()
+        compaction_stats["skipped_busy"] += 1
+        return 0
+    try:
+        conn = _connect()
+        turns = _pending_turns(conn, session_id)
+        if not _split_window(conn, turns)[0]:
+            return 0
+        older, _ = _split_window(conn, turns, config.CONVERSATION_WINDOW_TOKENS // 2)
+        # Pas plus d'échanges qu'un seul prompt ne peut en contenir : le reste attend le passage suivant.
+        budget = config.N_CTX - config.CONVERSATION_SUMMARY_MAX_TOKENS * 2 - count_tokens(SUMMARY_INSTRUCTION, static=True) - 64
+        batch, used = [], 0
+        for turn in older:
+            n_tokens = _turn_tokens(conn, turn)
+            if batch and used + n_tokens > budget:
+                break
+            batch.append(turn)
+            used += n_tokens
+        older = batch
+        row = conn.execute("SELECT summary FROM conversation_summaries WHERE session_id = ?", (session_id,)).fetchone()
+        builder = PromptBuilder(max_new_tokens=config.CONVERSATION_SUMMARY_MAX_TOKENS)
+        builder.add("instructions", SUMMARY_INSTRUCTION + "### RÉSUMÉ ACTUEL ###\n", static=True)
+        builder.add("resume", (row["summary"] if row else "(aucun)") + "\n", max_tokens=config.CONVERSATION_SUMMARY_MAX_TOKENS + 16)
+        builder.add("titre", "\n### NOUVEAUX ÉCHANGES ###\n", static=True)
+        builder.add_items("echanges", [f"{_label(turn['role'])}: {turn['content']}\n" for turn in older],
+                          priority=1, item_max_tokens=config.CONVERSATION_TURN_MAX_TOKENS)
+        builder.add("fin", "[/INST]", static=True)
+        summary = call_mistral(builder.build(), max_token=config.CONVERSATION_SUMMARY_MAX_TOKENS)
+        if not summary:
+            return 0
+        last_turn_id = older[-1]["id"]
+        with conn:
+            conn.execute(
+                "INSERT INTO conversation_summaries (session_id, summary, last_turn_id) VALUES (?, ?, ?) "
+                "ON CONFLICT (session_id) DO UPDATE SET summary = excluded.summary, "
+                "last_turn_id = excluded.last_turn_id, updated_at = CURRENT_TIMESTAMP",
+                (session_id, summary, last_turn_id)
+            )
+            conn.execute(
+                "UPDATE conversation_turns SET summarized = 1 WHERE session_id = ? AND id <= ?",
+                (session_id, last_turn_id)
+            )
+        compaction_stats["runs"] += 1
+        compaction_stats["turns_summarized"] += len(older)
+        # Les faits durables du profil sont mis à jour à partir du nouveau résumé, une fois par résumé.
+        user_profile.update_facts(summary)
+        return len(older)
+    except Exception as e:
+        print(f"[Mémoire] Résumé de la conversation impossible : {e}")
+        return 0
+    finally:
+        release_llm()
+        _compaction_lock.release()
+
+
+def get_context():
+    """
+    Contexte de conversation à injecter dans un prompt : (résumé des échanges anciens ou None,
+    lignes des échanges récents dans l'ordre chronologique). Sa taille est bornée par la config.
+    """
+    conn = _connect()
+    row = conn.execute("SELECT summary FROM conversation_summaries WHERE session_id = ?", (_session_id,)).fetchone()
+    _, window = _split_window(conn, _pending_turns(conn, _session_id))
+    return (row["summary"] if row else None), [f"{_label(turn['role'])}: {turn['content']}\n" for turn in window]
+
+
+def add_to_prompt(builder, priority=4):
+    """Ajoute le résumé et les derniers échanges à un PromptBuilder, comme sections de faible priorité."""
+    summary, turns = get_context()
+    if summary:
+        builder.add("resume_conversation", f"\n### RÉSUMÉ DE LA CONVERSATION ###\n{summary}\n",
+                    priority=priority, max_tokens=config.CONVERSATION_SUMMARY_MAX_TOKENS + 16)
+    if turns:
+        builder.add("titre_historique", "\n### DERNIERS ÉCHANGES ###\n", priority=priority, static=True)
+        builder.add_items("historique", turns, priority=priority, max_tokens=config.CONVERSATION_WINDOW_TOKENS,
+                          item_max_tokens=config.CONVERSATION_TURN_MAX_TOKENS)
@@ -0,0 +1,111 @@
+# services/database.py
+
+import re
+import sqlite3
+import threading
+import config
+
+# Connexions SQLite persistantes : une par thread et par fichier (les threads de la GUI et les
+# threads d'arrière-plan n'en partagent jamais une), ouvertes une fois puis réutilisées.
+# Mode WAL : les lectures ne bloquent pas l'écriture en cours et inversement.
+# Les requêtes préparées sont conservées par sqlite3 (cached_statements), clé = texte SQL.
+
+_local = threading.local()
+# Schémas déjà migrés dans ce processus : {(fichier, schéma)}.
+_migrated = set()
+_migrate_lock = threading.Lock()
+
+
+def get_connection(path=None, schema=None, migrations=None):
+    """
+    Retourne la connexion du thread courant vers `path` (config.DB_PATH par défaut).
+    Avec `schema` et `migrations`, les migrations de ce schéma sont appliquées au premier appel
+    du processus pour ce fichier (voir migrate).
+    """
+    path = path or config.DB_PATH
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(path)
+    if conn is None:
+        conn = sqlite3.connect(path, timeout=10, cached_statements=config.SQLITE_CACHED_STATEMENTS)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        connections[path] = conn
+    if schema is not None and (path, schema) not in _migrated:
+        with _migrate_lock:
+            if (path, schema) not in _migrated:
+                migrate(conn, migrations, schema)
+                _migrated.add((path, schema))
+    return conn
+
+
+def close_connection(path=None):
+    """Ferme la connexion du thread courant (fin d'un thread de travail, tests)."""
+    path = path or config.DB_PATH
+    conn = getattr(_local, "connections", {}).pop(path, None)
+    if conn is not None:
+        conn.close()
+
+
+def _schema_version(conn, schema):
+    if schema is None:
+        return conn.execute("PRAGMA user_version").fetchone()[0]
+    row = conn.execute("SELECT version FROM schema_versions WHERE schema = ?", (schema,)).fetchone()
+    return row[0] if row else 0
+
+
+def migrate(conn, migrations, schema=None):
+    """
+    Applique les migrations dont la version dépasse celle du schéma, dans l'ordre, chacune dans
+    sa propre transaction. `migrations` : liste de (version, [instructions SQL]) ; une instruction
+    peut aussi être une fonction appelée avec la connexion (étape qui dépend du schéma existant).
+    Sans `schema`, la version est PRAGMA user_version (une base = un schéma, ex. tasks.db) ;
+    avec `schema`, elle est lue dans la table schema_versions, ce qui permet à plusieurs modules
+    de partager un fichier (data/memory.db) en gardant chacun sa numérotation.
+    Les données existantes sont conservées. Retourne la version finale du schéma.
+    """
+    if schema is not None:
+        conn.execute("CREATE TABLE IF NOT EXISTS schema_versions (schema TEXT PRIMARY KEY, version INTEGER NOT NULL)")
+    current = _schema_version(conn, schema)
+    for version, statements in sorted(migrations, key=lambda migration: migration[0]):
+        if version <= current:
+            continue
+        try:
+            # Verrou d'écriture pris d'emblée : un autre processus a pu migrer entre-temps.
+            conn.execute("BEGIN IMMEDIATE")
+            current = _schema_version(conn, schema)
+            if version > current:
+                for statement in statements:
+                    if callable(statement):
+                        statement(conn)
+                    else:
+                        conn.execute(statement)
+                if schema is None:
+                    conn.execute(f"PRAGMA user_version = {int(version)}")
+                else:
+                    conn.execute("INSERT INTO schema_versions (schema, version) VALUES (?, ?) "
+                                 "ON CONFLICT (schema) DO UPDATE SET version = excluded.version", (schema, version))
+                current = version
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    return current
+
+
+# Index plein texte (FTS5) : casse et accents ignorés, index de préfixes de 2 et 3 caractères.
+FTS_TOKENIZE = "unicode61 remove_diacritics 2"
+
+
+def fts_query(text):
+    """
+    Traduit une saisie libre en requête FTS5 : chaque mot devient un préfixe ("rapp"* trouve
+    « rapport »), tous les mots sont requis. Retourne None si la saisie ne contient aucun mot.
+    """
+    words = re.findall(r"\w+", text)
+    if not words:
+        return None
+    return " ".join('"' + word.replace('"', '""') + '"*' for word in words)
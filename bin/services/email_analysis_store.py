@@ -0,0 +1,134 @@
+# services/email_analysis_store.py
+
+import os
+import sqlite3
+import config
+from services import embedding_store
+from services.database import get_connection
+
+# Analyses d'e-mails déjà calculées, conservées dans data/memory.db.
+# Clé : "mid:<Message-ID>" ou, à défaut, "sha:<empreinte du corps>".
+# Une entrée n'est valable que pour la version du prompt et le fichier modèle qui l'ont produite.
+# attachments_pending : analyse provisoire, faite sans les pièces jointes (scan de sécurité en cours).
+
+ANALYSIS_FIELDS = ("subject", "sender", "resume", "importance", "action_requise")
+
+
+def _add_attachments_pending(conn):
+    """Les caches créés avant le scan différé n'ont pas la colonne attachments_pending."""
+    columns = {row["name"] for row in conn.execute("PRAGMA table_info(email_analysis_cache)")}
+    if "attachments_pending" not in columns:
+        conn.execute("ALTER TABLE email_analysis_cache ADD COLUMN attachments_pending INTEGER NOT NULL DEFAULT 0")
+
+
+MIGRATIONS = [
+    (1, [
+        '''
+        CREATE TABLE IF NOT EXISTS email_analysis_cache (
+            message_key TEXT PRIMARY KEY,
+            prompt_version TEXT NOT NULL,
+            model_id TEXT NOT NULL,
+            subject TEXT,
+            sender TEXT,
+            resume TEXT,
+            importance INTEGER,
+            action_requise TEXT,
+            attachments_pending INTEGER NOT NULL DEFAULT 0,
+            analyzed_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        _add_attachments_pending,
+    ]),
+]
+
+
+def _connect():
+    return get_connection(config.MEMORY_DB_PATH, "email_analysis_store", MIGRATIONS)
+
+
+def get_model_id():
+    """Identifie le fichier modèle (nom, taille, date de modification) sans le relire en entier."""
+    try:
+        stat = os.stat(config.MODEL_PATH)
+        return f"{os.path.basename(config.MODEL_PATH)}:{stat.st_size}:{int(stat.st_mtime)}"
+    except OSError:
+        return os.path.basename(config.MODEL_PATH)
+
+
+def get_analyses(message_keys, prompt_version):
+    """Retourne {clé: analyse} pour les messages déjà analysés avec ce prompt et ce modèle."""
+    message_keys = list(message_keys)
+    if not message_keys:
+        return {}
+    placeholders = ",".join("?" for _ in message_keys)
+    conn = _connect()
+    try:
+        rows = conn.execute(
+            f"SELECT * FROM email_analysis_cache WHERE message_key IN ({placeholders}) "
+            "AND prompt_version = ? AND model_id = ?",
+            (*message_keys, prompt_version, get_model_id())
+        ).fetchall()
+    except sqlite3.Error as e:
+        print(f"[Email Store] Lecture du cache d'analyses impossible : {e}")
+        return {}
+    return {
+        row["message_key"]: {
+            **{field: row[field] for field in ANALYSIS_FIELDS},
+            "attachments_pending": bool(row["attachments_pending"]),
+        }
+        for row in rows
+    }
+
+
+def save_analysis(message_key, prompt_version, analysis, attachments_pending=False):
+    """Enregistre (ou remplace) l'analyse d'un message."""
+    conn = _connect()
+    try:
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO email_analysis_cache "
+                "(message_key, prompt_version, model_id, subject, sender, resume, importance, action_requise, "
+                "attachments_pending) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (message_key, prompt_version, get_model_id(),
+                 *(analysis.get(field) for field in ANALYSIS_FIELDS), int(attachments_pending))
+            )
+        embedding_store.notify_changed("email")
+    except sqlite3.Error as e:
+        print(f"[Email Store] Écriture du cache d'analyses impossible : {e}")
+
+
+def purge_stale_analyses(prompt_version):
+    """Supprime les analyses produites par une autre version du prompt ou un autre modèle."""
+    conn = _connect()
+    with conn:
+        cursor = conn.execute(
+            "DELETE FROM email_analysis_cache WHERE prompt_version <> ? OR model_id <> ?",
+            (prompt_version, get_model_id())
+        )
+    return cursor.rowcount
+
+
+def get_recent_analyses(limit=50):
+    """Retourne [(clé, analyse)] des analyses valides les plus récentes, de la plus récente à la plus ancienne."""
+    conn = _connect()
+    try:
+        rows = conn.execute(
+            "SELECT * FROM email_analysis_cache WHERE model_id = ? ORDER BY analyzed_at DESC LIMIT ?",
+            (get_model_id(), limit)
+        ).fetchall()
+    except sqlite3.Error as e:
+        print(f"[Email Store] Lecture du cache d'analyses impossible : {e}")
+        return []
+    return [(row["message_key"], {field: row[field] for field in ANALYSIS_FIELDS}) for row in rows]
+
+
+def _embedding_texts():
+    """E-mails analysés à indexer pour la recherche sémantique : sujet, résumé et action suggérée."""
+    return {
+        key: " — ".join(part for part in (analysis.get("subject"), analysis.get("resume"),
+                                          analysis.get("action_requise")) if part)
+        for key, analysis in get_recent_analyses(config.EMBEDDING_MAX_ITEMS_PER_SOURCE)
+    }
+
+
+embedding_store.register_source("email", _embedding_texts)
@@ -0,0 +1,232 @@
+# services/embedding_store.py
+
+import hashlib
+import json
+import os
+import threading
+import numpy as np
+import config
+from services.mistral_service import embed_texts, is_embedder_ready, warm_up_embedder
+
+# Index sémantique local des tâches, e-mails analysés et événements.
+# - Vecteurs normalisés, stockés en float16 dans data/embeddings/vectors.npy ; la table des
+#   identifiants ("task:12", "email:mid:<...>", "event:<agenda>/<id>"), l'empreinte et le texte de
+#   chaque élément sont dans ids.json (même ordre que les lignes de la matrice).
+# - Chaque source (tâches, e-mails, événements) enregistre une fonction qui retourne ses éléments
+#   actuels {référence: texte} ; après une modification, seule la source concernée est relue et
+#   seuls les textes nouveaux ou modifiés sont recalculés.
+# - Recherche : similarité cosinus (produit scalaire de vecteurs normalisés) sur toute la matrice
+#   en une opération NumPy, puis sélection des k meilleurs par argpartition.
+
+VECTORS_FILE = "vectors.npy"
+IDS_FILE = "ids.json"
+
+_sources = {}
+_lock = threading.RLock()
+_index = None  # {"model", "ids", "hashes", "texts", "positions", "vectors" (float32), "kinds"}
+_dirty = set()
+_refresh_timer = None
+
+
+def register_source(kind, loader):
+    """Déclare une source d'éléments : `loader()` retourne {référence: texte} pour tout ce qui doit être indexé."""
+    _sources[kind] = loader
+    _dirty.add(kind)
+
+
+def _text_hash(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def _model_id():
+    try:
+        stat = os.stat(config.EMBEDDING_MODEL_PATH)
+        return f"{os.path.basename(config.EMBEDDING_MODEL_PATH)}:{stat.st_size}:{int(stat.st_mtime)}"
+    except OSError:
+        return os.path.basename(config.EMBEDDING_MODEL_PATH)
+
+
+def _empty_index():
+    return {"model": _model_id(), "ids": [], "hashes": [], "texts": [], "positions": {},
+            "vectors": np.zeros((0, 0), dtype=np.float32), "kinds": np.array([], dtype=object)}
+
+
+def _load_index():
+    """Lit l'index sur disque (une seule fois) ; un index produit par un autre modèle est ignoré."""
+    global _index
+    if _index is not None:
+        return _index
+    index = _empty_index()
+    ids_path = os.path.join(config.EMBEDDING_INDEX_DIR, IDS_FILE)
+    vectors_path = os.path.join(config.EMBEDDING_INDEX_DIR, VECTORS_FILE)
+    if os.path.exists(ids_path) and os.path.exists(vectors_path):
+        try:
+            with open(ids_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            vectors = np.load(vectors_path)
+            if meta.get("model") == index["model"] and len(meta["ids"]) == len(vectors):
+                index.update(ids=meta["ids"], hashes=meta["hashes"], texts=meta["texts"],
+                             vectors=vectors.astype(np.float32))
+        except (OSError, ValueError, KeyError) as e:
+            print(f"[Embeddings] Index illisible, il sera reconstruit : {e}")
+    _reindex(index)
+    _index = index
+    return _index
+
+
+def _reindex(index):
+    index["positions"] = {item_id: row for row, item_id in enumerate(index["ids"])}
+    index["kinds"] = np.array([item_id.split(":", 1)[0] for item_id in index["ids"]], dtype=object)
+
+
+def _save_index(index):
+    """Écrit la matrice puis la table des identifiants (fichiers temporaires + remplacement atomique)."""
+    os.makedirs(config.EMBEDDING_INDEX_DIR, exist_ok=True)
+    vectors_path = os.path.join(config.EMBEDDING_INDEX_DIR, VECTORS_FILE)
+    ids_path = os.path.join(config.EMBEDDING_INDEX_DIR, IDS_FILE)
+    with open(vectors_path + ".tmp", "wb") as f:
+        np.save(f, index["vectors"].astype(np.float16))
+    with open(ids_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({"model": index["model"], "ids": index["ids"], "hashes": index["hashes"],
+                   "texts": index["texts"]}, f, ensure_ascii=False)
+    os.replace(vectors_path + ".tmp", vectors_path)
+    os.replace(ids_path + ".tmp", ids_path)
+
+
+def _embed(texts, timeout=None):
+    """Vecteurs normalisés (float32) des textes, calculés par lots ; None si le modèle est indisponible."""
+    rows = []
+    for start in range(0, len(texts), config.EMBEDDING_BATCH_SIZE):
+        vectors = embed_texts(texts[start:start + config.EMBEDDING_BATCH_SIZE], timeout=timeout)
+        if vectors is None:
+            return None
+        rows.extend(vectors)
+    matrix = np.asarray(rows, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+def sync_source(kind, items):
+    """
+    Aligne l'index sur l'état actuel d'une source : `items` = {référence: texte}.
+    Les éléments disparus sont retirés, seuls les textes nouveaux ou modifiés sont recalculés.
+    Retourne le nombre de vecteurs calculés.
+    """
+    wanted = {f"{kind}:{ref}": text for ref, text in items.items() if text and text.strip()}
+    with _lock:
+        index = _load_index()
+        keep = [row for row, item_id in enumerate(index["ids"])
+                if not item_id.startswith(kind + ":") or item_id in wanted]
+        changed = [item_id for item_id, text in wanted.items()
+                   if item_id not in index["positions"]
+                   or index["hashes"][index["positions"][item_id]] != _text_hash(text)]
+        if not changed and len(keep) == len(index["ids"]):
+            return 0
+
+    # Calcul hors verrou : les recherches restent servies par l'index courant pendant ce temps.
+    new_vectors = _embed([wanted[item_id] for item_id in changed]) if changed else None
+    if changed and new_vectors is None:
+        return 0
+
+    with _lock:
+        index = _load_index()
+        changed_set = set(changed)
+        rows = [row for row, item_id in enumerate(index["ids"])
+                if (not item_id.startswith(kind + ":") or item_id in wanted) and item_id not in changed_set]
+        vectors = index["vectors"][rows] if rows else None
+        ids = [index["ids"][row] for row in rows] + changed
+        hashes = [index["hashes"][row] for row in rows] + [_text_hash(wanted[item_id]) for item_id in changed]
+        texts = [index["texts"][row] for row in rows] + [wanted[item_id] for item_id in changed]
+        if new_vectors is not None:
+            vectors = new_vectors if vectors is None or not len(vectors) else np.vstack([vectors, new_vectors])
+        index.update(ids=ids, hashes=hashes, texts=texts,
+                     vectors=vectors if vectors is not None else np.zeros((0, 0), dtype=np.float32))
+        _reindex(index)
+        try:
+            _save_index(index)
+        except OSError as e:
+            print(f"[Embeddings] Impossible d'enregistrer l'index : {e}")
+    return len(changed)
+
+
+def refresh(kinds=None):
+    """Relit les sources modifiées (ou celles demandées) et met l'index à jour."""
+    if not config.EMBEDDING_ENABLED:
+        return
+    with _lock:
+        kinds = set(kinds) if kinds is not None else set(_dirty)
+        _dirty.difference_update(kinds)
+    for kind in kinds:
+        loader = _sources.get(kind)
+        if loader is None:
+            continue
+        try:
+            computed = sync_source(kind, loader())
+            if computed:
+                print(f"[Embeddings] {computed} élément(s) '{kind}' indexé(s).")
+        except Exception as e:
+            print(f"[Embeddings] Mise à jour de l'index '{kind}' impossible : {e}")
+
+
+def notify_changed(kind):
+    """
+    Signale qu'une source a changé : l'index est mis à jour en arrière-plan après
+    EMBEDDING_REFRESH_DELAY secondes (les modifications rapprochées sont regroupées).
+    """
+    global _refresh_timer
+    if not config.EMBEDDING_ENABLED:
+        return
+    with _lock:
+        _dirty.add(kind)
+        if _refresh_timer is not None and _refresh_timer.is_alive():
+            return
+        _refresh_timer = threading.Timer(config.EMBEDDING_REFRESH_DELAY, refresh)
+        _refresh_timer.name = "embedding-refresh"
+        _refresh_timer.daemon = True
+        _refresh_timer.start()
+
+
+def refresh_in_background():
+    """Met à jour toutes les sources en attente sans bloquer l'appelant (démarrage)."""
+    if config.EMBEDDING_ENABLED and _dirty:
+        threading.Thread(target=refresh, name="embedding-refresh", daemon=True).start()
+
+
+def search(query, k=None, kinds=None, min_score=None, timeout=None):
+    """
+    Éléments les plus proches de `query` (similarité cosinus), du plus au moins pertinent.
+    `kinds` limite la recherche à certaines sources ("task", "email", "event").
+    Le modèle d'embedding n'est jamais chargé ici : s'il ne l'est pas encore, son chargement est
+    lancé en arrière-plan et la recherche renvoie une liste vide.
+    `timeout` : attente maximale du modèle s'il est occupé (indexation) ; au-delà, liste vide.
+    Retourne une liste de {"kind", "ref", "text", "score"}.
+    """
+    if not config.EMBEDDING_ENABLED or not query.strip():
+        return []
+    if not is_embedder_ready():
+        warm_up_embedder()
+        return []
+    k = k or config.SEARCH_MAX_RESULTS
+    min_score = config.EMBEDDING_MIN_SCORE if min_score is None else min_score
+    with _lock:
+        index = _load_index()
+        if not index["ids"]:
+            return []
+        vectors, ids, texts, row_kinds = index["vectors"], index["ids"], index["texts"], index["kinds"]
+    query_vector = _embed([query], timeout=timeout)
+    if query_vector is None or query_vector.shape[1] != vectors.shape[1]:
+        return []
+
+    scores = vectors @ query_vector[0]
+    if kinds is not None:
+        scores = np.where(np.isin(row_kinds, list(kinds)), scores, -np.inf)
+    k = min(k, len(scores))
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.argsort(-scores[top])]
+    results = []
+    for row in top:
+        if scores[row] < min_score:
+            break
+        kind, ref = ids[row].split(":", 1)
+        results.append({"kind": kind, "ref": ref, "text": texts[row], "score": float(scores[row])})
+    return results
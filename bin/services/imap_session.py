@@ -0,0 +1,160 @@
+# services/imap_session.py
+
+import imaplib
+import re
+import socket
+import threading
+import time
+import config
+
+# Session IMAP authentifiée et réutilisée d'une commande à l'autre : la négociation TLS et le
+# LOGIN ne sont payés qu'une fois. En cas de coupure, la connexion est rouverte de façon transparente.
+# Optionnellement, un thread surveille la boîte via IMAP IDLE (sur sa propre connexion) et
+# signale l'arrivée de nouveaux messages.
+
+_EXISTS_RE = re.compile(rb"^\* \d+ EXISTS")
+
+
+def default_connection_factory(host, port, use_ssl):
+    if use_ssl:
+        return imaplib.IMAP4_SSL(host, port)
+    return imaplib.IMAP4(host, port)
+
+
+class ImapSession:
+    """Connexion IMAP persistante, partagée entre les threads (une commande à la fois)."""
+
+    def __init__(self, host=None, port=None, use_ssl=None, username=None, password=None,
+                 connection_factory=default_connection_factory):
+        self.host = host or config.IMAP_HOST
+        self.port = port or config.IMAP_PORT
+        self.use_ssl = config.IMAP_USE_SSL if use_ssl is None else use_ssl
+        self.username = username or config.EMAIL_ADDRESS
+        self.password = password or config.EMAIL_PASSWORD
+        self.connection_factory = connection_factory
+        self._conn = None
+        self._last_used = 0.0
+        self._lock = threading.RLock()
+        self._idle_thread = None
+        self._idle_stop = threading.Event()
+        self._idle_conn = None
+
+    def _open(self):
+        conn = self.connection_factory(self.host, self.port, self.use_ssl)
+        conn.login(self.username, self.password)
+        return conn
+
+    def _discard(self):
+        if self._conn is not None:
+            try:
+                self._conn.logout()
+            except Exception:
+                pass
+        self._conn = None
+
+    def _get_connection(self):
+        """Retourne la connexion courante, vérifiée par un NOOP si elle est restée inutilisée longtemps."""
+        if self._conn is not None and time.monotonic() - self._last_used > config.IMAP_NOOP_INTERVAL:
+            try:
+                status, _ = self._conn.noop()
+                if status != 'OK':
+                    self._discard()
+            except (imaplib.IMAP4.abort, imaplib.IMAP4.error, OSError):
+                self._discard()
+        if self._conn is None:
+            self._conn = self._open()
+        return self._conn
+
+    def run(self, operation):
+        """
+        Exécute operation(connexion) sur la session partagée.
+        Si la connexion a été coupée, elle est rouverte et l'opération relancée une fois.
+        """
+        with self._lock:
+            for attempt in range(2):
+                try:
+                    result = operation(self._get_connection())
+                    self._last_used = time.monotonic()
+                    return result
+                except (imaplib.IMAP4.abort, OSError):
+                    self._discard()
+                    if attempt:
+                        raise
+                    print("Agent E-mail: connexion IMAP interrompue, reconnexion...")
+
+    def close(self):
+        self.stop_idle()
+        with self._lock:
+            self._discard()
+
+    # --- IMAP IDLE ---
+
+    def start_idle(self, on_new_mail, mailbox='inbox'):
+        """Démarre la surveillance de la boîte ; on_new_mail() est appelé à chaque nouveau message."""
+        if self._idle_thread and self._idle_thread.is_alive():
+            return
+        self._idle_stop.clear()
+        self._idle_thread = threading.Thread(
+            target=self._idle_loop, args=(on_new_mail, mailbox), name="imap-idle", daemon=True
+        )
+        self._idle_thread.start()
+
+    def stop_idle(self):
+        self._idle_stop.set()
+        conn = self._idle_conn
+        if conn is not None:
+            try:
+                conn.shutdown()
+            except Exception:
+                pass
+
+    def _idle_once(self, conn):
+        """
+        Un cycle IDLE : attend une notification EXISTS ou l'expiration du délai (le serveur
+        coupe les IDLE au bout de ~30 min). Retourne True si un nouveau message est arrivé.
+        """
+        tag = conn._new_tag()
+        conn.send(tag + b" IDLE\r\n")
+        if not conn.readline().startswith(b"+"):
+            raise imaplib.IMAP4.error("Le serveur ne supporte pas IDLE.")
+        conn.sock.settimeout(config.IMAP_IDLE_TIMEOUT)
+        while True:
+            line = conn.readline()
+            if not line:
+                raise imaplib.IMAP4.abort("Connexion IDLE fermée par le serveur.")
+            if _EXISTS_RE.match(line):
+                break
+        conn.sock.settimeout(None)
+        conn.send(b"DONE\r\n")
+        while True:
+            line = conn.readline()
+            if not line or line.startswith(tag):
+                break
+        return True
+
+    def _idle_loop(self, on_new_mail, mailbox):
+        retry_delay = 5
+        while not self._idle_stop.is_set():
+            try:
+                self._idle_conn = self._open()
+                self._idle_conn.select(mailbox, readonly=True)
+                retry_delay = 5
+                while not self._idle_stop.is_set():
+                    if self._idle_once(self._idle_conn):
+                        on_new_mail()
+            except socket.timeout:
+                # Délai IDLE écoulé sans nouveau message : on repart sur une connexion neuve.
+                pass
+            except Exception as e:
+                if self._idle_stop.is_set():
+                    break
+                print(f"Agent E-mail: surveillance IMAP interrompue ({e}), nouvelle tentative dans {retry_delay} s.")
+                self._idle_stop.wait(retry_delay)
+                retry_delay = min(retry_delay * 2, 300)
+            finally:
+                conn, self._idle_conn = self._idle_conn, None
+                if conn is not None:
+                    try:
+                        conn.shutdown()
+                    except Exception:
+                        pass
@@ -0,0 +1,501 @@
+# services/imap_sync.py
+
+import base64
+import binascii
+import json
+import quopri
+import re
+import sqlite3
+from email.header import decode_header, make_header
+import config
+from services.database import get_connection
+
+# Synchronisation incrémentale d'une boîte IMAP vers data/memory.db.
+# On conserve UIDVALIDITY et le plus grand UID déjà vu : à chaque synchronisation, seuls les
+# UID supérieurs sont recherchés puis récupérés par UID FETCH groupés.
+# Si UIDVALIDITY change, les UID locaux n'ont plus de sens : resynchronisation complète.
+#
+# Les messages ne sont jamais téléchargés en entier : on lit d'abord les en-têtes et la
+# BODYSTRUCTURE, puis uniquement le début des parties texte (BODY.PEEK[n]<0.N>).
+# Les pièces jointes PDF sont seulement référencées (section, taille) et téléchargées
+# à la demande via fetch_attachment().
+
+
+def _drop_rfc822_cache(conn):
+    """Ancien format (message RFC822 complet) : le cache est reconstruit au prochain passage."""
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(imap_messages)")]
+    if columns and "header" not in columns:
+        conn.execute("DROP TABLE imap_messages")
+        conn.execute("DELETE FROM imap_sync_state")
+
+
+MIGRATIONS = [
+    (1, [
+        '''
+        CREATE TABLE IF NOT EXISTS imap_sync_state (
+            mailbox TEXT PRIMARY KEY,
+            uidvalidity INTEGER NOT NULL,
+            last_uid INTEGER NOT NULL DEFAULT 0,
+            synced_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        _drop_rfc822_cache,
+        '''
+        CREATE TABLE IF NOT EXISTS imap_messages (
+            mailbox TEXT NOT NULL,
+            uid INTEGER NOT NULL,
+            header BLOB NOT NULL,
+            body_text TEXT,
+            body_subtype TEXT,
+            body_truncated INTEGER DEFAULT 0,
+            attachments TEXT,
+            fetched_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (mailbox, uid)
+        )
+        ''',
+    ]),
+]
+
+
+def _connect():
+    return get_connection(config.MEMORY_DB_PATH, "imap_sync", MIGRATIONS)
+
+
+# --- Lecture des réponses IMAP ---
+
+def _wire_bytes(data):
+    """Reconstitue le flux brut d'une réponse imaplib (les littéraux {n} sont séparés en tuples)."""
+    chunks = []
+    for part in data:
+        if isinstance(part, tuple):
+            chunks.append(part[0] + b"\r\n" + part[1])
+        elif part is not None:
+            chunks.append(part)
+    return b"".join(chunks)
+
+
+def _parse_sexp(wire, pos=0):
+    """
+    Analyse une liste IMAP (parenthèses, chaînes entre guillemets, littéraux, NIL, atomes).
+    Retourne (valeurs, position). Les chaînes sont des bytes, NIL vaut None.
+    """
+    values = []
+    length = len(wire)
+    while pos < length:
+        char = wire[pos:pos + 1]
+        if char in (b" ", b"\r", b"\n"):
+            pos += 1
+        elif char == b"(":
+            sub_values, pos = _parse_sexp(wire, pos + 1)
+            values.append(sub_values)
+        elif char == b")":
+            return values, pos + 1
+        elif char == b'"':
+            pos += 1
+            out = bytearray()
+            while pos < length and wire[pos:pos + 1] != b'"':
+                if wire[pos:pos + 1] == b"\\":
+                    pos += 1
+                out += wire[pos:pos + 1]
+                pos += 1
+            values.append(bytes(out))
+            pos += 1
+        elif char == b"{":
+            end = wire.index(b"}", pos)
+            size = int(wire[pos + 1:end])
+            start = end + 3  # "}\r\n"
+            values.append(wire[start:start + size])
+            pos = start + size
+        else:
+            end = pos
+            depth = 0
+            while end < length:
+                c = wire[end:end + 1]
+                if c == b"[":
+                    depth += 1
+                elif c == b"]":
+                    depth -= 1
+                elif depth == 0 and c in (b" ", b"(", b")", b"\r", b"\n"):
+                    break
+                end += 1
+            atom = wire[pos:end]
+            values.append(None if atom.upper() == b"NIL" else atom)
+            pos = end
+    return values, pos
+
+
+def parse_fetch_response(data):
+    """
+    Transforme la réponse d'un UID FETCH en {uid: {ATTRIBUT: valeur}}.
+    Les noms d'attributs sont en majuscules (b'BODYSTRUCTURE', b'BODY[HEADER]', b'BODY[1.2]<0>'...).
+    """
+    values, _ = _parse_sexp(_wire_bytes(data))
+    results = {}
+    for value in values:
+        if not isinstance(value, list):
+            continue
+        attributes = {}
+        for i in range(0, len(value) - 1, 2):
+            name = value[i]
+            if isinstance(name, bytes):
+                attributes[name.upper()] = value[i + 1]
+        if b"UID" in attributes:
+            results[int(attributes.pop(b"UID"))] = attributes
+    return results
+
+
+def _params_to_dict(params):
+    if not isinstance(params, list):
+        return {}
+    return {
+        params[i].decode(errors="ignore").lower(): (params[i + 1] or b"").decode(errors="ignore")
+        for i in range(0, len(params) - 1, 2)
+        if isinstance(params[i], bytes)
+    }
+
+
+def parse_bodystructure(structure, section=""):
+    """
+    Aplatit une BODYSTRUCTURE en liste de parties feuilles :
+    {section, type, params, encoding, size, disposition, filename}.
+    """
+    if not isinstance(structure, list) or not structure:
+        return []
+    if isinstance(structure[0], list):
+        parts = []
+        index = 0
+        for child in structure:
+            if not isinstance(child, list):
+                break
+            index += 1
+            parts.extend(parse_bodystructure(child, f"{section}.{index}" if section else str(index)))
+        return parts
+
+    main_type = (structure[0] or b"").decode(errors="ignore").lower()
+    sub_type = (structure[1] or b"").decode(errors="ignore").lower()
+    params = _params_to_dict(structure[2]) if len(structure) > 2 else {}
+    encoding = (structure[5] or b"7bit").decode(errors="ignore").lower() if len(structure) > 5 else "7bit"
+    try:
+        size = int(structure[6]) if len(structure) > 6 and structure[6] is not None else 0
+    except ValueError:
+        size = 0
+
+    # Les parties text/* ont un champ "lines" supplémentaire, message/rfc822 en a trois.
+    if main_type == "text":
+        extension_start = 8
+    elif main_type == "message" and sub_type == "rfc822":
+        extension_start = 10
+    else:
+        extension_start = 7
+    disposition, disposition_params = None, {}
+    if len(structure) > extension_start + 1 and isinstance(structure[extension_start + 1], list):
+        raw_disposition = structure[extension_start + 1]
+        disposition = (raw_disposition[0] or b"").decode(errors="ignore").lower()
+        if len(raw_disposition) > 1:
+            disposition_params = _params_to_dict(raw_disposition[1])
+
+    filename = disposition_params.get("filename") or params.get("name")
+    if filename:
+        filename = _decode_mime_words(filename)
+    return [{
+        "section": section or "1",
+        "type": f"{main_type}/{sub_type}",
+        "params": params,
+        "encoding": encoding,
+        "size": size,
+        "disposition": disposition,
+        "filename": filename,
+    }]
+
+
+def _decode_mime_words(value):
+    try:
+        return str(make_header(decode_header(value)))
+    except Exception:
+        return value
+
+
+def decode_transfer_encoding(data, encoding, partial=False):
+    """Décode base64 / quoted-printable, y compris sur un extrait tronqué (fetch partiel)."""
+    data = data or b""
+    if encoding == "base64":
+        compact = re.sub(rb"[^A-Za-z0-9+/=]", b"", data)
+        if partial:
+            compact = compact[:len(compact) - len(compact) % 4]
+        try:
+            return base64.b64decode(compact)
+        except (binascii.Error, ValueError):
+            return b""
+    if encoding == "quoted-printable":
+        if partial:
+            # Ne pas couper une séquence =XX en fin d'extrait.
+            data = re.sub(rb"=[0-9A-Fa-f]?$", b"", data)
+        return quopri.decodestring(data)
+    return data
+
+
+def _select_text_part(parts):
+    """Choisit la partie texte à lire : text/plain en priorité, sinon text/html."""
+    candidates = [part for part in parts if part["type"].startswith("text/") and part["disposition"] != "attachment"]
+    for wanted in ("text/plain", "text/html"):
+        for part in candidates:
+            if part["type"] == wanted:
+                return part
+    return None
+
+
+def _attachment_refs(parts):
+    """Références des pièces jointes PDF (rien n'est téléchargé ici)."""
+    refs = []
+    for part in parts:
+        filename = part["filename"] or ""
+        if part["type"] == "application/pdf" or filename.lower().endswith(".pdf"):
+            refs.append({
+                "section": part["section"],
+                "filename": filename or f"piece_jointe_{part['section']}.pdf",
+                "encoding": part["encoding"],
+                "size": part["size"],
+            })
+    return refs
+
+
+def _uid_fetch(mail, uids, items, failed):
+    """
+    UID FETCH par lots d'au plus IMAP_FETCH_BATCH_SIZE UID par commande.
+    Les UID d'un lot refusé par le serveur sont ajoutés à `failed` pour être redemandés plus tard.
+    """
+    results = {}
+    batch_size = config.IMAP_FETCH_BATCH_SIZE
+    for i in range(0, len(uids), batch_size):
+        batch = uids[i:i + batch_size]
+        uid_set = ",".join(str(uid) for uid in batch)
+        status, data = mail.uid("FETCH", uid_set, items)
+        if status != "OK":
+            print(f"Agent E-mail: UID FETCH refusé pour {len(batch)} message(s) ({status}), nouvel essai au prochain passage.")
+            failed.update(batch)
+            continue
+        results.update(parse_fetch_response(data))
+    return results
+
+
+def fetch_messages(mail, uids, failed=None):
+    """
+    Récupère en-têtes, structure et début du corps texte de plusieurs messages.
+    1) un UID FETCH groupé (UID BODYSTRUCTURE BODY.PEEK[HEADER]) ;
+    2) un UID FETCH groupé par section texte (BODY.PEEK[section]<0.N>).
+    Retourne {uid: message} ; les UID dont un lot a échoué sont exclus et ajoutés à `failed`.
+    """
+    failed = set() if failed is None else failed
+    if not uids:
+        return {}
+    heads = _uid_fetch(mail, uids, "(UID BODYSTRUCTURE BODY.PEEK[HEADER])", failed)
+    messages = {}
+    by_section = {}
+    for uid, attributes in heads.items():
+        parts = parse_bodystructure(attributes.get(b"BODYSTRUCTURE"))
+        text_part = _select_text_part(parts)
+        messages[uid] = {
+            "uid": uid,
+            "header": attributes.get(b"BODY[HEADER]") or b"",
+            "body_text": "",
+            "body_subtype": text_part["type"].split("/")[1] if text_part else None,
+            "body_truncated": False,
+            "attachments": _attachment_refs(parts),
+            "_text_part": text_part,
+        }
+        if text_part:
+            by_section.setdefault(text_part["section"], []).append(uid)
+
+    limit = config.EMAIL_BODY_MAX_BYTES
+    for section, section_uids in by_section.items():
+        bodies = _uid_fetch(mail, section_uids, f"(UID BODY.PEEK[{section}]<0.{limit}>)", failed)
+        for uid, attributes in bodies.items():
+            raw = next((value for name, value in attributes.items() if name.startswith(b"BODY[")), b"") or b""
+            text_part = messages[uid]["_text_part"]
+            truncated = text_part["size"] > limit
+            decoded = decode_transfer_encoding(raw, text_part["encoding"], partial=truncated)
+            charset = text_part["params"].get("charset") or "utf-8"
+            try:
+                messages[uid]["body_text"] = decoded.decode(charset, errors="replace")
+            except LookupError:
+                messages[uid]["body_text"] = decoded.decode("utf-8", errors="replace")
+            messages[uid]["body_truncated"] = truncated
+
+    for uid in failed:
+        messages.pop(uid, None)
+    for message in messages.values():
+        del message["_text_part"]
+    return messages
+
+
+def fetch_attachment(mail, mailbox, uid, attachment, uidvalidity=None):
+    """Télécharge et décode une seule pièce jointe (BODY.PEEK[section]) d'un message."""
+    current_uidvalidity, _ = _select(mail, mailbox)
+    if uidvalidity is not None and current_uidvalidity != uidvalidity:
+        raise RuntimeError("UIDVALIDITY a changé : la pièce jointe n'est plus adressable.")
+    status, data = mail.uid("FETCH", str(uid), f"(UID BODY.PEEK[{attachment['section']}])")
+    if status != "OK":
+        raise RuntimeError(f"Téléchargement de la pièce jointe '{attachment['filename']}' impossible.")
+    attributes = parse_fetch_response(data).get(uid, {})
+    raw = next((value for name, value in attributes.items() if name.startswith(b"BODY[")), b"")
+    return decode_transfer_encoding(raw, attachment["encoding"])
+
+
+# --- Synchronisation ---
+
+def _load_state(conn, mailbox):
+    row = conn.execute("SELECT uidvalidity, last_uid FROM imap_sync_state WHERE mailbox = ?", (mailbox,)).fetchone()
+    return (row[0], row[1]) if row else (None, 0)
+
+
+def _response_int(mail, code):
+    """Lit un code de réponse numérique (UIDVALIDITY, UIDNEXT) reçu lors du SELECT."""
+    _, data = mail.response(code)
+    if data and data[0] is not None:
+        try:
+            return int(data[0])
+        except (TypeError, ValueError):
+            return None
+    return None
+
+
+def _select(mail, mailbox):
+    """Sélectionne la boîte en lecture seule et retourne (UIDVALIDITY, UIDNEXT)."""
+    status, _ = mail.select(mailbox, readonly=True)
+    if status != 'OK':
+        raise RuntimeError(f"Sélection de la boîte '{mailbox}' impossible.")
+    uidvalidity = _response_int(mail, 'UIDVALIDITY')
+    uidnext = _response_int(mail, 'UIDNEXT')
+    if uidvalidity is None or uidnext is None:
+        status, data = mail.status(mailbox, '(UIDVALIDITY UIDNEXT)')
+        if status == 'OK' and data and data[0]:
+            text = data[0].decode(errors='ignore')
+            match = re.search(r"UIDVALIDITY (\d+)", text)
+            uidvalidity = uidvalidity or (int(match.group(1)) if match else None)
+            match = re.search(r"UIDNEXT (\d+)", text)
+            uidnext = uidnext or (int(match.group(1)) if match else None)
+    if uidvalidity is None:
+        raise RuntimeError(f"Le serveur n'a pas fourni UIDVALIDITY pour '{mailbox}'.")
+    return uidvalidity, uidnext
+
+
+def _search_uids(mail, first_uid, unseen_only):
+    """UID SEARCH sur l'intervalle first_uid:* (et éventuellement UNSEEN)."""
+    criteria = ['UID', f'{first_uid}:*']
+    if unseen_only:
+        criteria.insert(0, 'UNSEEN')
+    status, data = mail.uid('SEARCH', None, *criteria)
+    if status != 'OK' or not data or not data[0]:
+        return []
+    # "n:*" renvoie toujours au moins le plus grand UID, même s'il est inférieur à n.
+    return sorted(uid for uid in (int(x) for x in data[0].split()) if uid >= first_uid)
+
+
+def _initial_uids(mail, uidnext, window, unseen_only):
+    """
+    Premier passage (ou UIDVALIDITY modifié) : on ne cherche que les `window` derniers UID,
+    en élargissant l'intervalle seulement si la boîte contient des trous (messages supprimés).
+    """
+    if not uidnext:
+        return _search_uids(mail, 1, unseen_only)[-window:]
+    span = window * 2
+    while True:
+        first_uid = max(1, uidnext - span)
+        uids = _search_uids(mail, first_uid, unseen_only)
+        if len(uids) >= window or first_uid == 1:
+            return uids[-window:]
+        span *= 4
+
+
+def sync_mailbox(mail, mailbox='inbox', unseen_only=None):
+    """
+    Met à jour le cache local de la boîte et retourne la liste des UID nouvellement récupérés.
+    `mail` est une connexion IMAP déjà authentifiée.
+    """
+    if unseen_only is None:
+        unseen_only = config.IMAP_SYNC_UNSEEN_ONLY
+    uidvalidity, uidnext = _select(mail, mailbox)
+
+    conn = _connect()
+    known_uidvalidity, last_uid = _load_state(conn, mailbox)
+    if known_uidvalidity != uidvalidity:
+        if known_uidvalidity is not None:
+            print(f"Agent E-mail: UIDVALIDITY de '{mailbox}' modifié, resynchronisation complète.")
+        with conn:
+            conn.execute("DELETE FROM imap_messages WHERE mailbox = ?", (mailbox,))
+        new_uids = _initial_uids(mail, uidnext, config.IMAP_INITIAL_SYNC_COUNT, unseen_only)
+        last_uid = 0
+    elif uidnext is not None and uidnext <= last_uid + 1:
+        new_uids = []
+    else:
+        new_uids = _search_uids(mail, last_uid + 1, unseen_only)
+
+    failed = set()
+    messages = fetch_messages(mail, new_uids, failed)
+    with conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO imap_messages "
+            "(mailbox, uid, header, body_text, body_subtype, body_truncated, attachments) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(mailbox, uid, sqlite3.Binary(message["header"]), message["body_text"], message["body_subtype"],
+              int(message["body_truncated"]), json.dumps(message["attachments"], ensure_ascii=False))
+             for uid, message in messages.items()]
+        )
+        new_last_uid = max([last_uid, *messages.keys()])
+        if failed:
+            # Le dernier UID vu ne dépasse pas un lot en échec : il sera redemandé au prochain passage.
+            new_last_uid = min(new_last_uid, min(failed) - 1)
+        conn.execute(
+            "INSERT OR REPLACE INTO imap_sync_state (mailbox, uidvalidity, last_uid, synced_at) "
+            "VALUES (?, ?, ?, CURRENT_TIMESTAMP)",
+            (mailbox, uidvalidity, new_last_uid)
+        )
+        conn.execute(
+            "DELETE FROM imap_messages WHERE mailbox = ? AND uid NOT IN "
+            "(SELECT uid FROM imap_messages WHERE mailbox = ? ORDER BY uid DESC LIMIT ?)",
+            (mailbox, mailbox, config.IMAP_LOCAL_CACHE_SIZE)
+        )
+    return sorted(messages)
+
+
+def _rows_to_messages(rows, mailbox, uidvalidity):
+    return [{
+        "uid": row["uid"],
+        "mailbox": mailbox,
+        "uidvalidity": uidvalidity,
+        "header": bytes(row["header"]),
+        "body_text": row["body_text"] or "",
+        "body_subtype": row["body_subtype"],
+        "body_truncated": bool(row["body_truncated"]),
+        "attachments": json.loads(row["attachments"] or "[]"),
+    } for row in rows]
+
+
+def get_latest_messages(mailbox='inbox', max_count=5):
+    """
+    Retourne les `max_count` messages les plus récents du cache local, du plus récent au plus ancien.
+    Chaque message est un dict : uid, mailbox, uidvalidity, header (bytes), body_text,
+    body_subtype ('plain' / 'html'), body_truncated, attachments (références PDF).
+    """
+    conn = _connect()
+    uidvalidity = _load_state(conn, mailbox)[0]
+    rows = conn.execute(
+        "SELECT * FROM imap_messages WHERE mailbox = ? ORDER BY uid DESC LIMIT ?",
+        (mailbox, max_count)
+    ).fetchall()
+    return _rows_to_messages(rows, mailbox, uidvalidity)
+
+
+def get_messages(mailbox, uids):
+    """Retourne les messages du cache local correspondant aux UID donnés (ordre croissant)."""
+    uids = list(uids)
+    if not uids:
+        return []
+    conn = _connect()
+    uidvalidity = _load_state(conn, mailbox)[0]
+    placeholders = ",".join("?" for _ in uids)
+    rows = conn.execute(
+        f"SELECT * FROM imap_messages WHERE mailbox = ? AND uid IN ({placeholders}) ORDER BY uid",
+        (mailbox, *uids)
+    ).fetchall()
+    return _rows_to_messages(rows, mailbox, uidvalidity)
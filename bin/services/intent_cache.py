@@ -0,0 +1,127 @@
+# services/intent_cache.py
+
+import json
+import re
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime
+import config
+from services.database import get_connection
+
+# Cache LRU des intentions analysées par le LLM, indexé par (demande normalisée, date du jour).
+# Les entités relatives ("demain", "vendredi") dépendent de la date : toutes les entrées
+# expirent donc à minuit, en mémoire comme dans data/memory.db.
+
+_cache = OrderedDict()
+_cache_day = None
+_lock = threading.Lock()
+
+stats = {"hits": 0, "misses": 0, "llm_seconds_saved": 0.0}
+
+
+def normalize_query(user_query):
+    """Minuscules, espaces normalisés, ponctuation finale retirée."""
+    text = unicodedata.normalize("NFC", user_query or "").replace("’", "'").lower()
+    text = re.sub(r"\s+", " ", text).strip()
+    return text.rstrip(" .!?;,")
+
+
+def _today():
+    return datetime.now().strftime("%Y-%m-%d")
+
+
+MIGRATIONS = [
+    (1, [
+        '''
+        CREATE TABLE IF NOT EXISTS intent_cache (
+            query TEXT NOT NULL,
+            day TEXT NOT NULL,
+            parsed TEXT NOT NULL,
+            llm_seconds REAL DEFAULT 0,
+            PRIMARY KEY (query, day)
+        )
+        ''',
+    ]),
+]
+
+
+def _connect():
+    return get_connection(config.MEMORY_DB_PATH, "intent_cache", MIGRATIONS)
+
+
+def _roll_day():
+    """Vide le cache si la date a changé depuis le dernier accès (expiration à minuit)."""
+    global _cache_day
+    today = _today()
+    if _cache_day == today:
+        return
+    _cache.clear()
+    _cache_day = today
+    if not config.INTENT_CACHE_PERSIST:
+        return
+    try:
+        conn = _connect()
+        with conn:
+            conn.execute("DELETE FROM intent_cache WHERE day <> ?", (today,))
+            rows = conn.execute(
+                "SELECT query, parsed, llm_seconds FROM intent_cache WHERE day = ? ORDER BY rowid DESC LIMIT ?",
+                (today, config.INTENT_CACHE_SIZE)
+            ).fetchall()
+        for query, parsed, llm_seconds in reversed(rows):
+            _cache[query] = (json.loads(parsed), llm_seconds or 0.0)
+    except sqlite3.Error as e:
+        print(f"[Intent Cache] Lecture du cache persistant impossible : {e}")
+
+
+def get_cached_intent(user_query):
+    """Retourne une copie de l'intention en cache pour cette demande, ou None."""
+    key = normalize_query(user_query)
+    with _lock:
+        _roll_day()
+        entry = _cache.get(key)
+        if entry is None:
+            stats["misses"] += 1
+            return None
+        _cache.move_to_end(key)
+        stats["hits"] += 1
+        stats["llm_seconds_saved"] += entry[1]
+        return dict(entry[0])
+
+
+def store_intent(user_query, parsed, llm_seconds=0.0):
+    """Enregistre l'intention produite par le LLM pour la journée en cours."""
+    if not parsed:
+        return
+    key = normalize_query(user_query)
+    with _lock:
+        _roll_day()
+        _cache[key] = (dict(parsed), llm_seconds)
+        _cache.move_to_end(key)
+        while len(_cache) > config.INTENT_CACHE_SIZE:
+            _cache.popitem(last=False)
+        day = _cache_day
+
+    if not config.INTENT_CACHE_PERSIST:
+        return
+    try:
+        conn = _connect()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO intent_cache (query, day, parsed, llm_seconds) VALUES (?, ?, ?, ?)",
+                (key, day, json.dumps(parsed, ensure_ascii=False), llm_seconds)
+            )
+    except sqlite3.Error as e:
+        print(f"[Intent Cache] Écriture du cache persistant impossible : {e}")
+
+
+def get_cache_stats():
+    """Compteurs de succès/échecs et temps LLM économisé (en secondes)."""
+    with _lock:
+        total = stats["hits"] + stats["misses"]
+        return {
+            **stats,
+            "size": len(_cache),
+            "hit_rate": stats["hits"] / total if total else 0.0,
+        }
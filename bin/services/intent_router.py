@@ -0,0 +1,282 @@
+# services/intent_router.py
+
+import re
+import unicodedata
+from datetime import datetime, timedelta
+
+# Routeur déterministe placé devant le LLM : il reconnaît les commandes courantes
+# (verbe + objet en français) et en extrait les entités sans appeler Mistral.
+# Chaque règle renvoie une confiance ; en dessous du seuil défini dans config,
+# le manager laisse la main au LLM.
+
+MONTHS = {
+    "janvier": 1, "fevrier": 2, "mars": 3, "avril": 4, "mai": 5, "juin": 6,
+    "juillet": 7, "aout": 8, "septembre": 9, "octobre": 10, "novembre": 11, "decembre": 12,
+}
+WEEKDAYS = {
+    "lundi": 0, "mardi": 1, "mercredi": 2, "jeudi": 3, "vendredi": 4, "samedi": 5, "dimanche": 6,
+}
+STATUS_PATTERNS = [
+    (r"\b(termine(e|es|s)?|fini(e|es|s)?|fait(e|es|s)?|acheve(e|es|s)?)\b", "terminé"),
+    (r"\ben cours\b", "en cours"),
+    (r"\ba faire\b", "à faire"),
+]
+
+_MONTH_ALT = "|".join(MONTHS)
+_WEEKDAY_ALT = "|".join(WEEKDAYS)
+_DATE_EXPR = (
+    r"(?:(?:le |pour le |pour |d'ici |avant le |avant )?"
+    r"(?:apres-demain|apres demain|aujourd'hui|ce soir|demain"
+    r"|dans \d+ jours?"
+    rf"|(?:{_WEEKDAY_ALT})(?: prochain)?"
+    rf"|(?:{_WEEKDAY_ALT} )?\d{{1,2}}(?:er)? (?:{_MONTH_ALT})(?: \d{{4}})?"
+    r"|\d{1,2}/\d{1,2}(?:/\d{2,4})?"
+    r"|\d{4}-\d{2}-\d{2}))"
+)
+
+_TASK_WORD = r"(?:la |une |ma |cette )?(?:nouvelle )?taches?"
+_EVENT_WORD = r"(?:l'|un |le |mon |cet |ce |la )?(?:evenement|rendez-vous|rdv|reunion)"
+# Négation juste avant un statut ("non terminées", "pas encore faites", "ne sont plus en cours").
+_NEGATION = r"\b(?:non|pas|pas encore|jamais|plus)[\s-]+$"
+# Reste d'une suppression d'événement qui ne désigne aucun titre ("de demain", "de 14h", "prévu lundi").
+_GENERIC_EVENT_REST = (rf"^(?:(?:de |du |d'|prevue? |prevus? )?(?:{_DATE_EXPR}|ce matin|cet apres-midi)?"
+                       r"(?:\s*(?:a |de )?\d{1,2}(?:h\d{0,2}|:\d{2}))?)?$")
+# Indices qu'un ajout concerne l'agenda : mot de l'agenda ou heure ("à 14h", "10h30").
+_AGENDA_HINT = r"\b(?:evenements?|rendez-vous|rdv|reunions?|agenda|calendrier|\d{1,2}h(?:\d{2})?|\d{1,2}:\d{2})\b"
+
+
+def fold(text):
+    """
+    Met le texte en minuscules et retire les accents en conservant la longueur,
+    pour que les positions trouvées sur le texte replié restent valables sur l'original.
+    """
+    folded = []
+    for char in unicodedata.normalize("NFC", text):
+        base = unicodedata.normalize("NFD", char)[0].lower()
+        folded.append(base[0] if base else char)
+    return "".join(folded).replace("’", "'")
+
+
+def parse_relative_date(expression, today=None):
+    """Convertit une expression de date française (demain, 25 décembre, 12/03...) au format AAAA-MM-JJ."""
+    today = today or datetime.now()
+    expr = fold(expression).strip()
+    expr = re.sub(r"^(le |pour le |pour |d'ici |avant le |avant )", "", expr)
+
+    if expr in ("aujourd'hui", "ce soir"):
+        return today.strftime("%Y-%m-%d")
+    if expr in ("apres-demain", "apres demain"):
+        return (today + timedelta(days=2)).strftime("%Y-%m-%d")
+    if expr == "demain":
+        return (today + timedelta(days=1)).strftime("%Y-%m-%d")
+
+    match = re.fullmatch(r"dans (\d+) jours?", expr)
+    if match:
+        return (today + timedelta(days=int(match.group(1)))).strftime("%Y-%m-%d")
+
+    match = re.fullmatch(rf"({_WEEKDAY_ALT})(?: prochain)?", expr)
+    if match:
+        delta = (WEEKDAYS[match.group(1)] - today.weekday()) % 7 or 7
+        return (today + timedelta(days=delta)).strftime("%Y-%m-%d")
+
+    match = re.fullmatch(rf"(?:(?:{_WEEKDAY_ALT}) )?(\d{{1,2}})(?:er)? ({_MONTH_ALT})(?: (\d{{4}}))?", expr)
+    if match:
+        day, month, year = int(match.group(1)), MONTHS[match.group(2)], match.group(3)
+        return _build_date(today, day, month, int(year) if year else None)
+
+    match = re.fullmatch(r"(\d{1,2})/(\d{1,2})(?:/(\d{2,4}))?", expr)
+    if match:
+        day, month, year = int(match.group(1)), int(match.group(2)), match.group(3)
+        if year and len(year) == 2:
+            year = "20" + year
+        return _build_date(today, day, month, int(year) if year else None)
+
+    match = re.fullmatch(r"(\d{4})-(\d{2})-(\d{2})", expr)
+    if match:
+        return _build_date(today, int(match.group(3)), int(match.group(2)), int(match.group(1)))
+
+    return None
+
+
+def _build_date(today, day, month, year=None):
+    """Construit la date ; sans année explicite, une date déjà passée est reportée à l'année suivante."""
+    try:
+        candidate = datetime(year or today.year, month, day)
+    except ValueError:
+        return None
+    if year is None and candidate.date() < today.date():
+        try:
+            candidate = candidate.replace(year=today.year + 1)
+        except ValueError:
+            return None
+    return candidate.strftime("%Y-%m-%d")
+
+
+def _clean_summary(original, start, end):
+    """Extrait le titre depuis le texte original (accents et casse conservés) et retire les guillemets."""
+    summary = original[start:end].strip(" \t,.;:!?")
+    quoted = re.search(r"[\"'«“‘]\s*(.+?)\s*[\"'»”’]$", summary)
+    if quoted and summary[0] in "\"'«“‘":
+        summary = quoted.group(1)
+    return summary.strip() or None
+
+
+def _extract_status(folded_text):
+    """Statut mentionné et s'il est nié ("tâches non terminées") : (statut ou None, nié)."""
+    for pattern, status in STATUS_PATTERNS:
+        match = re.search(pattern, folded_text)
+        if match:
+            return status, bool(re.search(_NEGATION, folded_text[:match.start()]))
+    return None, False
+
+
+def _extract_priority(folded_text):
+    if re.search(r"\b(urgente?s?|prioritaires?|critiques?|haute priorite)\b", folded_text):
+        return 1
+    if re.search(r"\b(importante?s?|moyenne?s?)\b", folded_text):
+        return 2
+    return 3
+
+
+def _split_trailing_date(original, folded_text, start, end):
+    """
+    Cherche une expression de date en fin de segment [start, end).
+    Retourne (fin du titre, date AAAA-MM-JJ ou None, date_trouvee).
+    """
+    segment = folded_text[start:end]
+    match = re.search(rf"\s+{_DATE_EXPR}\s*$", segment)
+    if not match:
+        return end, None, False
+    date = parse_relative_date(original[start + match.start():start + match.end()])
+    return start + match.start(), date, True
+
+
+def _route_add_task(original, folded_text):
+    match = re.match(rf"^(?:ajoute|ajouter|cree|creer|note|noter|rajoute)\s+{_TASK_WORD}\s*"
+                     r"(?:(?:urgente|importante|prioritaire|normale|moyenne)\s+)?(?::\s*)?", folded_text)
+    if not match:
+        return None
+    summary_end, date, has_date = _split_trailing_date(original, folded_text, match.end(), len(folded_text))
+    summary = _clean_summary(original, match.end(), summary_end)
+    if not summary:
+        return {"intent": "add_task"}, 0.4
+    parsed = {"intent": "add_task", "summary": summary, "priority": _extract_priority(folded_text[:match.end()])}
+    if date:
+        parsed["date"] = date
+    # Une date mentionnée mais non comprise : on laisse le LLM trancher.
+    return parsed, 0.5 if has_date and not date else 0.95
+
+
+def _route_update_task(original, folded_text):
+    match = re.match(rf"^(?:passe|passer|mets|mettre|marque|marquer|change|changer)\s+{_TASK_WORD}\s+", folded_text)
+    if not match:
+        return None
+    tail = re.search(r"\s+(?:au statut|a l'etat|en statut|comme|en|a)\s+(termine(?:e)?|fini(?:e)?|faite?|en cours|a faire)\s*$",
+                     folded_text)
+    if not tail or tail.start() <= match.end():
+        return {"intent": "update_task_status"}, 0.4
+    summary = _clean_summary(original, match.end(), tail.start())
+    status, _ = _extract_status(tail.group(1))
+    return {"intent": "update_task_status", "summary": summary, "status": status}, 0.95 if summary else 0.5
+
+
+def _route_delete_task(original, folded_text):
+    match = re.match(rf"^(?:supprime|supprimer|efface|effacer|retire|retirer|enleve|enlever)\s+{_TASK_WORD}\s*", folded_text)
+    if not match:
+        return None
+    summary = _clean_summary(original, match.end(), len(original))
+    return ({"intent": "delete_task", "summary": summary}, 0.95) if summary else ({"intent": "delete_task"}, 0.4)
+
+
+def _route_delete_event(original, folded_text):
+    match = re.match(r"^(?:supprime|supprimer|efface|effacer|annule|annuler|retire|retirer)\s+"
+                     r"(?:l'|un |le |mon |cet |ce |la )?(?:(evenement|rendez-vous|rdv)|(reunion))\b\s*", folded_text)
+    if not match:
+        return None
+    rest = folded_text[match.end():].strip(" \t,.;:!?")
+    if not rest or re.match(_GENERIC_EVENT_REST, rest):
+        # "annule le rdv", "supprime la réunion de demain" : aucun titre, le LLM (ou la sélection) tranche.
+        return {"intent": "delete_event"}, 0.4
+    # "réunion" fait en général partie du titre ("Réunion budget") ; "rendez-vous", "rdv" et
+    # "événement" ne désignent que le type d'élément.
+    start = match.start(2) if match.group(2) else match.end()
+    summary = _clean_summary(original, start, len(original))
+    return {"intent": "delete_event", "summary": summary}, 0.95
+
+
+def _route_add_event(original, folded_text):
+    match = re.match(r"^(?:ajoute|ajouter|planifie|planifier|programme|programmer|cree|creer|note|noter)\s+"
+                     r"(?:(?:l'|un |le )(?:evenement|rendez-vous)\s*)?(?:a l'agenda\s*)?", folded_text)
+    if not match:
+        return None
+    summary_end, date, has_date = _split_trailing_date(original, folded_text, match.end(), len(folded_text))
+    summary = _clean_summary(original, match.end(), summary_end)
+    if not summary:
+        return None
+    if not has_date:
+        # "ajoute X" sans date ni mot-clé d'agenda est ambigu (tâche ? événement ?).
+        return {"intent": "add_event", "summary": summary}, 0.3
+    if not date:
+        return {"intent": "add_event", "summary": summary}, 0.5
+    parsed = {"intent": "add_event", "summary": summary, "date": date}
+    # Un verbe générique ("note", "crée", "ajoute") suivi d'une date ne suffit pas : "note de frais à
+    # faire demain" n'est pas un rendez-vous. Il faut un mot de l'agenda ou une heure, sinon le LLM tranche.
+    if not re.match(r"^(?:planifie|planifier|programme|programmer)\b", folded_text) and \
+            not re.search(_AGENDA_HINT, folded_text):
+        return parsed, 0.6
+    return parsed, 0.9
+
+
+def _route_listing(folded_text):
+    if re.search(r"\b(recommandations?|conseils?|suggestions?|par quoi (je )?commence|que (puis|peux)-je faire"
+                 r"|qu'est[- ]ce que je (peux|pourrais|dois) faire|sur quoi (je )?(peux )?avancer)\b", folded_text):
+        if re.search(r"\b(urgent|urgente|urgences?|aujourd'hui|du jour|ce jour)\b", folded_text):
+            return {"intent": "get_urgent_recommendation"}, 0.9
+        return {"intent": "get_general_recommendation"}, 0.9
+    if re.search(r"\b(urgent|urgente|urgences?)\b", folded_text) and \
+            re.search(r"\b(faire|aujourd'hui|du jour|ai|j'ai)\b", folded_text) and \
+            not re.search(rf"\b{_TASK_WORD}\b", folded_text):
+        return {"intent": "get_urgent_recommendation"}, 0.9
+
+    read_verb = r"(?:montre|montrer|affiche|afficher|liste|lister|donne|voir|vois|consulte|consulter|quelles? sont|ouvre)"
+    if re.search(r"\b(analyse|analyser|lis|lire|verifie|verifier|check|trie|trier|resume|resumer|releve|relever|"
+                 r"montre|affiche|consulte)\b.*\b(e-?mails?|mails?|courriels?|boite)\b", folded_text):
+        return {"intent": "get_emails"}, 0.95
+    if re.search(r"^(mes |les )?(nouveaux )?(e-?mails?|mails?|courriels?)\s*$", folded_text):
+        return {"intent": "get_emails"}, 0.85
+    if re.search(rf"\b{read_verb}\b.*\b(agenda|calendrier|planning|evenements?|rendez-vous|rdv)\b", folded_text) or \
+            re.search(r"^(mon |l')?(agenda|calendrier|planning)\s*$", folded_text):
+        return {"intent": "get_agenda"}, 0.95
+    if re.search(rf"\b{read_verb}\b.*\btaches\b", folded_text) or re.search(r"^(mes |les )?taches\b", folded_text):
+        parsed = {"intent": "get_tasks"}
+        status, negated = _extract_status(folded_text)
+        if negated:
+            # "non terminées" : les tâches ouvertes, qui sont la liste par défaut. Une autre négation
+            # ("pas en cours") n'a pas de filtre équivalent : le LLM tranche.
+            return parsed, 0.95 if status == "terminé" else 0.5
+        if status:
+            parsed["status"] = status
+        return parsed, 0.95
+    return None
+
+
+def route_intent(user_query):
+    """
+    Tente de résoudre la demande par des règles (verbe + objet).
+    Retourne un tuple (commande, confiance) ; commande vaut None si aucune règle ne s'applique.
+    """
+    original = re.sub(r"\s+", " ", unicodedata.normalize("NFC", user_query or "")).strip()
+    folded_text = fold(original)
+    if not folded_text:
+        return None, 0.0
+
+    best = (None, 0.0)
+    for rule in (_route_add_task, _route_update_task, _route_delete_task, _route_delete_event, _route_add_event):
+        result = rule(original, folded_text)
+        if result and result[1] > best[1]:
+            best = result
+    if best[1] < 0.9:
+        result = _route_listing(folded_text)
+        if result and result[1] > best[1]:
+            best = result
+    return best
@@ -1,44 +1,296 @@
 # services/mistral_service.py
 
-from llama_cpp import Llama
 import config
+import hashlib
 import json
+import os
+import pickle
 import re
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
 
 
-llm = Llama(
-    model_path=config.MODEL_PATH,
-    n_gpu_layers=-1,
-    n_ctx=4096,
-    n_batch=512,
-    flash_attn=True,
-    verbose=True
-)
+# Le modèle GGUF n'est plus construit à l'import : il est chargé à la demande (get_llm)
+# ou préchargé en arrière-plan (warm_up_model) pendant que la console ou la GUI démarre.
+_PROCESS_START = time.perf_counter()
+_llm = None
+_llm_error = None
+_llm_ready = threading.Event()
+_llm_loader = None
+_llm_loader_lock = threading.Lock()
+model_timings = {"startup_seconds": None, "load_seconds": None, "ready_seconds": None}
 
-def call_mistral(prompt: str, max_token = 500) -> str:
+
+def _load_model():
+    global _llm, _llm_error
+    load_start = time.perf_counter()
+    try:
+        from llama_cpp import Llama
+        _llm = Llama(
+            model_path=config.MODEL_PATH,
+            n_gpu_layers=-1,
+            n_ctx=config.N_CTX,
+            n_batch=512,
+            flash_attn=True,
+            verbose=True
+        )
+        model_timings["load_seconds"] = time.perf_counter() - load_start
+        model_timings["ready_seconds"] = time.perf_counter() - _PROCESS_START
+        print(f"Modèle Mistral chargé en {model_timings['load_seconds']:.1f} s "
+              f"(prêt {model_timings['ready_seconds']:.1f} s après le démarrage).")
+    except Exception as e:
+        _llm_error = e
+        print(f"Erreur lors du chargement du modèle Mistral : {e}")
+    finally:
+        _llm_ready.set()
+
+
+def warm_up_model():
+    """Lance le chargement du modèle dans un thread d'arrière-plan, sans bloquer l'appelant."""
+    global _llm_loader
+    with _llm_loader_lock:
+        if _llm_loader is None:
+            _llm_loader = threading.Thread(target=_load_model, name="mistral-warmup", daemon=True)
+            _llm_loader.start()
+
+
+def get_llm():
+    """Retourne le modèle, en attendant la fin de son chargement si nécessaire."""
+    if not _llm_ready.is_set():
+        warm_up_model()
+        _llm_ready.wait()
+    if _llm is None:
+        raise RuntimeError(f"Le modèle Mistral n'a pas pu être chargé : {_llm_error}")
+    return _llm
+
+
+def is_model_ready() -> bool:
+    return _llm is not None
+
+
+def mark_startup_complete():
+    """Enregistre le temps de démarrage de l'interface (indépendamment du chargement du modèle)."""
+    model_timings["startup_seconds"] = time.perf_counter() - _PROCESS_START
+    return model_timings["startup_seconds"]
+
+# Le modèle n'est pas ré-entrant : un seul appel à la fois (console, GUI et threads d'arrière-plan).
+_llm_lock = threading.RLock()
+
+
+def try_reserve_llm():
+    """
+    Réserve le modèle s'il est libre, sans attendre (travaux d'arrière-plan qui doivent céder la place
+    aux demandes de l'utilisateur). Retourne True si la réservation a réussi ; libérer par release_llm().
+    """
+    return _llm_lock.acquire(blocking=False)
+
+
+def release_llm():
+    _llm_lock.release()
+
+# États du modèle (cache KV) sauvegardés juste après un préfixe de prompt statique.
+# Clé : empreinte du modèle + du texte du préfixe. Valeur : {"state", "hits", "n_tokens"}.
+_prefix_states = OrderedDict()
+prefix_cache_stats = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "tokens_reused": 0}
+
+
+def _prefix_key(prefix: str) -> str:
+    return hashlib.sha256(f"{config.MODEL_PATH}\n{config.N_CTX}\n{prefix}".encode("utf-8")).hexdigest()
+
+
+def _prefix_disk_path(key: str) -> str:
+    return os.path.join(config.PREFIX_CACHE_DIR, f"{key}.state")
+
+
+def _evict_prefix_states(keep: str):
+    """Retire les préfixes les moins utilisés (puis les plus anciens) au-delà de la limite."""
+    while len(_prefix_states) > config.PREFIX_CACHE_MAX_ENTRIES:
+        # L'OrderedDict est trié du moins récent au plus récent : min() garde le plus ancien à égalité.
+        candidates = [k for k in _prefix_states if k != keep]
+        victim = min(candidates, key=lambda k: _prefix_states[k]["hits"])
+        del _prefix_states[victim]
+        prefix_cache_stats["evictions"] += 1
+
+
+def _load_prefix_state(key: str):
+    if not config.PREFIX_CACHE_ON_DISK:
+        return None
+    path = _prefix_disk_path(key)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "rb") as f:
+            return pickle.load(f)
+    except Exception as e:
+        print(f"Cache de préfixe illisible ({path}), il sera recalculé : {e}")
+        return None
+
+
+def _save_prefix_state(key: str, state):
+    if not config.PREFIX_CACHE_ON_DISK:
+        return
+    try:
+        os.makedirs(config.PREFIX_CACHE_DIR, exist_ok=True)
+        tmp_path = _prefix_disk_path(key) + ".tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, _prefix_disk_path(key))
+    except Exception as e:
+        print(f"Impossible d'écrire le cache de préfixe sur disque : {e}")
+
+
+def _restore_prefix(prefix: str):
+    """
+    Place le modèle dans l'état correspondant au préfixe déjà évalué.
+    Lors de l'appel suivant, llama.cpp détecte le préfixe commun et n'évalue que la suite du prompt.
+    Doit être appelé avec _llm_lock acquis.
+    """
+    llm = get_llm()
+    key = _prefix_key(prefix)
+    entry = _prefix_states.get(key)
+    if entry is None:
+        state = _load_prefix_state(key)
+        if state is not None:
+            prefix_cache_stats["disk_hits"] += 1
+            llm.load_state(state)
+        else:
+            prefix_cache_stats["misses"] += 1
+            tokens = llm.tokenize(prefix.encode("utf-8"), special=True)
+            llm.reset()
+            llm.eval(tokens)
+            state = llm.save_state()
+            _save_prefix_state(key, state)
+        entry = {"state": state, "hits": 0, "n_tokens": state.n_tokens}
+        _prefix_states[key] = entry
+        _evict_prefix_states(keep=key)
+    else:
+        prefix_cache_stats["hits"] += 1
+        llm.load_state(entry["state"])
+        _prefix_states.move_to_end(key)
+    entry["hits"] += 1
+    prefix_cache_stats["tokens_reused"] += entry["n_tokens"]
+
+
+def call_mistral(prompt: str, max_token = 500, prefix: str = None, grammar=None) -> str:
     """
     Fonction générique pour appeler le modèle Mistral local.
     Prend un prompt en entrée et retourne la réponse textuelle brute.
+    Si `prefix` est fourni (partie statique du prompt : instructions, exemples), le prompt
+    réel est prefix + prompt et l'état du modèle après le préfixe est réutilisé d'un appel à l'autre.
+    `grammar` (LlamaGrammar) contraint le décodage ; la génération s'arrête dès la fin de la grammaire.
+    `prompt` peut aussi être une liste de tokens déjà calculée (sans `prefix`).
     """
     try:
-        output = llm(
-            prompt,
-            max_tokens=max_token,
-            stop=["[INST]", "USER:"],
-            echo=False
-        )
+        llm = get_llm()
+        with _llm_lock:
+            if prefix:
+                _restore_prefix(prefix)
+                prompt = prefix + prompt
+            output = llm(
+                prompt,
+                max_tokens=max_token,
+                stop=["[INST]", "USER:"],
+                echo=False,
+                grammar=grammar
+            )
         response_text = output["choices"][0]["text"].strip()
         return response_text
     except Exception as e:
         print(f"Erreur lors de l'appel au modèle Mistral : {e}")
         return ""
 
-def get_json_from_mistral(prompt: str) -> dict:
+def stream_mistral(prompt: str, max_token = 500, prefix: str = None):
+    """
+    Variante de call_mistral en flux : générateur qui produit le texte morceau par morceau
+    dès que les tokens sont décodés. Le modèle reste verrouillé jusqu'à la fin du flux.
+    """
+    try:
+        llm = get_llm()
+        with _llm_lock:
+            if prefix:
+                _restore_prefix(prefix)
+                prompt = prefix + prompt
+            started = False
+            for chunk in llm(
+                prompt,
+                max_tokens=max_token,
+                stop=["[INST]", "USER:"],
+                echo=False,
+                stream=True
+            ):
+                text = chunk["choices"][0]["text"]
+                if not started:
+                    text = text.lstrip()
+                    if not text:
+                        continue
+                    started = True
+                yield text
+    except Exception as e:
+        print(f"Erreur lors de l'appel au modèle Mistral : {e}")
+
+@lru_cache(maxsize=16)
+def _grammar_from_schema(schema_json: str):
+    """Compile (une seule fois par schéma) une grammaire llama.cpp à partir d'un schéma JSON."""
+    from llama_cpp import LlamaGrammar
+    return LlamaGrammar.from_json_schema(schema_json, verbose=False)
+
+
+def _schema_max_chars(schema: dict) -> int:
+    """Longueur maximale (en caractères) d'une valeur JSON conforme au schéma."""
+    if "enum" in schema:
+        return max(len(json.dumps(value, ensure_ascii=False)) for value in schema["enum"])
+    schema_type = schema.get("type")
+    if schema_type == "object":
+        total = 2
+        for name, sub_schema in schema.get("properties", {}).items():
+            total += len(json.dumps(name, ensure_ascii=False)) + 2 + _schema_max_chars(sub_schema)
+        return total
+    if schema_type == "string":
+        if schema.get("format") == "date":
+            return 12
+        return schema.get("maxLength", 200) + 2
+    if schema_type == "integer":
+        return 12
+    if schema_type == "boolean":
+        return 5
+    return 32
+
+
+def max_tokens_for_schema(schema: dict) -> int:
+    """
+    Plafond de génération déduit du schéma : un token couvre au moins un caractère, plus une marge
+    pour les espaces que la grammaire autorise entre les éléments.
+    """
+    n_properties = len(schema.get("properties", {}))
+    return _schema_max_chars(schema) + 4 * n_properties + 8
+
+
+def get_json_from_mistral(prompt: str, prefix: str = None, schema: dict = None) -> dict:
     """
     Appelle Mistral, attend une réponse contenant du JSON, l'extrait et la parse.
     Retourne un dictionnaire Python.
+    Avec `schema`, le décodage est contraint par une grammaire générée depuis ce schéma JSON :
+    la sortie est directement l'objet attendu et la génération s'arrête à l'accolade fermante.
     """
-    raw_text = call_mistral(prompt)
+    if schema:
+        try:
+            grammar = _grammar_from_schema(json.dumps(schema, ensure_ascii=False))
+        except Exception as e:
+            print(f"Grammaire JSON indisponible, génération libre : {e}")
+        else:
+            raw_text = call_mistral(prompt, max_token=max_tokens_for_schema(schema), prefix=prefix, grammar=grammar)
+            if not raw_text:
+                return None
+            try:
+                return json.loads(raw_text)
+            except json.JSONDecodeError as e:
+                print(f"Erreur: JSON contraint invalide (réponse tronquée ?). Erreur: {e}")
+                print(f"Réponse reçue:\n{raw_text}")
+                return None
+
+    raw_text = call_mistral(prompt, prefix=prefix)
     if not raw_text:
         return None
 
@@ -56,4 +308,69 @@ def get_json_from_mistral(prompt: str) -> dict:
             return None
 
     print("Aucun objet JSON n'a été trouvé dans la réponse.")
-    return None
\ No newline at end of file
+    return None
+
+
+# --- Embeddings ---
+# Le contexte de génération (créé sans embedding=True) ne peut pas produire d'embeddings :
+# un second contexte llama.cpp est ouvert sur le fichier config.EMBEDDING_MODEL_PATH (par défaut
+# le même GGUF, mappé en mémoire : les poids ne sont pas chargés deux fois), avec un pooling moyen.
+_embedder = None
+_embedder_error = None
+_embedder_lock = threading.Lock()
+_embedder_loader = None
+
+
+def get_embedder():
+    """Retourne le modèle d'embedding, chargé à la première utilisation (None s'il est indisponible)."""
+    global _embedder, _embedder_error
+    with _embedder_lock:
+        if _embedder is None and _embedder_error is None:
+            try:
+                from llama_cpp import Llama, LLAMA_POOLING_TYPE_MEAN
+                _embedder = Llama(
+                    model_path=config.EMBEDDING_MODEL_PATH,
+                    embedding=True,
+                    pooling_type=LLAMA_POOLING_TYPE_MEAN,
+                    n_gpu_layers=config.EMBEDDING_GPU_LAYERS,
+                    n_ctx=config.EMBEDDING_N_CTX,
+                    n_batch=config.EMBEDDING_N_CTX,
+                    verbose=False
+                )
+            except Exception as e:
+                _embedder_error = e
+                print(f"Modèle d'embedding indisponible : {e}")
+        return _embedder
+
+
+def warm_up_embedder():
+    """Lance le chargement du modèle d'embedding dans un thread d'arrière-plan, sans bloquer l'appelant."""
+    global _embedder_loader
+    with _llm_loader_lock:
+        if _embedder is None and _embedder_error is None and _embedder_loader is None:
+            _embedder_loader = threading.Thread(target=get_embedder, name="embedding-warmup", daemon=True)
+            _embedder_loader.start()
+
+
+def is_embedder_ready() -> bool:
+    return _embedder is not None
+
+
+def embed_texts(texts, timeout=None):
+    """
+    Vecteurs (listes de float) des textes donnés, dans l'ordre ; None si le modèle est indisponible.
+    Avec `timeout` (secondes), l'appel ne charge pas le modèle et n'attend pas plus longtemps qu'il
+    se libère (indexation en cours) : None si le modèle n'est pas chargé ou reste occupé.
+    """
+    if timeout is None:
+        embedder = get_embedder()
+    else:
+        embedder = _embedder
+    if embedder is None:
+        return None
+    if not _embedder_lock.acquire(timeout=-1 if timeout is None else timeout):
+        return None
+    try:
+        return embedder.embed(list(texts), truncate=True)
+    finally:
+        _embedder_lock.release()
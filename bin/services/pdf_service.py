@@ -0,0 +1,107 @@
+# services/pdf_service.py
+
+import hashlib
+import sqlite3
+import fitz
+import config
+from services.database import get_connection
+
+# Extraction du texte des pièces jointes PDF :
+# - budget de pages et de caractères (un PDF de 300 pages n'est jamais lu en entier) ;
+# - pages produites au fil de l'eau (iter_pdf_pages) ;
+# - résultat mis en cache dans data/memory.db par empreinte SHA-256 du contenu.
+# Avec au plus PDF_MAX_PAGES pages, un pool de processus coûterait plus (démarrage, copie du PDF
+# dans chaque processus) que l'extraction séquentielle qu'il remplacerait.
+
+MIGRATIONS = [
+    (1, [
+        '''
+        CREATE TABLE IF NOT EXISTS pdf_text_cache (
+            sha256 TEXT NOT NULL,
+            max_pages INTEGER NOT NULL,
+            max_chars INTEGER NOT NULL,
+            text TEXT NOT NULL,
+            page_count INTEGER NOT NULL,
+            extracted_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (sha256, max_pages, max_chars)
+        )
+        ''',
+    ]),
+]
+
+
+def _connect():
+    return get_connection(config.MEMORY_DB_PATH, "pdf_service", MIGRATIONS)
+
+
+def _get_cached_text(file_hash, max_pages, max_chars):
+    conn = _connect()
+    try:
+        row = conn.execute(
+            "SELECT text FROM pdf_text_cache WHERE sha256 = ? AND max_pages = ? AND max_chars = ?",
+            (file_hash, max_pages, max_chars)
+        ).fetchone()
+        return row[0] if row else None
+    except sqlite3.Error:
+        return None
+
+
+def _store_text(file_hash, max_pages, max_chars, text, page_count):
+    conn = _connect()
+    try:
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO pdf_text_cache (sha256, max_pages, max_chars, text, page_count) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (file_hash, max_pages, max_chars, text, page_count)
+            )
+            conn.execute(
+                "DELETE FROM pdf_text_cache WHERE rowid NOT IN "
+                "(SELECT rowid FROM pdf_text_cache ORDER BY extracted_at DESC, rowid DESC LIMIT ?)",
+                (config.PDF_CACHE_MAX_ENTRIES,)
+            )
+    except sqlite3.Error as e:
+        print(f"      -> Impossible d'enregistrer le texte du PDF en cache : {e}")
+
+
+def iter_pdf_pages(pdf_data, max_pages=None):
+    """Générateur : produit le texte de chaque page, dans l'ordre, sans dépasser max_pages."""
+    max_pages = max_pages or config.PDF_MAX_PAGES
+    with fitz.open(stream=pdf_data, filetype="pdf") as doc:
+        for page_number in range(min(doc.page_count, max_pages)):
+            yield doc[page_number].get_text()
+
+
+def extract_pdf_text(pdf_data, max_pages=None, max_chars=None):
+    """
+    Retourne le texte d'un PDF, limité à max_pages pages et max_chars caractères
+    (par défaut PDF_MAX_PAGES / PDF_MAX_CHARS). Un PDF déjà lu n'est jamais reparsé.
+    """
+    max_pages = max_pages or config.PDF_MAX_PAGES
+    max_chars = max_chars or config.PDF_MAX_CHARS
+    file_hash = hashlib.sha256(pdf_data).hexdigest()
+    cached = _get_cached_text(file_hash, max_pages, max_chars)
+    if cached is not None:
+        print("      -> Texte du PDF déjà extrait (cache local).")
+        return cached
+
+    parts = []
+    total = 0
+    pages_read = 0
+    with fitz.open(stream=pdf_data, filetype="pdf") as doc:
+        page_count = doc.page_count
+        for page_number in range(min(page_count, max_pages)):
+            text = doc[page_number].get_text()
+            pages_read += 1
+            if total + len(text) >= max_chars:
+                parts.append(text[:max_chars - total])
+                total = max_chars
+                break
+            parts.append(text)
+            total += len(text)
+
+    pdf_text = "\n".join(parts)
+    if total >= max_chars or pages_read < page_count:
+        pdf_text += f"\n[... PDF tronqué : {pages_read} page(s) lue(s) sur {page_count} ...]"
+    _store_text(file_hash, max_pages, max_chars, pdf_text, page_count)
+    return pdf_text
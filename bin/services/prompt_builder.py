@@ -0,0 +1,116 @@
+# services/prompt_builder.py
+
+from functools import lru_cache
+import config
+from services.mistral_service import get_llm
+
+# Assemblage de prompts sous budget de tokens.
+# Un prompt est une suite de sections nommées, chacune avec une priorité (0 = indispensable) et
+# éventuellement un plafond de tokens. Le budget total est N_CTX moins la génération attendue :
+# les sections sont servies par ordre de priorité, puis réassemblées dans leur ordre d'ajout.
+# Chaque texte n'est tokenisé qu'une fois ; les parties fixes (instructions) le sont une fois pour toutes.
+
+
+def _tokenize(text):
+    return get_llm().tokenize(text.encode("utf-8", errors="ignore"), add_bos=False)
+
+
+@lru_cache(maxsize=128)
+def _static_tokens(text):
+    return tuple(_tokenize(text))
+
+
+def tokenize(text):
+    """Tokens d'un texte, à mémoriser par l'appelant pour un texte variable mais réutilisé (voir PromptBuilder.add)."""
+    return tuple(_tokenize(text))
+
+
+def count_tokens(text, static=False):
+    """Nombre de tokens d'un texte ; `static` mémorise le résultat (texte fixe réutilisé)."""
+    return len(_static_tokens(text)) if static else len(_tokenize(text))
+
+
+def _truncate(text, tokens, limit, marker):
+    """Coupe `text` (déjà tokenisé) à `limit` tokens, marqueur compris."""
+    if len(tokens) <= limit:
+        return text
+    keep = limit - len(_static_tokens(marker))
+    if keep <= 0:
+        return ""
+    return get_llm().detokenize(tokens[:keep]).decode("utf-8", errors="ignore") + marker
+
+
+class PromptBuilder:
+    """Construit un prompt qui tient dans config.N_CTX en laissant `max_new_tokens` pour la réponse."""
+
+    TRUNCATION_MARKER = " [...]"
+
+    def __init__(self, max_new_tokens, n_ctx=None):
+        self.budget = (n_ctx or config.N_CTX) - max_new_tokens - config.PROMPT_SAFETY_MARGIN
+        self.sections = []
+        self.truncated = set()
+
+    def reserve(self, text):
+        """Décompte un texte fixe envoyé séparément (préfixe mis en cache par mistral_service)."""
+        self.budget -= count_tokens(text, static=True) + 1  # + BOS
+
+    def add(self, name, text, priority=0, max_tokens=None, static=False, tokens=None):
+        """
+        Ajoute une section de texte, tronquée si son budget ne suffit pas.
+        `tokens` : tokens de `text` déjà calculés (obtenus par tokenize), le texte n'est alors pas retokenisé.
+        """
+        if tokens is None:
+            tokens = _static_tokens(text) if static else _tokenize(text)
+        self.sections.append({"name": name, "priority": priority, "max_tokens": max_tokens,
+                              "text": text, "tokens": tokens, "items": None})
+
+    def add_items(self, name, items, priority=0, max_tokens=None, item_max_tokens=None, empty_text=""):
+        """
+        Ajoute une section composée d'éléments (un e-mail, un événement...) : on en garde autant
+        que le budget le permet, dans l'ordre, chacun plafonné à `item_max_tokens`.
+        """
+        tokenized = [(item, _tokenize(item)) for item in items]
+        self.sections.append({"name": name, "priority": priority, "max_tokens": max_tokens,
+                              "text": empty_text, "tokens": _static_tokens(empty_text) if empty_text else (),
+                              "items": tokenized, "item_max_tokens": item_max_tokens})
+
+    def _fit_items(self, section, allowance):
+        parts, used = [], 0
+        item_cap = section["item_max_tokens"]
+        for index, (item, tokens) in enumerate(section["items"]):
+            limit = min(len(tokens), item_cap) if item_cap else len(tokens)
+            if used + limit > allowance:
+                # Jamais le texte « vide » ici : les éléments existent, ils n'ont simplement pas tenu.
+                omitted = len(section["items"]) - index
+                self.truncated.add(section["name"])
+                note = f"[{omitted} élément(s) omis (contexte plein)]\n"
+                if used + count_tokens(note, static=True) <= allowance:
+                    parts.append(note)
+                    used += count_tokens(note, static=True)
+                break
+            text = _truncate(item, tokens, limit, self.TRUNCATION_MARKER + "\n") if limit < len(tokens) else item
+            parts.append(text)
+            used += limit
+        return "".join(parts), used
+
+    def build(self):
+        """Retourne le prompt assemblé ; les sections raccourcies sont listées dans self.truncated."""
+        self.truncated = set()
+        remaining = self.budget
+        rendered = {}
+        for index in sorted(range(len(self.sections)), key=lambda i: self.sections[i]["priority"]):
+            section = self.sections[index]
+            allowance = max(0, remaining)
+            if section["max_tokens"] is not None:
+                allowance = min(allowance, section["max_tokens"])
+            if section["items"] is not None and section["items"]:
+                text, used = self._fit_items(section, allowance)
+            else:
+                text, used = section["text"], len(section["tokens"])
+                if used > allowance:
+                    text = _truncate(text, list(section["tokens"]), allowance, self.TRUNCATION_MARKER)
+                    used = allowance
+                    self.truncated.add(section["name"])
+            rendered[index] = text
+            remaining -= used
+        return "".join(rendered[index] for index in range(len(self.sections)))
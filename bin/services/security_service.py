@@ -1,72 +1,292 @@
 # services/security_service.py
 
 import requests
+from requests.adapters import HTTPAdapter
 import config
 import time
 import hashlib
+import functools
+import heapq
+import itertools
+import sqlite3
+import threading
+from concurrent.futures import Future, InvalidStateError, ThreadPoolExecutor
+from services.database import get_connection
 
-def _get_analysis_report(analysis_id, headers):
-    """Interroge le rapport d'analyse jusqu'à ce qu'il soit complété."""
-    url_analysis = f"https://www.virustotal.com/api/v3/analyses/{analysis_id}"
-    for _ in range(12):
-        response_analysis = requests.get(url_analysis, headers=headers, timeout=30)
-        response_analysis.raise_for_status()
-        result = response_analysis.json()
-        if result["data"]["attributes"]["status"] == "completed":
-            return result
-        time.sleep(10)
-    print("      -> L'analyse VirusTotal a pris trop de temps. Le fichier est considéré comme non sûr par précaution.")
-    return None
+# - Les verdicts sont mis en cache localement (data/memory.db) par empreinte SHA-256, avec une durée de validité.
+# - Toutes les requêtes passent par une session HTTP keep-alive partagée.
+# - Un seau à jetons respecte le quota de l'API publique (requêtes/minute), avec attente progressive sur 429.
+# - Aucune attente ne bloque un thread du pool : quota épuisé, 429 et analyses en cours sont replanifiés
+#   par un ordonnanceur, ce qui permet de scanner plusieurs pièces jointes en parallèle.
+# - Chaque scan se termine toujours : toute erreur (réseau, réponse inattendue) donne le verdict « non sûr ».
 
-def scan_file_with_virustotal(file_data: bytes):
+
+class _TokenBucket:
+    """Limiteur de débit : `rate_per_minute` jetons par minute, au plus `capacity` en réserve."""
+
+    def __init__(self, rate_per_minute, capacity):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self):
+        """Prend un jeton si possible ; sinon retourne le délai (en secondes) avant le prochain."""
+        with self.lock:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    def penalize(self):
+        """Après un 429, vide la réserve pour espacer les requêtes suivantes."""
+        with self.lock:
+            self.tokens = min(self.tokens, 0.0)
+            self.updated = time.monotonic()
+
+
+_rate_limiter = _TokenBucket(config.VIRUSTOTAL_REQUESTS_PER_MINUTE, config.VIRUSTOTAL_REQUESTS_PER_MINUTE)
+_session = None
+_session_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=config.VIRUSTOTAL_MAX_CONCURRENT_SCANS, thread_name_prefix="virustotal")
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+
+# Ordonnanceur des interrogations différées : (échéance, n°, fonction, arguments).
+_scheduled = []
+_scheduled_cond = threading.Condition()
+_scheduled_counter = itertools.count()
+_scheduler_thread = None
+
+
+def _get_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=2, pool_maxsize=config.VIRUSTOTAL_MAX_CONCURRENT_SCANS + 1)
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+            _session.headers.update({"x-apikey": config.VIRUSTOTAL_API_KEY or ""})
+        return _session
+
+
+def _send(future, method, path, kwargs, on_response, attempt=0):
     """
-    Envoie des données de fichier à l'API VirusTotal pour analyse et renvoie si le fichier est sûr.
-    Gère les fichiers déjà soumis.
+    Envoie une requête dans le respect du quota puis passe la réponse à on_response(response).
+    Quota épuisé ou 429 (quota dépassé) : la requête est replanifiée, avec une attente croissante sur 429.
+    Toute erreur, y compris dans on_response, termine le scan par le verdict « non sûr ».
     """
+    if future.done():
+        # Scan abandonné (délai dépassé) : plus aucune requête.
+        return
+    try:
+        wait = _rate_limiter.try_acquire()
+        if wait:
+            _schedule(wait, _send, future, method, path, kwargs, on_response, attempt)
+            return
+        response = _get_session().request(method, f"{config.VIRUSTOTAL_API_URL}{path}", **kwargs)
+        if response.status_code == 429 and attempt < config.VIRUSTOTAL_MAX_RETRIES:
+            _rate_limiter.penalize()
+            retry_after = response.headers.get("Retry-After")
+            wait = float(retry_after) if retry_after and retry_after.isdigit() else config.VIRUSTOTAL_BACKOFF_SECONDS * 2 ** attempt
+            print(f"      -> Quota VirusTotal atteint, nouvelle tentative dans {wait:.0f} s...")
+            _schedule(wait, _send, future, method, path, kwargs, on_response, attempt + 1)
+            return
+        on_response(response)
+    except Exception as e:
+        _fail(future, e)
+
+
+def _fail(future, error):
+    if isinstance(error, requests.exceptions.RequestException):
+        print(f"      -> Erreur de communication avec l'API VirusTotal : {error}")
+    elif isinstance(error, (KeyError, ValueError, TypeError)):
+        print(f"      -> Réponse VirusTotal inattendue : {error!r}")
+    else:
+        print(f"      -> Erreur inattendue pendant le scan VirusTotal : {error}")
+    _settle(future, False)
+
+
+def _settle(future, is_safe):
+    """Donne son verdict au scan, sauf s'il en a déjà un (délai dépassé côté appelant)."""
+    try:
+        future.set_result(is_safe)
+    except InvalidStateError:
+        pass
+
+
+# --- Cache des verdicts ---
+
+MIGRATIONS = [
+    (1, [
+        '''
+        CREATE TABLE IF NOT EXISTS virustotal_verdicts (
+            sha256 TEXT PRIMARY KEY,
+            is_safe INTEGER NOT NULL,
+            malicious_votes INTEGER NOT NULL,
+            checked_at REAL NOT NULL
+        )
+        ''',
+    ]),
+]
+
+
+def _connect():
+    return get_connection(config.MEMORY_DB_PATH, "security_service", MIGRATIONS)
+
+
+def get_cached_verdict(file_hash):
+    """Retourne True/False si un verdict encore valide est connu pour ce fichier, sinon None."""
+    conn = _connect()
+    try:
+        row = conn.execute(
+            "SELECT is_safe FROM virustotal_verdicts WHERE sha256 = ? AND checked_at >= ?",
+            (file_hash, time.time() - config.VIRUSTOTAL_CACHE_TTL)
+        ).fetchone()
+        return bool(row[0]) if row else None
+    except sqlite3.Error:
+        return None
+
+
+def _store_verdict(file_hash, is_safe, malicious_votes):
+    conn = _connect()
+    try:
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO virustotal_verdicts (sha256, is_safe, malicious_votes, checked_at) "
+                "VALUES (?, ?, ?, ?)",
+                (file_hash, int(is_safe), malicious_votes, time.time())
+            )
+    except sqlite3.Error as e:
+        print(f"      -> Impossible d'enregistrer le verdict VirusTotal : {e}")
+
+
+# --- Ordonnanceur ---
+
+def _scheduler_loop():
+    while True:
+        with _scheduled_cond:
+            while not _scheduled or _scheduled[0][0] > time.monotonic():
+                timeout = _scheduled[0][0] - time.monotonic() if _scheduled else None
+                _scheduled_cond.wait(timeout)
+            _, _, function, args = heapq.heappop(_scheduled)
+        _executor.submit(function, *args)
+
+
+def _schedule(delay, function, *args):
+    """Exécute function(*args) sur le pool après `delay` secondes, sans bloquer de thread entre-temps."""
+    global _scheduler_thread
+    with _scheduled_cond:
+        if _scheduler_thread is None:
+            _scheduler_thread = threading.Thread(target=_scheduler_loop, name="virustotal-scheduler", daemon=True)
+            _scheduler_thread.start()
+        heapq.heappush(_scheduled, (time.monotonic() + delay, next(_scheduled_counter), function, args))
+        _scheduled_cond.notify()
+
+
+# --- Analyse ---
+
+def _resolve(file_hash, future, stats):
+    malicious_votes = stats.get("malicious", 0) + stats.get("suspicious", 0)
+    print(f"      -> Rapport VirusTotal : {malicious_votes} détection(s) malveillante(s) ou suspecte(s).")
+    is_safe = malicious_votes == 0
+    _store_verdict(file_hash, is_safe, malicious_votes)
+    _settle(future, is_safe)
+
+
+def _poll_analysis(file_hash, analysis_id, future, attempt):
+    """Interroge une fois le rapport d'analyse (appelé par l'ordonnanceur)."""
+    _send(future, "GET", f"/analyses/{analysis_id}", {"timeout": 30},
+          functools.partial(_on_analysis, file_hash, analysis_id, future, attempt))
+
+
+def _on_analysis(file_hash, analysis_id, future, attempt, response):
+    """Rapport d'analyse reçu : verdict s'il est complété, sinon nouvelle interrogation plus tard."""
+    response.raise_for_status()
+    attributes = response.json()["data"]["attributes"]
+    if attributes["status"] == "completed":
+        _resolve(file_hash, future, attributes["stats"])
+    elif attempt + 1 >= config.VIRUSTOTAL_MAX_POLLS:
+        print("      -> L'analyse VirusTotal a pris trop de temps. Le fichier est considéré comme non sûr par précaution.")
+        _settle(future, False)
+    else:
+        _schedule(config.VIRUSTOTAL_POLL_INTERVAL, _poll_analysis, file_hash, analysis_id, future, attempt + 1)
+
+
+def _start_scan(file_hash, file_data, future):
+    _send(future, "GET", f"/files/{file_hash}", {"timeout": 30},
+          functools.partial(_on_file_report, file_hash, file_data, future))
+
+
+def _on_file_report(file_hash, file_data, future, response):
+    if response.status_code == 200:
+        print("      -> Un rapport existant a été trouvé pour ce fichier.")
+        _resolve(file_hash, future, response.json()["data"]["attributes"]["last_analysis_stats"])
+    elif response.status_code == 404:
+        print("      -> Aucun rapport existant. Envoi du fichier pour une nouvelle analyse.")
+        _send(future, "POST", "/files", {"files": {"file": (file_hash, file_data)}, "timeout": 60},
+              functools.partial(_on_upload, file_hash, future))
+    else:
+        response.raise_for_status()
+        _settle(future, False)
+
+
+def _on_upload(file_hash, future, response):
+    response.raise_for_status()
+    analysis_id = response.json()["data"]["id"]
+    _schedule(config.VIRUSTOTAL_POLL_INTERVAL, _poll_analysis, file_hash, analysis_id, future, 0)
+
+
+def scan_file_async(file_data: bytes) -> Future:
+    """
+    Lance l'analyse d'un fichier et retourne immédiatement un Future dont le résultat
+    indique si le fichier est sûr. Un même fichier n'est jamais soumis deux fois en parallèle.
+    """
+    future = Future()
     if not config.VIRUSTOTAL_API_KEY:
         print("      -> AVERTISSEMENT : Clé API VirusTotal non configurée. Le scan de sécurité est ignoré.")
-        return True
+        future.set_result(True)
+        return future
 
-    print("      -> Contact de l'API VirusTotal pour analyse de sécurité...")
-    headers = {"x-apikey": config.VIRUSTOTAL_API_KEY}
-    
     file_hash = hashlib.sha256(file_data).hexdigest()
-    url_check_report = f"https://www.virustotal.com/api/v3/files/{file_hash}"
+    cached = get_cached_verdict(file_hash)
+    if cached is not None:
+        print("      -> Verdict VirusTotal déjà connu pour ce fichier (cache local).")
+        future.set_result(cached)
+        return future
+
+    with _in_flight_lock:
+        if file_hash in _in_flight:
+            return _in_flight[file_hash]
+        _in_flight[file_hash] = future
+
+    def _forget(_):
+        with _in_flight_lock:
+            _in_flight.pop(file_hash, None)
 
+    future.add_done_callback(_forget)
+    print("      -> Contact de l'API VirusTotal pour analyse de sécurité...")
+    _executor.submit(_start_scan, file_hash, file_data, future)
+    return future
+
+
+def scan_file_with_virustotal(file_data: bytes):
+    """
+    Envoie des données de fichier à l'API VirusTotal pour analyse et renvoie si le fichier est sûr.
+    Gère les fichiers déjà soumis. Version bloquante de scan_file_async, bornée par VIRUSTOTAL_SCAN_TIMEOUT.
+    """
+    future = scan_file_async(file_data)
     try:
-        response_check = requests.get(url_check_report, headers=headers, timeout=30)
-        
-        analysis_result = None
-        
-        if response_check.status_code == 200:
-            print("      -> Un rapport existant a été trouvé pour ce fichier.")
-            analysis_id = response_check.json()["data"]["attributes"]["last_analysis_results"]
-            stats = response_check.json()["data"]["attributes"]["last_analysis_stats"]
-            analysis_result = {"data": {"attributes": {"stats": stats}}}
-
-        elif response_check.status_code == 404:
-            print("      -> Aucun rapport existant. Envoi du fichier pour une nouvelle analyse.")
-            url_upload = "https://www.virustotal.com/api/v3/files"
-            files = {"file": (file_hash, file_data)}
-            response_upload = requests.post(url_upload, headers=headers, files=files, timeout=60)
-            response_upload.raise_for_status()
-            analysis_id = response_upload.json()["data"]["id"]
-            analysis_result = _get_analysis_report(analysis_id, headers)
-        
-        else:
-            response_check.raise_for_status()
-
-        if not analysis_result:
-            return False
-
-        # 3. Vérifier les résultats
-        stats = analysis_result["data"]["attributes"]["stats"]
-        malicious_votes = stats.get("malicious", 0) + stats.get("suspicious", 0)
-        
-        print(f"      -> Rapport VirusTotal : {malicious_votes} détection(s) malveillante(s) ou suspecte(s).")
-
-        return malicious_votes == 0
-
-    except requests.exceptions.RequestException as e:
-        print(f"      -> Erreur de communication avec l'API VirusTotal : {e}")
+        return future.result(timeout=config.VIRUSTOTAL_SCAN_TIMEOUT)
+    except TimeoutError:
+        print("      -> Pas de verdict VirusTotal dans le délai imparti. Le fichier est considéré comme non sûr par précaution.")
+        _settle(future, False)
         return False
@@ -0,0 +1,199 @@
+# services/summarizer.py
+
+import hashlib
+import re
+import sqlite3
+from array import array
+from functools import lru_cache
+import config
+from services.database import get_connection
+from services.mistral_service import call_mistral, get_llm
+from services.email_analysis_store import get_model_id
+
+# Résumé map-reduce de textes plus longs que le contexte du modèle.
+# - Les morceaux sont dimensionnés d'après le budget réel (N_CTX - instructions - réponse).
+# - Le texte n'est tokenisé qu'une fois : les prompts sont assemblés directement en tokens.
+# - Les résumés partiels sont recombinés par niveaux tant qu'ils ne tiennent pas dans un seul prompt.
+# - Chaque résumé de morceau est mémorisé (data/memory.db) par empreinte de ses tokens : un fil
+#   qui cite des messages déjà résumés réutilise le travail existant.
+
+MAP_INSTRUCTION = "[INST]Résume le morceau de texte suivant de manière concise:\n\n"
+REDUCE_INSTRUCTION = "[INST]Combine les résumés partiels suivants en un seul résumé global et cohérent:\n\n"
+CLOSING = "[/INST]"
+_SEPARATOR = "\n\n"
+_MARGIN_TOKENS = 16
+
+# Début d'un message cité ou transféré : frontière de découpage, pour que le message cité
+# produise les mêmes morceaux (et donc les mêmes empreintes) que lorsqu'il a été résumé seul.
+_QUOTE_HEADER_RE = re.compile(
+    r"^(?:Le .{0,200} a écrit\s?:|On .{0,200} wrote:|-{2,}\s*(?:Message d'origine|Original Message|Message transféré|Forwarded message)\s*-{2,}|De\s?: .+|From: .+)\s*$",
+    re.IGNORECASE | re.MULTILINE
+)
+_QUOTE_PREFIX_RE = re.compile(r"^(?:> ?)+", re.MULTILINE)
+
+summary_stats = {"chunks": 0, "cache_hits": 0, "llm_calls": 0, "levels": 0}
+
+
+MIGRATIONS = [
+    (1, [
+        '''
+        CREATE TABLE IF NOT EXISTS summary_cache (
+            digest TEXT PRIMARY KEY,
+            summary TEXT NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+    ]),
+]
+
+
+def _connect():
+    return get_connection(config.MEMORY_DB_PATH, "summarizer", MIGRATIONS)
+
+
+def _digest(instruction, tokens):
+    """Empreinte d'un morceau : modèle + instruction + identifiants de tokens (sans détokeniser)."""
+    h = hashlib.sha256(f"{get_model_id()}\n{instruction}\n{config.SUMMARY_MAX_TOKENS}\n".encode("utf-8"))
+    h.update(array("i", tokens).tobytes())
+    return h.hexdigest()
+
+
+def _get_cached_summary(digest):
+    conn = _connect()
+    try:
+        row = conn.execute("SELECT summary FROM summary_cache WHERE digest = ?", (digest,)).fetchone()
+        return row[0] if row else None
+    except sqlite3.Error:
+        return None
+
+
+def _store_summary(digest, summary):
+    conn = _connect()
+    try:
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO summary_cache (digest, summary) VALUES (?, ?)", (digest, summary))
+    except sqlite3.Error as e:
+        print(f"      -> Impossible d'enregistrer le résumé en cache : {e}")
+
+
+def tokenize(text, add_bos=False):
+    return get_llm().tokenize(text.encode("utf-8", errors="ignore"), add_bos=add_bos)
+
+
+@lru_cache(maxsize=16)
+def _static_tokens(text, add_bos=False):
+    """Tokens des parties fixes des prompts, calculés une seule fois."""
+    return tuple(tokenize(text, add_bos=add_bos))
+
+
+def _chunk_budget(instruction):
+    """Nombre de tokens de contenu qui tiennent dans un prompt, réponse comprise."""
+    fixed = len(_static_tokens(instruction, add_bos=True)) + len(_static_tokens(CLOSING))
+    return config.N_CTX - fixed - config.SUMMARY_MAX_TOKENS - _MARGIN_TOKENS
+
+
+def _segments(text):
+    """
+    Découpe le texte après chaque en-tête de message cité et retire les marqueurs de citation '>'.
+    L'en-tête reste avec le texte qui le précède : le message cité commence seul son segment.
+    """
+    bounds = [0] + [match.end() for match in _QUOTE_HEADER_RE.finditer(text)] + [len(text)]
+    for start, stop in zip(bounds, bounds[1:]):
+        segment = _QUOTE_PREFIX_RE.sub("", text[start:stop]).strip()
+        if segment:
+            yield segment
+
+
+def plan_chunks(text, budget=None):
+    """
+    Retourne les morceaux (listes de tokens) à résumer : les paragraphes de chaque segment sont
+    regroupés tant qu'ils tiennent dans le budget ; un paragraphe trop long est coupé en tokens.
+    """
+    budget = budget or _chunk_budget(MAP_INSTRUCTION)
+    separator = list(_static_tokens(_SEPARATOR))
+    chunks = []
+    for segment in _segments(text):
+        current = []
+        for paragraph in re.split(r"\n\s*\n", segment):
+            if not paragraph.strip():
+                continue
+            tokens = tokenize(paragraph)
+            while len(tokens) > budget:
+                if current:
+                    chunks.append(current)
+                    current = []
+                chunks.append(tokens[:budget])
+                tokens = tokens[budget:]
+            if current and len(current) + len(separator) + len(tokens) > budget:
+                chunks.append(current)
+                current = []
+            current = current + separator + tokens if current else tokens
+        if current:
+            chunks.append(current)
+    return chunks
+
+
+def _summarize_tokens(instruction, tokens):
+    """Résume un morceau déjà tokenisé ; le prompt est assemblé en tokens, sans repasser par le texte."""
+    summary_stats["chunks"] += 1
+    digest = _digest(instruction, tokens)
+    cached = _get_cached_summary(digest)
+    if cached is not None:
+        summary_stats["cache_hits"] += 1
+        return cached
+    prompt = list(_static_tokens(instruction, add_bos=True)) + list(tokens) + list(_static_tokens(CLOSING))
+    summary_stats["llm_calls"] += 1
+    summary = call_mistral(prompt, max_token=config.SUMMARY_MAX_TOKENS)
+    if summary:
+        _store_summary(digest, summary)
+    return summary
+
+
+def _group(token_lists, budget):
+    """Regroupe des résumés successifs (en tokens) en lots qui tiennent dans le budget (au moins deux par lot)."""
+    separator = list(_static_tokens(_SEPARATOR))
+    groups, current = [], []
+    for tokens in token_lists:
+        tokens = tokens[:budget // 2]
+        if len(current) >= 2 and sum(len(t) + len(separator) for t in current) + len(tokens) > budget:
+            groups.append(current)
+            current = []
+        current.append(tokens)
+    if current:
+        groups.append(current)
+    joined = []
+    for group in groups:
+        merged = list(group[0])
+        for tokens in group[1:]:
+            merged += separator + list(tokens)
+        joined.append(merged)
+    return joined
+
+
+def summarize(text):
+    """
+    Résume un texte de longueur quelconque. Étape map : un résumé par morceau ;
+    étape reduce : les résumés sont combinés par lots, niveau après niveau, jusqu'à un seul.
+    """
+    chunks = plan_chunks(text)
+    if not chunks:
+        return ""
+    print(f"      -> Résumé par morceaux : {len(chunks)} morceau(x) à traiter...")
+    summaries = []
+    for i, chunk in enumerate(chunks):
+        print(f"      -> Résumé du morceau {i+1}/{len(chunks)}...")
+        summary = _summarize_tokens(MAP_INSTRUCTION, chunk)
+        if summary:
+            summaries.append(summary)
+    if not summaries:
+        return "Résumé impossible à générer."
+
+    reduce_budget = _chunk_budget(REDUCE_INSTRUCTION)
+    level = 0
+    while len(summaries) > 1:
+        level += 1
+        groups = _group([tokenize(summary) for summary in summaries], reduce_budget)
+        print(f"      -> Combinaison des résumés (niveau {level}, {len(summaries)} -> {len(groups)})...")
+        summaries = [s for s in (_summarize_tokens(REDUCE_INSTRUCTION, group) for group in groups) if s]
+    summary_stats["levels"] = max(summary_stats["levels"], level)
+    return summaries[0] if summaries else "Résumé impossible à générer."
@@ -0,0 +1,286 @@
+# services/user_profile.py
+
+import re
+import threading
+from datetime import date, datetime
+from email.utils import parseaddr
+import config
+from services.database import get_connection
+from services.mistral_service import call_mistral
+from services.prompt_builder import count_tokens, tokenize
+
+# Profil de l'utilisateur, conservé dans data/memory.db et mis à jour au fil de l'eau :
+# - compteurs par catégorie (expéditeurs fréquents, heures et jours de rendez-vous, priorité et
+#   ponctualité des tâches terminées), incrémentés par chaque nouvel e-mail analysé, tâche terminée
+#   ou événement ; chaque élément n'est compté qu'une fois (table profile_observations, purgée une
+#   fois par jour des éléments vus il y a plus de PROFILE_OBSERVATIONS_MAX_AGE_DAYS jours) ;
+# - faits durables (habitudes, préférences) réécrits par le LLM à partir du résumé de conversation.
+# Le condensé injecté dans les prompts a une taille bornée (PROFILE_DIGEST_MAX_TOKENS) ; il n'est
+# recalculé que lorsque le profil a changé. Il change au fil des e-mails et des tâches : il est donc
+# placé dans la partie variable des prompts, après les préfixes fixes dont l'état du modèle est
+# réutilisé (mistral_service), pour ne pas les invalider à chaque mise à jour du profil.
+
+WEEKDAYS = ("lundi", "mardi", "mercredi", "jeudi", "vendredi", "samedi", "dimanche")
+PRIORITY_LABELS = {1: "haute", 2: "moyenne", 3: "basse"}
+
+FACTS_INSTRUCTION = (
+    "[INST]Tu tiens à jour la liste des faits durables sur l'utilisateur d'un assistant personnel "
+    "(habitudes, préférences, personnes et projets importants). À partir des faits actuels et du "
+    f"résumé de conversation ci-dessous, réécris la liste : au plus {config.PROFILE_MAX_FACTS} faits "
+    "courts, un par ligne, chacun commençant par « - ». N'invente rien.\n\n"
+)
+
+MIGRATIONS = [
+    (1, [
+        '''
+        CREATE TABLE IF NOT EXISTS profile_counters (
+            category TEXT NOT NULL,
+            key TEXT NOT NULL,
+            label TEXT,
+            count INTEGER NOT NULL DEFAULT 0,
+            last_seen DATETIME DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (category, key)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS profile_observations (
+            source TEXT NOT NULL,
+            ref TEXT NOT NULL,
+            seen_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (source, ref)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS profile_facts (
+            position INTEGER PRIMARY KEY,
+            fact TEXT NOT NULL
+        )
+        ''',
+    ]),
+    (2, [
+        "CREATE INDEX IF NOT EXISTS idx_profile_observations_seen_at ON profile_observations (seen_at)",
+    ]),
+]
+
+_lock = threading.Lock()
+_version = 0
+_digest_cache = {"version": -1, "text": "", "tokens": None}
+_observations_pruned_on = None
+
+
+def _connect():
+    return get_connection(config.MEMORY_DB_PATH, "user_profile", MIGRATIONS)
+
+
+def _first_observation(conn, source, ref):
+    """True si l'élément n'avait jamais été pris en compte (et le marque comme vu)."""
+    _prune_observations(conn)
+    cursor = conn.execute("INSERT OR IGNORE INTO profile_observations (source, ref) VALUES (?, ?)", (source, str(ref)))
+    return cursor.rowcount == 1
+
+
+def _prune_observations(conn):
+    """
+    Oublie, une fois par jour, les éléments vus il y a plus de PROFILE_OBSERVATIONS_MAX_AGE_DAYS jours :
+    la table ne grandit plus indéfiniment (un élément aussi ancien n'est plus renvoyé par les sources).
+    """
+    global _observations_pruned_on
+    today = date.today()
+    with _lock:
+        if _observations_pruned_on == today:
+            return
+        _observations_pruned_on = today
+    conn.execute("DELETE FROM profile_observations WHERE seen_at < datetime('now', ?)",
+                 (f"-{int(config.PROFILE_OBSERVATIONS_MAX_AGE_DAYS)} days",))
+
+
+def _increment(conn, category, key, label=None):
+    conn.execute(
+        "INSERT INTO profile_counters (category, key, label, count) VALUES (?, ?, ?, 1) "
+        "ON CONFLICT (category, key) DO UPDATE SET count = count + 1, "
+        "label = COALESCE(excluded.label, label), last_seen = CURRENT_TIMESTAMP",
+        (category, key, label)
+    )
+
+
+def _prune(conn, categories):
+    """Ne garde que les valeurs les plus fréquentes de chaque catégorie : le profil reste compact."""
+    for category in categories:
+        conn.execute(
+            "DELETE FROM profile_counters WHERE category = ? AND key NOT IN ("
+            "SELECT key FROM profile_counters WHERE category = ? ORDER BY count DESC, last_seen DESC LIMIT ?)",
+            (category, category, config.PROFILE_MAX_KEYS_PER_CATEGORY)
+        )
+
+
+def _changed():
+    global _version
+    with _lock:
+        _version += 1
+
+
+# --- Mises à jour incrémentales ---
+
+def record_email(message_key, sender, importance=None):
+    """Prend en compte un e-mail nouvellement analysé (expéditeur, importance)."""
+    name, address = parseaddr(sender or "")
+    address = address.lower() or (sender or "").strip()
+    if not address:
+        return
+    conn = _connect()
+    with conn:
+        if not _first_observation(conn, "email", message_key):
+            return
+        _increment(conn, "sender", address, name or None)
+        if isinstance(importance, int) and importance >= 4:
+            _increment(conn, "sender_important", address, name or None)
+        _prune(conn, ("sender", "sender_important"))
+    _changed()
+
+
+def record_completed_tasks(tasks):
+    """Prend en compte des tâches terminées (dictionnaires id, priority, due_date)."""
+    now = datetime.now()
+    counted = False
+    conn = _connect()
+    with conn:
+        for task in tasks:
+            if not _first_observation(conn, "task_done", task['id']):
+                continue
+            counted = True
+            _increment(conn, "task_priority", str(task.get('priority')))
+            due_date = task.get('due_date')
+            if not due_date:
+                timing = "sans échéance"
+            else:
+                try:
+                    timing = "avant l'échéance" if now <= datetime.strptime(due_date, '%Y-%m-%d %H:%M:%S') else "après l'échéance"
+                except (TypeError, ValueError):
+                    timing = "sans échéance"
+            _increment(conn, "task_timing", timing)
+    if counted:
+        _changed()
+
+
+def record_events(calendar_id, events):
+    """Prend en compte des événements de l'agenda (heure et jour des rendez-vous avec horaire)."""
+    counted = False
+    conn = _connect()
+    with conn:
+        for event in events:
+            start = event.get('start', {}).get('dateTime')
+            if not start or event.get('status') == 'cancelled':
+                continue
+            if not _first_observation(conn, "event", f"{calendar_id}/{event['id']}"):
+                continue
+            counted = True
+            start_dt = datetime.fromisoformat(start.replace('Z', '+00:00')).astimezone()
+            _increment(conn, "meeting_hour", f"{start_dt.hour:02d}")
+            _increment(conn, "meeting_weekday", WEEKDAYS[start_dt.weekday()])
+    if counted:
+        _changed()
+
+
+def update_facts(conversation_summary):
+    """Fait réécrire par le LLM la liste des faits durables à partir d'un résumé de conversation."""
+    if not conversation_summary:
+        return
+    facts = get_facts()
+    current = "\n".join(f"- {fact}" for fact in facts) or "(aucun)"
+    prompt = (f"{FACTS_INSTRUCTION}### FAITS ACTUELS ###\n{current}\n\n"
+              f"### RÉSUMÉ DE CONVERSATION ###\n{conversation_summary}\n[/INST]")
+    response = call_mistral(prompt, max_token=config.PROFILE_MAX_FACTS * 30)
+    new_facts = [re.sub(r"^\s*[-•*]\s*", "", line).strip() for line in response.splitlines()
+                 if re.match(r"^\s*[-•*]", line)]
+    new_facts = [fact for fact in new_facts if fact][:config.PROFILE_MAX_FACTS]
+    if not new_facts or new_facts == facts:
+        return
+    conn = _connect()
+    with conn:
+        conn.execute("DELETE FROM profile_facts")
+        conn.executemany("INSERT INTO profile_facts (position, fact) VALUES (?, ?)", list(enumerate(new_facts)))
+    _changed()
+
+
+# --- Lectures ---
+
+def get_facts():
+    return [row["fact"] for row in _connect().execute("SELECT fact FROM profile_facts ORDER BY position")]
+
+
+def _top(conn, category, limit):
+    return conn.execute(
+        "SELECT key, label, count FROM profile_counters WHERE category = ? ORDER BY count DESC, last_seen DESC LIMIT ?",
+        (category, limit)
+    ).fetchall()
+
+
+def _share(rows):
+    """Valeur dominante d'une catégorie et sa part, arrondie à 10 % (le condensé reste stable)."""
+    total = sum(row["count"] for row in rows)
+    if not total:
+        return None, 0
+    return rows[0]["key"], int(round(rows[0]["count"] * 10 / total)) * 10
+
+
+def _render():
+    """Lignes du condensé, de la plus à la moins utile (les faits d'abord)."""
+    conn = _connect()
+    lines = [f"- {fact}" for fact in get_facts()]
+    senders = _top(conn, "sender", 5)
+    if senders:
+        lines.append("- Expéditeurs fréquents : " + ", ".join(row["label"] or row["key"] for row in senders))
+    important = _top(conn, "sender_important", 3)
+    if important:
+        lines.append("- Expéditeurs souvent importants : " + ", ".join(row["label"] or row["key"] for row in important))
+    hours = _top(conn, "meeting_hour", 3)
+    days = _top(conn, "meeting_weekday", 2)
+    if hours:
+        lines.append("- Rendez-vous habituels : vers " + ", ".join(f"{int(row['key'])}h" for row in hours)
+                     + (", surtout le " + " et le ".join(row["key"] for row in days) if days else ""))
+    priority, share = _share(_top(conn, "task_priority", 3))
+    if priority:
+        label = PRIORITY_LABELS.get(int(priority), priority) if priority.isdigit() else priority
+        lines.append(f"- Tâches terminées : {share} % de priorité {label}")
+    timing, share = _share(_top(conn, "task_timing", 3))
+    if timing and timing != "sans échéance":
+        lines.append(f"- Tâches à échéance terminées le plus souvent {timing} ({share} %)")
+    return [line + "\n" for line in lines]
+
+
+def get_digest():
+    """Condensé du profil, tenu sous PROFILE_DIGEST_MAX_TOKENS ; recalculé seulement après une modification."""
+    with _lock:
+        version = _version
+        if _digest_cache["version"] == version:
+            return _digest_cache["text"]
+    lines, used = [], 0
+    for line in _render():
+        n_tokens = count_tokens(line)
+        if used + n_tokens > config.PROFILE_DIGEST_MAX_TOKENS:
+            break
+        lines.append(line)
+        used += n_tokens
+    text = "".join(lines)
+    with _lock:
+        _digest_cache.update(version=version, text=text, tokens=None)
+    return text
+
+
+def add_to_prompt(builder, priority=2):
+    """
+    Ajoute le condensé du profil à un PromptBuilder, comme section variable. Les tokens de la section
+    sont mémorisés avec le condensé : elle n'est retokenisée qu'après une modification du profil.
+    """
+    digest = get_digest()
+    if not digest:
+        return
+    section = f"\n### PROFIL DE L'UTILISATEUR ###\n{digest}"
+    with _lock:
+        tokens = _digest_cache["tokens"] if _digest_cache["text"] == digest else None
+    if tokens is None:
+        tokens = tokenize(section)
+        with _lock:
+            if _digest_cache["text"] == digest:
+                _digest_cache["tokens"] = tokens
+    builder.add("profil", section, priority=priority, tokens=tokens)
@@ -0,0 +1,19 @@
+# tests/conftest.py
+
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def isolated_storage(tmp_path, monkeypatch):
+    """Bases SQLite et index dans un dossier temporaire : les tests ne touchent jamais aux données réelles."""
+    monkeypatch.setattr(config, "DB_PATH", str(tmp_path / "tasks.db"))
+    monkeypatch.setattr(config, "MEMORY_DB_PATH", str(tmp_path / "memory.db"))
+    monkeypatch.setattr(config, "EMBEDDING_INDEX_DIR", str(tmp_path / "embeddings"))
+    monkeypatch.setattr(config, "EMBEDDING_ENABLED", False)
+    yield tmp_path
@@ -0,0 +1,189 @@
+# tests/test_calendar_mirror.py
+
+from types import SimpleNamespace
+import pytest
+import config
+from services import calendar_mirror
+import sqlite3
+from services.database import get_connection
+
+
+class GoneError(Exception):
+    """Erreur HTTP 410 telle que la lève googleapiclient (attribut resp.status)."""
+    resp = SimpleNamespace(status=410)
+
+
+class FakeRequest:
+    def __init__(self, run):
+        self._run = run
+
+    def execute(self):
+        return self._run()
+
+
+class FakeBatch:
+    def __init__(self, service, callback):
+        self.service = service
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, request_id):
+        self.requests.append((request_id, request))
+
+    def execute(self):
+        self.service.batches.append([request_id for request_id, _ in self.requests])
+        for request_id, request in self.requests:
+            try:
+                self.callback(request_id, request.execute(), None)
+            except Exception as e:
+                self.callback(request_id, None, e)
+
+
+class FakeCalendarService:
+    """API Calendar minimale : journal des modifications par agenda, syncToken = position dans le journal."""
+
+    def __init__(self, calendars):
+        self.log = {calendar_id: [] for calendar_id in calendars}
+        self.expired_tokens = set()
+        self.batches = []
+        self.list_calls = []
+        for calendar_id, events in calendars.items():
+            for event in events:
+                self.put(calendar_id, event)
+
+    def put(self, calendar_id, event):
+        self.log[calendar_id].append(dict(event))
+
+    def cancel(self, calendar_id, event_id):
+        self.log[calendar_id].append({"id": event_id, "status": "cancelled"})
+
+    def forget(self, calendar_id, event_id):
+        """Suppression sans trace dans le journal (seule une resynchronisation complète la voit)."""
+        self.log[calendar_id] = [event for event in self.log[calendar_id] if event["id"] != event_id]
+
+    def calendarList(self):
+        return SimpleNamespace(list=lambda fields=None: FakeRequest(lambda: {"items": [{"id": c} for c in self.log]}))
+
+    def events(self):
+        return SimpleNamespace(list=lambda **params: FakeRequest(lambda: self._list(**params)))
+
+    def new_batch_http_request(self, callback):
+        return FakeBatch(self, callback)
+
+    def _list(self, calendarId, maxResults, syncToken=None, pageToken=None, **_):
+        self.list_calls.append((calendarId, syncToken, pageToken))
+        if syncToken in self.expired_tokens:
+            raise GoneError("Sync token is no longer valid")
+        log = self.log[calendarId]
+        if syncToken:
+            changes = log[int(syncToken):]
+        else:
+            latest = {}
+            for event in log:
+                latest[event["id"]] = event
+            changes = [event for event in latest.values() if event.get("status") != "cancelled"]
+        offset = int(pageToken or 0)
+        response = {"items": changes[offset:offset + maxResults]}
+        if offset + maxResults < len(changes):
+            response["nextPageToken"] = str(offset + maxResults)
+        else:
+            response["nextSyncToken"] = str(len(log))
+        return response
+
+
+def _event(event_id, summary, day="2099-03-0%d", n=1):
+    return {"id": event_id, "summary": summary,
+            "start": {"dateTime": f"{day % n}T10:00:00+00:00"}, "end": {"dateTime": f"{day % n}T11:00:00+00:00"}}
+
+
+def _summaries(**kwargs):
+    return sorted(event["summary"] for event in calendar_mirror.get_upcoming_events(100, **kwargs))
+
+
+def test_incremental_sync_uses_sync_token(monkeypatch):
+    service = FakeCalendarService({"perso": [_event("a", "Dentiste", n=1), _event("b", "Banque", n=2)]})
+    assert calendar_mirror.sync_calendars(service) == 1
+    assert _summaries() == ["Banque", "Dentiste"]
+
+    service.put("perso", _event("c", "Réunion budget", n=3))
+    service.cancel("perso", "a")
+    service.put("perso", dict(_event("b", "Banque (reporté)", n=4)))
+    calendar_mirror.sync_calendars(service)
+    assert _summaries() == ["Banque (reporté)", "Réunion budget"]
+    assert service.list_calls[-1] == ("perso", "2", None)
+    assert [event["summary"] for event in calendar_mirror.find_events("budg")] == ["Réunion budget"]
+    assert calendar_mirror.find_events("dentiste") == []
+
+
+def test_expired_sync_token_triggers_full_resync():
+    service = FakeCalendarService({"perso": [_event("a", "Dentiste", n=1), _event("b", "Banque", n=2)]})
+    calendar_mirror.sync_calendars(service)
+    service.forget("perso", "a")
+    service.expired_tokens.add("2")
+    assert calendar_mirror.sync_calendars(service) == 1
+    assert _summaries() == ["Banque"]
+    assert service.list_calls[-1] == ("perso", None, None)
+
+
+def test_calendars_are_batched_and_paginated(monkeypatch):
+    monkeypatch.setattr(calendar_mirror, "BATCH_LIMIT", 2)
+    monkeypatch.setattr(calendar_mirror, "PAGE_SIZE", 2)
+    service = FakeCalendarService({
+        "perso": [_event(f"p{i}", f"Perso {i}", n=i) for i in range(1, 6)],
+        "travail": [_event("t1", "Revue", n=1)],
+        "sport": [],
+    })
+    assert calendar_mirror.sync_calendars(service) == 3
+    assert service.batches == [["perso", "travail"], ["sport"]]
+    assert len(_summaries()) == 6
+    # Seul l'agenda qui avait plusieurs pages a demandé des pages supplémentaires hors lot.
+    assert [call for call in service.list_calls if call[2]] == [("perso", None, "2"), ("perso", None, "4")]
+
+
+def test_unsubscribed_calendar_is_removed():
+    service = FakeCalendarService({"perso": [_event("a", "Dentiste", n=1)], "partage": [_event("b", "Match", n=2)]})
+    calendar_mirror.sync_calendars(service)
+    del service.log["partage"]
+    calendar_mirror.sync_calendars(service)
+    assert _summaries() == ["Dentiste"]
+
+
+def test_full_text_index_survives_vacuum():
+    service = FakeCalendarService({"perso": [_event(f"e{i}", f"Événement {i}", n=i % 9 + 1) for i in range(20)]})
+    calendar_mirror.sync_calendars(service)
+    for i in range(0, 20, 2):
+        calendar_mirror.remove_event("perso", f"e{i}")
+    conn = get_connection(config.MEMORY_DB_PATH)
+    conn.execute("VACUUM")
+    found = calendar_mirror.find_events("Événement 7", upcoming_only=False)
+    assert [event["id"] for event in found] == ["e7"]
+    conn.execute("INSERT INTO calendar_events_fts (calendar_events_fts) VALUES ('integrity-check')")
+    columns = {row["name"]: row["pk"] for row in conn.execute("PRAGMA table_info(calendar_events)")}
+    assert columns["id"] == 1
+
+
+def test_pages_are_fetched_before_the_write_transaction(monkeypatch):
+    monkeypatch.setattr(calendar_mirror, "PAGE_SIZE", 2)
+    service = FakeCalendarService({"perso": [_event(f"p{i}", f"Perso {i}", n=i) for i in range(1, 6)]})
+    calendar_mirror.sync_calendars(service)
+    writable = []
+    list_page = service._list
+
+    def list_and_check_lock(**params):
+        if params.get("pageToken"):
+            other = sqlite3.connect(config.MEMORY_DB_PATH, timeout=0)
+            try:
+                other.execute("BEGIN IMMEDIATE")
+                other.execute("ROLLBACK")
+                writable.append(True)
+            except sqlite3.OperationalError:
+                writable.append(False)
+            finally:
+                other.close()
+        return list_page(**params)
+
+    monkeypatch.setattr(service, "_list", list_and_check_lock)
+    service.expired_tokens.add("5")
+    assert calendar_mirror.sync_calendars(service) == 1
+    assert writable == [True, True]
+    assert len(_summaries()) == 5
@@ -0,0 +1,73 @@
+# tests/test_context_snapshot.py
+
+import threading
+import pytest
+from agents import context_snapshot
+
+
+@pytest.fixture
+def sections(monkeypatch):
+    loads = []
+
+    def loader(name, value):
+        def load():
+            loads.append(name)
+            return value
+        return load
+
+    monkeypatch.setattr(context_snapshot, "SECTIONS", {
+        "emails": loader("emails", []),
+        "events": loader("events", {"upcoming": [], "today": [], "day": "2000-01-01"}),
+        "tasks": loader("tasks", []),
+    })
+    monkeypatch.setattr(context_snapshot, "_snapshot", None)
+    monkeypatch.setattr(context_snapshot, "_requested", set())
+    return loads
+
+
+def test_first_snapshot_is_built_immediately(sections):
+    snapshot = context_snapshot.get_snapshot()
+    assert sorted(sections) == ["emails", "events", "tasks"]
+    assert snapshot["version"] == 1
+
+
+def test_reads_do_not_wait_for_a_refresh_in_progress(sections):
+    first = context_snapshot.get_snapshot()
+    sections.clear()
+    acquired = context_snapshot._refresh_lock.acquire(timeout=5)
+    assert acquired
+    try:
+        result = []
+        reader = threading.Thread(target=lambda: result.append(context_snapshot.get_snapshot()))
+        reader.start()
+        reader.join(5)
+        assert result == [first]
+    finally:
+        context_snapshot._refresh_lock.release()
+    # Le jour a changé : les événements sont confiés au thread d'arrière-plan, rien n'est relu ici.
+    assert sections == []
+    assert context_snapshot._requested == {"events"}
+
+
+def test_task_changes_are_visible_immediately(sections, monkeypatch):
+    context_snapshot.get_snapshot()
+    monkeypatch.setitem(context_snapshot.SECTIONS, "tasks", lambda: [{"id": 1, "description": "rapport"}])
+    acquired = context_snapshot._refresh_lock.acquire(timeout=5)
+    assert acquired
+    try:
+        # Un rafraîchissement des e-mails est en cours : les tâches n'ont pas à l'attendre.
+        assert context_snapshot.refresh_tasks() == ["tasks"]
+    finally:
+        context_snapshot._refresh_lock.release()
+    assert context_snapshot.get_snapshot()["tasks"] == [{"id": 1, "description": "rapport"}]
+
+
+def test_an_older_load_does_not_overwrite_fresher_tasks(sections, monkeypatch):
+    context_snapshot.get_snapshot()
+    monkeypatch.setitem(context_snapshot.SECTIONS, "tasks", lambda: ["récent"])
+    context_snapshot.refresh_tasks()
+    with context_snapshot._lock:
+        context_snapshot._snapshot["taken_at"]["tasks"] += 60
+    monkeypatch.setitem(context_snapshot.SECTIONS, "tasks", lambda: ["ancien"])
+    context_snapshot.refresh_snapshot(["tasks"])
+    assert context_snapshot.get_snapshot()["tasks"] == ["récent"]
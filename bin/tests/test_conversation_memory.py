@@ -0,0 +1,97 @@
+# tests/test_conversation_memory.py
+
+import threading
+import pytest
+import config
+from services import conversation_memory, mistral_service, prompt_builder, user_profile
+
+compact = conversation_memory.compact
+
+
+class FakeTokenizer:
+    """Un token par mot : suffisant pour vérifier les budgets sans charger le modèle."""
+
+    def tokenize(self, data, add_bos=False):
+        return data.decode("utf-8").split()
+
+    def detokenize(self, tokens):
+        return " ".join(tokens).encode("utf-8")
+
+
+@pytest.fixture
+def memory(monkeypatch):
+    calls = []
+
+    def fake_call(prompt, max_token=500, **kwargs):
+        calls.append(prompt)
+        return "Résumé : l'utilisateur prépare son rapport."
+
+    monkeypatch.setattr(conversation_memory, "call_mistral", fake_call)
+    monkeypatch.setattr(prompt_builder, "get_llm", FakeTokenizer)
+    monkeypatch.setattr(conversation_memory, "is_model_ready", lambda: True)
+    prompt_builder._static_tokens.cache_clear()
+    monkeypatch.setattr(user_profile, "update_facts", lambda summary: calls.append("faits"))
+    monkeypatch.setattr(config, "CONVERSATION_WINDOW_TOKENS", 40)
+    # Le résumé d'arrière-plan lancé par add_turn est neutralisé : les tests appellent compact() eux-mêmes.
+    monkeypatch.setattr(conversation_memory, "compact", lambda session_id=None: 0)
+    conversation_memory.new_session()
+    return calls
+
+
+def _exchange(i):
+    conversation_memory.add_turn("user", f"question {i} " + "mot " * 8)
+    conversation_memory.add_turn("assistant", f"réponse {i} " + "mot " * 8)
+
+
+def test_no_compaction_while_the_window_fits(memory):
+    _exchange(0)
+    assert compact() == 0
+    assert memory == []
+
+
+def test_compaction_keeps_half_a_window_and_updates_facts_once(memory):
+    for i in range(3):
+        _exchange(i)
+    assert compact() > 0
+    assert memory.count("faits") == 1
+    summary, turns = conversation_memory.get_context()
+    assert summary.startswith("Résumé")
+    assert sum(len(turn.split()) for turn in turns) <= config.CONVERSATION_WINDOW_TOKENS // 2
+    # La fenêtre tient de nouveau : l'échange suivant ne relance pas de résumé.
+    _exchange(3)
+    assert compact() == 0
+    assert memory.count("faits") == 1
+
+
+def test_compaction_yields_to_a_busy_model(memory):
+    for i in range(3):
+        _exchange(i)
+    held, release = threading.Event(), threading.Event()
+
+    def busy():
+        with mistral_service._llm_lock:
+            held.set()
+            release.wait(5)
+
+    worker = threading.Thread(target=busy)
+    worker.start()
+    held.wait(5)
+    try:
+        assert compact() == 0
+    finally:
+        release.set()
+        worker.join()
+    assert memory == []
+    assert compact() > 0
+
+
+def test_turns_are_estimated_until_the_model_is_loaded(memory, monkeypatch):
+    monkeypatch.setattr(conversation_memory, "is_model_ready", lambda: False)
+    monkeypatch.setattr(prompt_builder, "get_llm", lambda: pytest.fail("attente du modèle"))
+    _exchange(0)
+    conn = conversation_memory._connect()
+    assert [row[0] for row in conn.execute("SELECT n_tokens FROM conversation_turns")] == [None, None]
+    monkeypatch.setattr(conversation_memory, "is_model_ready", lambda: True)
+    monkeypatch.setattr(prompt_builder, "get_llm", FakeTokenizer)
+    conversation_memory.get_context()
+    assert None not in [row[0] for row in conn.execute("SELECT n_tokens FROM conversation_turns")]
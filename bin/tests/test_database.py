@@ -0,0 +1,43 @@
+# tests/test_database.py
+
+import config
+from services import database
+from services.database import get_connection, migrate
+
+
+def test_schemas_sharing_a_file_keep_their_own_version(isolated_storage):
+    conn = get_connection(config.MEMORY_DB_PATH)
+    assert migrate(conn, [(1, ["CREATE TABLE a (x)"]), (2, ["ALTER TABLE a ADD COLUMN y"])], "module_a") == 2
+    assert migrate(conn, [(1, ["CREATE TABLE b (x)"])], "module_b") == 1
+    # Une nouvelle migration de module_b s'applique sans rejouer celles de module_a.
+    assert migrate(conn, [(1, ["CREATE TABLE b (x)"]), (2, ["CREATE INDEX idx_b ON b (x)"])], "module_b") == 2
+    assert migrate(conn, [(1, ["CREATE TABLE a (x)"]), (2, ["ALTER TABLE a ADD COLUMN y"])], "module_a") == 2
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == 0
+
+
+def test_callable_step_and_rollback(isolated_storage):
+    conn = get_connection(config.MEMORY_DB_PATH)
+    conn.execute("CREATE TABLE legacy (x)")
+
+    def drop_legacy(conn):
+        conn.execute("DROP TABLE legacy")
+
+    migrate(conn, [(1, [drop_legacy, "CREATE TABLE current (x)"])], "module_c")
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    assert "legacy" not in tables and "current" in tables
+
+    try:
+        migrate(conn, [(2, ["CREATE TABLE other (x)", "CREATE TABLE current (x)"])], "module_c")
+    except Exception:
+        pass
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    assert "other" not in tables
+    assert database._schema_version(conn, "module_c") == 1
+
+
+def test_get_connection_migrates_once_per_file(isolated_storage):
+    calls = []
+    migrations = [(1, [lambda conn: calls.append(1)])]
+    get_connection(config.MEMORY_DB_PATH, "module_d", migrations)
+    get_connection(config.MEMORY_DB_PATH, "module_d", migrations)
+    assert calls == [1]
@@ -0,0 +1,78 @@
+# tests/test_email_agent.py
+
+import threading
+import pytest
+import config
+from agents import email_agent
+
+
+@pytest.fixture
+def messages(monkeypatch):
+    messages = [{"uid": uid, "attachments": []} for uid in (1, 2, 3)]
+    monkeypatch.setattr(email_agent, "get_emails", lambda max_count: messages)
+    monkeypatch.setattr(email_agent, "get_message_key", lambda message: f"key-{message['uid']}")
+    monkeypatch.setattr(email_agent, "parse_email", lambda message, defer_attachments=False:
+                        ("alice@example.com", f"sujet {message['uid']}", "corps"))
+    return messages
+
+
+def test_pipeline_survives_a_failing_inference(monkeypatch, messages):
+    def infer(message_key, sender, subject, body, attachments_pending=False):
+        if message_key == "key-2":
+            raise RuntimeError("base verrouillée")
+        return {"resume": subject}
+
+    monkeypatch.setattr(email_agent, "_infer_analysis", infer)
+    results = sorted(email_agent.iter_email_analysis(3))
+    assert results == [(0, {"resume": "sujet 1"}), (2, {"resume": "sujet 3"})]
+
+
+def test_pipeline_gives_up_after_timeout(monkeypatch, messages):
+    blocked = threading.Event()
+
+    def infer(message_key, sender, subject, body, attachments_pending=False):
+        blocked.wait(5)
+        return None
+
+    monkeypatch.setattr(email_agent, "_infer_analysis", infer)
+    monkeypatch.setattr(config, "EMAIL_PIPELINE_RESULT_TIMEOUT", 0.2)
+    try:
+        assert list(email_agent.iter_email_analysis(3)) == []
+    finally:
+        blocked.set()
+
+
+def _pipeline_threads():
+    return [thread for thread in threading.enumerate() if thread.name in ("email-inference", "email-prepare")]
+
+
+def test_abandoned_pipeline_stops_its_threads(monkeypatch):
+    messages = [{"uid": uid, "attachments": []} for uid in range(8)]
+    monkeypatch.setattr(email_agent, "get_emails", lambda max_count: messages)
+    monkeypatch.setattr(email_agent, "get_message_key", lambda message: f"key-{message['uid']}")
+    monkeypatch.setattr(email_agent, "parse_email", lambda message, defer_attachments=False:
+                        ("alice@example.com", f"sujet {message['uid']}", "corps"))
+    monkeypatch.setattr(email_agent, "_infer_analysis",
+                        lambda message_key, sender, subject, body, attachments_pending=False: {"resume": subject})
+    pipeline = email_agent.iter_email_analysis(8)
+    assert next(pipeline)
+    pipeline.close()
+    for thread in _pipeline_threads():
+        thread.join(2)
+    assert _pipeline_threads() == []
+
+
+def test_prefetch_defers_the_attachment_scan(monkeypatch):
+    monkeypatch.setattr(config, "DEFERRED_SECURITY_SCAN", True)
+    calls = []
+    monkeypatch.setattr(email_agent, "parse_email", lambda message, defer_attachments=False:
+                        calls.append(("parse", defer_attachments)) or ("alice@example.com", "sujet", "corps"))
+    monkeypatch.setattr(email_agent, "_infer_analysis",
+                        lambda message_key, sender, subject, body, attachments_pending=False:
+                        {"resume": subject, "attachments_pending": attachments_pending})
+    monkeypatch.setattr(email_agent, "_schedule_attachment_analysis",
+                        lambda message_key, message: calls.append(("scan", message_key)))
+    message = {"uid": 1, "attachments": [{"filename": "facture.pdf", "size": 10}]}
+    analysis = email_agent._analyze_message("key-1", message)
+    assert analysis["attachments_pending"] is True
+    assert calls == [("parse", True), ("scan", "key-1")]
@@ -0,0 +1,48 @@
+# tests/test_email_analysis_store.py
+
+import pytest
+import config
+from services import email_analysis_store
+from services.database import get_connection
+
+ANALYSIS = {"subject": "Facture", "sender": "Alice <alice@example.com>", "resume": "Facture de mars.",
+            "importance": 4, "action_requise": "Payer"}
+
+
+@pytest.fixture(autouse=True)
+def model_file(tmp_path, monkeypatch):
+    path = tmp_path / "model.gguf"
+    path.write_bytes(b"poids")
+    monkeypatch.setattr(config, "MODEL_PATH", str(path))
+    return path
+
+
+def test_analysis_round_trip():
+    email_analysis_store.save_analysis("mid:<1@x>", "v1", ANALYSIS, attachments_pending=True)
+    assert email_analysis_store.get_analyses(["mid:<1@x>", "mid:<2@x>"], "v1") == {
+        "mid:<1@x>": {**ANALYSIS, "attachments_pending": True}}
+
+
+def test_other_prompt_version_or_model_is_a_miss(model_file):
+    email_analysis_store.save_analysis("mid:<1@x>", "v1", ANALYSIS)
+    assert email_analysis_store.get_analyses(["mid:<1@x>"], "v2") == {}
+    model_file.write_bytes(b"nouveaux poids")
+    assert email_analysis_store.get_analyses(["mid:<1@x>"], "v1") == {}
+    assert email_analysis_store.purge_stale_analyses("v1") == 1
+
+
+def test_cache_without_pending_column_is_migrated():
+    conn = get_connection(config.MEMORY_DB_PATH)
+    with conn:
+        conn.execute('''
+            CREATE TABLE email_analysis_cache (
+                message_key TEXT PRIMARY KEY, prompt_version TEXT NOT NULL, model_id TEXT NOT NULL,
+                subject TEXT, sender TEXT, resume TEXT, importance INTEGER, action_requise TEXT,
+                analyzed_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        conn.execute("INSERT INTO email_analysis_cache (message_key, prompt_version, model_id, subject) "
+                     "VALUES ('sha:abc', 'v1', ?, 'Ancien')", (email_analysis_store.get_model_id(),))
+    analyses = email_analysis_store.get_analyses(["sha:abc"], "v1")
+    assert analyses["sha:abc"]["subject"] == "Ancien"
+    assert analyses["sha:abc"]["attachments_pending"] is False
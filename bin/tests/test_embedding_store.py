@@ -0,0 +1,66 @@
+# tests/test_embedding_store.py
+
+import threading
+import time
+import pytest
+import config
+from services import embedding_store, mistral_service
+
+VOCABULARY = ["dentiste", "docteur", "rdv", "rapport", "budget", "courses", "lait"]
+
+
+class FakeEmbedder:
+    """Vecteurs « sac de mots » sur un petit vocabulaire (dentiste et docteur sont proches)."""
+
+    def embed(self, texts, truncate=True):
+        vectors = []
+        for text in texts:
+            words = text.lower().split()
+            vector = [float(sum(word.startswith(term) for word in words)) for term in VOCABULARY]
+            vector[0] += vector[1]
+            vector[1] += vector[0]
+            vectors.append([value + 0.01 for value in vector])
+        return vectors
+
+
+@pytest.fixture
+def index(monkeypatch):
+    monkeypatch.setattr(config, "EMBEDDING_ENABLED", True)
+    monkeypatch.setattr(mistral_service, "_embedder", FakeEmbedder())
+    monkeypatch.setattr(embedding_store, "_index", None)
+    embedding_store.sync_source("task", {"1": "Rdv docteur", "2": "Rapport budget", "3": "Courses lait"})
+
+
+def test_search_returns_closest_items(index):
+    hits = embedding_store.search("le truc du dentiste", kinds=("task",))
+    assert hits[0]["ref"] == "1"
+
+
+def test_search_with_timeout_skips_a_busy_embedder(index):
+    release = threading.Event()
+
+    def busy():
+        with mistral_service._embedder_lock:
+            release.wait(5)
+
+    worker = threading.Thread(target=busy)
+    worker.start()
+    time.sleep(0.05)
+    try:
+        start = time.perf_counter()
+        assert embedding_store.search("dentiste", timeout=0.05) == []
+        assert time.perf_counter() - start < 1
+    finally:
+        release.set()
+        worker.join()
+    assert embedding_store.search("dentiste", timeout=0.05)[0]["ref"] == "1"
+
+
+def test_search_does_not_load_the_model(index, monkeypatch):
+    monkeypatch.setattr(mistral_service, "_embedder", None)
+    monkeypatch.setattr(mistral_service, "get_embedder", lambda: pytest.fail("chargement du modèle"))
+    warmed = []
+    monkeypatch.setattr(embedding_store, "warm_up_embedder", lambda: warmed.append(True))
+    assert embedding_store.search("dentiste", timeout=0.05) == []
+    assert embedding_store.search("dentiste") == []
+    assert warmed == [True, True]
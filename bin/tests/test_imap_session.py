@@ -0,0 +1,109 @@
+# tests/test_imap_session.py
+
+import imaplib
+import socket
+import threading
+from types import SimpleNamespace
+import pytest
+from services import imap_session
+
+
+class FakeConnection:
+    """Connexion IMAP minimale : readline() sert les lignes prévues puis attend shutdown()."""
+
+    def __init__(self, lines=()):
+        self.lines = list(lines)
+        self.sent = []
+        self.logins = 0
+        self.closed = threading.Event()
+        self.sock = SimpleNamespace(settimeout=lambda timeout: None)
+
+    def login(self, username, password):
+        self.logins += 1
+
+    def select(self, mailbox, readonly=False):
+        return "OK", [b"1"]
+
+    def noop(self):
+        return "OK", [b""]
+
+    def _new_tag(self):
+        return b"A1"
+
+    def send(self, data):
+        self.sent.append(data)
+
+    def readline(self):
+        if self.lines:
+            line = self.lines.pop(0)
+            if isinstance(line, Exception):
+                raise line
+            return line
+        self.closed.wait(5)
+        return b""
+
+    def shutdown(self):
+        self.closed.set()
+
+    def logout(self):
+        self.closed.set()
+
+
+def _session(connections):
+    opened = []
+
+    def factory(host, port, use_ssl):
+        opened.append(connections.pop(0))
+        return opened[-1]
+
+    session = imap_session.ImapSession("imap.example.com", 993, True, "moi", "secret", connection_factory=factory)
+    return session, opened
+
+
+def test_idle_cycle_stops_on_new_message():
+    conn = FakeConnection([b"+ idling\r\n", b"* 1 RECENT\r\n", b"* 4 EXISTS\r\n", b"A1 OK IDLE terminated\r\n"])
+    session, _ = _session([])
+    assert session._idle_once(conn) is True
+    assert conn.sent == [b"A1 IDLE\r\n", b"DONE\r\n"]
+
+
+def test_server_without_idle_is_reported():
+    session, _ = _session([])
+    with pytest.raises(imaplib.IMAP4.error):
+        session._idle_once(FakeConnection([b"A1 BAD unknown command\r\n"]))
+
+
+def test_idle_loop_notifies_and_reconnects_after_timeout():
+    first = FakeConnection([b"+ idling\r\n", socket.timeout("timed out")])
+    second = FakeConnection([b"+ idling\r\n", b"* 5 EXISTS\r\n", b"A1 OK\r\n"])
+    session, opened = _session([first, second])
+    notified = threading.Event()
+
+    def on_new_mail():
+        notified.set()
+        session.stop_idle()
+
+    session.start_idle(on_new_mail)
+    assert notified.wait(5)
+    session._idle_thread.join(5)
+    assert not session._idle_thread.is_alive()
+    assert opened == [first, second]
+    assert first.closed.is_set() and second.closed.is_set()
+
+
+def test_run_reconnects_once_after_an_abort():
+    first, second = FakeConnection(), FakeConnection()
+    session, opened = _session([first, second])
+    calls = []
+
+    def operation(conn):
+        calls.append(conn)
+        if conn is first:
+            raise imaplib.IMAP4.abort("socket error: EOF")
+        return "résultat"
+
+    assert session.run(operation) == "résultat"
+    assert calls == [first, second]
+    # La session est ensuite réutilisée sans nouvelle authentification.
+    assert session.run(lambda conn: conn) is second
+    assert second.logins == 1
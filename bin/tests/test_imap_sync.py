@@ -0,0 +1,83 @@
+# tests/test_imap_sync.py
+
+import re
+import pytest
+import config
+from services import imap_sync
+
+STRUCTURE = b'("text" "plain" ("charset" "utf-8") NIL NIL "7bit" 5 1)'
+
+
+class FakeMailbox:
+    """Serveur IMAP minimal : UID FETCH répond NO pour les UID listés dans `refused`."""
+
+    def __init__(self, uids, uidvalidity=7, refused=()):
+        self.uids = sorted(uids)
+        self.uidvalidity = uidvalidity
+        self.refused = set(refused)
+
+    def select(self, mailbox, readonly=True):
+        return "OK", [str(len(self.uids)).encode()]
+
+    def response(self, code):
+        value = self.uidvalidity if code == "UIDVALIDITY" else max(self.uids, default=0) + 1
+        return code, [str(value).encode()]
+
+    def uid(self, command, *args):
+        if command == "SEARCH":
+            first = int(re.match(r"(\d+):\*", args[-1]).group(1))
+            return "OK", [" ".join(str(uid) for uid in self.uids if uid >= first).encode()]
+        uid_set, items = args
+        uids = [int(uid) for uid in uid_set.split(",")]
+        if self.refused & set(uids):
+            return "NO", [b"FETCH failed"]
+        data = []
+        for seq, uid in enumerate(uids, 1):
+            if "HEADER" in items:
+                header = f"Subject: message {uid}\r\n\r\n".encode()
+                prefix = b"%d (UID %d BODYSTRUCTURE %s BODY[HEADER] {%d}" % (seq, uid, STRUCTURE, len(header))
+                data += [(prefix, header), b")"]
+            else:
+                data += [(b"%d (UID %d BODY[1]<0> {5}" % (seq, uid), b"hello"), b")"]
+        return "OK", data
+
+
+@pytest.fixture(autouse=True)
+def small_batches(monkeypatch):
+    monkeypatch.setattr(config, "IMAP_FETCH_BATCH_SIZE", 2)
+    monkeypatch.setattr(config, "IMAP_INITIAL_SYNC_COUNT", 20)
+
+
+def test_sync_fetches_new_messages_incrementally():
+    mail = FakeMailbox([1, 2, 3])
+    assert imap_sync.sync_mailbox(mail) == [1, 2, 3]
+    mail.uids.append(4)
+    assert imap_sync.sync_mailbox(mail) == [4]
+    latest = imap_sync.get_latest_messages("inbox", 1)[0]
+    assert latest["uid"] == 4 and latest["body_text"] == "hello"
+
+
+def test_failed_batch_is_fetched_again_on_next_sync():
+    mail = FakeMailbox([1, 2, 3, 4, 5, 6])
+    imap_sync.sync_mailbox(mail)
+    mail.uids += [7, 8, 9, 10]
+    mail.refused = {7}
+    # Lots (7, 8) puis (9, 10) : le premier est refusé, le dernier UID vu doit rester à 6.
+    assert imap_sync.sync_mailbox(mail) == [9, 10]
+    mail.refused = set()
+    assert imap_sync.sync_mailbox(mail) == [7, 8, 9, 10]
+
+
+def test_failed_body_fetch_is_not_marked_as_seen():
+    mail = FakeMailbox([1, 2])
+    original_uid = mail.uid
+
+    def refuse_bodies(command, *args):
+        if command == "FETCH" and "HEADER" not in args[1]:
+            return "NO", [b"FETCH failed"]
+        return original_uid(command, *args)
+
+    mail.uid = refuse_bodies
+    assert imap_sync.sync_mailbox(mail) == []
+    mail.uid = original_uid
+    assert imap_sync.sync_mailbox(mail) == [1, 2]
@@ -0,0 +1,52 @@
+# tests/test_intent_cache.py
+
+from collections import OrderedDict
+import pytest
+import config
+from services import intent_cache
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch):
+    monkeypatch.setattr(intent_cache, "_cache", OrderedDict())
+    monkeypatch.setattr(intent_cache, "_cache_day", None)
+    monkeypatch.setattr(intent_cache, "stats", {"hits": 0, "misses": 0, "llm_seconds_saved": 0.0})
+    monkeypatch.setattr(intent_cache, "_today", lambda: "2026-03-02")
+    monkeypatch.setattr(config, "INTENT_CACHE_PERSIST", True)
+
+
+def test_normalized_queries_share_an_entry():
+    intent_cache.store_intent("Ajoute  la tâche Rapport !", {"intent": "add_task", "summary": "Rapport"}, 2.0)
+    cached = intent_cache.get_cached_intent("ajoute la tâche rapport")
+    assert cached == {"intent": "add_task", "summary": "Rapport"}
+    cached["summary"] = "modifié"
+    assert intent_cache.get_cached_intent("AJOUTE LA TÂCHE RAPPORT")["summary"] == "Rapport"
+    stats = intent_cache.get_cache_stats()
+    assert (stats["hits"], stats["misses"], stats["llm_seconds_saved"]) == (2, 0, 4.0)
+
+
+def test_least_recently_used_entry_is_evicted(monkeypatch):
+    monkeypatch.setattr(config, "INTENT_CACHE_SIZE", 2)
+    monkeypatch.setattr(config, "INTENT_CACHE_PERSIST", False)
+    intent_cache.store_intent("a", {"intent": "get_emails"})
+    intent_cache.store_intent("b", {"intent": "get_agenda"})
+    assert intent_cache.get_cached_intent("a")
+    intent_cache.store_intent("c", {"intent": "get_tasks"})
+    assert intent_cache.get_cached_intent("b") is None
+    assert intent_cache.get_cached_intent("a") and intent_cache.get_cached_intent("c")
+
+
+def test_entries_expire_at_midnight(monkeypatch):
+    intent_cache.store_intent("ajoute rdv demain", {"intent": "add_event", "date": "2026-03-03"})
+    monkeypatch.setattr(intent_cache, "_today", lambda: "2026-03-03")
+    assert intent_cache.get_cached_intent("ajoute rdv demain") is None
+    rows = intent_cache._connect().execute("SELECT COUNT(*) FROM intent_cache").fetchone()[0]
+    assert rows == 0
+
+
+def test_persisted_entries_are_reloaded():
+    intent_cache.store_intent("analyse mes mails", {"intent": "get_emails"}, 1.5)
+    intent_cache._cache.clear()
+    intent_cache._cache_day = None
+    assert intent_cache.get_cached_intent("analyse mes mails") == {"intent": "get_emails"}
+    assert intent_cache.get_cache_stats()["llm_seconds_saved"] == 1.5
@@ -0,0 +1,69 @@
+# tests/test_intent_router.py
+
+from datetime import datetime, timedelta
+import pytest
+import config
+from services.intent_router import route_intent
+
+TOMORROW = (datetime.now() + timedelta(days=1)).strftime("%Y-%m-%d")
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("ajoute une tâche urgente : appeler le plombier demain",
+     {"intent": "add_task", "summary": "appeler le plombier", "priority": 1, "date": TOMORROW}),
+    ("supprime la tâche rapport mensuel", {"intent": "delete_task", "summary": "rapport mensuel"}),
+    ("passe la tâche rapport mensuel en terminé",
+     {"intent": "update_task_status", "summary": "rapport mensuel", "status": "terminé"}),
+    ("ajoute un rendez-vous dentiste demain", {"intent": "add_event", "summary": "dentiste", "date": TOMORROW}),
+    ("planifie revue de code demain", {"intent": "add_event", "summary": "revue de code", "date": TOMORROW}),
+    ("note rdv banque demain", {"intent": "add_event", "summary": "rdv banque", "date": TOMORROW}),
+])
+def test_routes_common_commands(text, expected):
+    parsed, confidence = route_intent(text)
+    assert confidence >= config.INTENT_ROUTER_MIN_CONFIDENCE
+    assert parsed == expected
+
+
+@pytest.mark.parametrize("text", [
+    "note de frais à faire demain",
+    "crée le budget du trimestre demain",
+    "ajoute du lait aux courses demain",
+])
+def test_generic_verb_with_date_is_left_to_llm(text):
+    parsed, confidence = route_intent(text)
+    assert confidence < config.INTENT_ROUTER_MIN_CONFIDENCE
+
+
+def test_unknown_request_is_left_to_llm():
+    _, confidence = route_intent("qu'il fait beau aujourd'hui")
+    assert confidence < config.INTENT_ROUTER_MIN_CONFIDENCE
+
+
+@pytest.mark.parametrize("text", ["montre les tâches non terminées", "mes tâches pas faites",
+                                  "liste les tâches pas encore terminées"])
+def test_negated_done_status_lists_open_tasks(text):
+    parsed, confidence = route_intent(text)
+    assert parsed == {"intent": "get_tasks"}
+    assert confidence >= config.INTENT_ROUTER_MIN_CONFIDENCE
+
+
+def test_other_negated_status_is_left_to_llm():
+    _, confidence = route_intent("liste les tâches qui ne sont plus en cours")
+    assert confidence < config.INTENT_ROUTER_MIN_CONFIDENCE
+
+
+@pytest.mark.parametrize("text, summary", [
+    ("supprime la réunion budget", "réunion budget"),
+    ("annule le rdv dentiste", "dentiste"),
+    ("supprime l'événement 'réunion projet'", "réunion projet"),
+])
+def test_delete_event_keeps_the_title(text, summary):
+    parsed, confidence = route_intent(text)
+    assert parsed == {"intent": "delete_event", "summary": summary}
+    assert confidence >= config.INTENT_ROUTER_MIN_CONFIDENCE
+
+
+@pytest.mark.parametrize("text", ["annule le rdv", "supprime la réunion de demain", "annule le rdv de demain à 10h"])
+def test_delete_event_without_title_is_left_to_llm(text):
+    _, confidence = route_intent(text)
+    assert confidence < config.INTENT_ROUTER_MIN_CONFIDENCE
@@ -0,0 +1,91 @@
+# tests/test_manager.py
+
+import builtins
+import pytest
+import manager
+
+
+@pytest.fixture
+def answers(monkeypatch):
+    given = []
+
+    def answer(prompt=""):
+        return given.pop(0)
+
+    monkeypatch.setattr(builtins, "input", answer)
+    return given
+
+
+def test_single_exact_match_is_selected_without_asking(answers):
+    item = {"id": 1, "summary": "Rapport", "source": "task"}
+    assert manager.handle_item_selection([item]) is item
+
+
+def test_single_semantic_match_needs_confirmation(answers):
+    item = {"id": 1, "summary": "Rdv docteur", "source": "task", "semantic": True}
+    answers.append("0")
+    assert manager.handle_item_selection([item]) is None
+    answers.append("1")
+    assert manager.handle_item_selection([item]) is item
+
+
+def test_semantic_fallback_marks_items(monkeypatch):
+    monkeypatch.setattr(manager.task_agent, "search_tasks", lambda keyword: [])
+    monkeypatch.setattr(manager.embedding_store, "search", lambda query, kinds=None: [{"ref": "4", "score": 0.5}])
+    monkeypatch.setattr(manager.task_agent, "get_tasks_by_ids",
+                        lambda ids: [{"id": 4, "description": "Rdv docteur", "priority": 2}])
+    assert manager.find_task_items("le truc du dentiste") == [
+        {"id": 4, "summary": "Rdv docteur", "source": "task", "semantic": True, "score": 0.5}]
+
+
+def test_profile_digest_stays_out_of_the_cached_intent_prefix(monkeypatch):
+    prompts = []
+    monkeypatch.setattr(manager, "get_json_from_mistral",
+                        lambda prompt, prefix=None, schema=None: prompts.append((prefix, prompt)) or {})
+    for digest in ("- Expéditeurs fréquents : Alice\n", "- Expéditeurs fréquents : Bob\n"):
+        monkeypatch.setattr(manager.user_profile, "get_digest", lambda: digest)
+        manager._parse_user_intent_with_llm("ajoute un rendez-vous")
+    (first_prefix, first_prompt), (second_prefix, second_prompt) = prompts
+    assert first_prefix == second_prefix
+    assert "Alice" in first_prompt and "Bob" in second_prompt
+
+
+def test_delete_event_removes_the_selected_occurrence(monkeypatch, answers):
+    events = [{"id": "a1", "calendar_id": "perso", "summary": "Réunion"},
+              {"id": "b2", "calendar_id": "travail", "summary": "Réunion"}]
+    monkeypatch.setattr(manager.agenda_agent, "find_events", lambda keyword: events)
+    deleted = []
+    monkeypatch.setattr(manager.agenda_agent, "delete_event",
+                        lambda calendar_id, event_id, summary="": deleted.append((calendar_id, event_id)))
+    answers.append("2")
+    manager._execute_command({"intent": "delete_event", "summary": "réunion"}, "supprime la réunion")
+    assert deleted == [("travail", "b2")]
+
+
+def test_semantic_event_reference_keeps_the_calendar(monkeypatch):
+    monkeypatch.setattr(manager.agenda_agent, "find_events", lambda keyword: [])
+    monkeypatch.setattr(manager.embedding_store, "search",
+                        lambda query, kinds=None: [{"ref": "équipe/2024/x9", "text": "Point hebdo", "score": 0.5}])
+    assert manager.find_event_items("le point de la semaine") == [
+        {"id": "x9", "calendar_id": "équipe/2024", "summary": "Point hebdo", "source": "agenda", "semantic": True,
+         "score": 0.5}]
+
+
+def test_confident_semantic_match_is_selected_without_asking(answers):
+    close = {"id": 1, "summary": "Rdv docteur", "source": "task", "semantic": True, "score": 0.9}
+    far = {"id": 2, "summary": "Courses", "source": "task", "semantic": True, "score": 0.4}
+    assert manager.handle_item_selection([close, far]) is close
+
+
+def test_choice_goes_through_the_installed_prompt(monkeypatch):
+    asked = []
+    monkeypatch.setattr(manager, "_choice_prompt", lambda options, count: asked.append(count) or 2)
+    items = [{"id": 1, "summary": "Rapport", "source": "task"}, {"id": 2, "summary": "Rapport final", "source": "task"}]
+    assert manager.handle_item_selection(items) is items[1]
+    assert asked == [2]
+
+
+def test_recommendation_query_keeps_the_configured_query():
+    assert manager.recommendation_query(manager.URGENT_RECOMMENDATION_QUERY) == manager.URGENT_RECOMMENDATION_QUERY
+    combined = manager.recommendation_query(manager.GENERAL_RECOMMENDATION_QUERY, "et pour le projet budget ?")
+    assert combined.startswith(manager.GENERAL_RECOMMENDATION_QUERY) and combined.endswith("projet budget ?")
@@ -0,0 +1,133 @@
+# tests/test_mistral_service.py
+
+import threading
+from collections import OrderedDict
+from types import SimpleNamespace
+import pytest
+import config
+from services import mistral_service
+
+
+class FakeLlama:
+    """Modèle minimal : un token par caractère, état = texte déjà évalué."""
+
+    def __init__(self):
+        self.evaluated = []
+        self.loaded = []
+        self.prompts = []
+        self.text = ""
+
+    def tokenize(self, data, special=False, add_bos=False):
+        return list(data.decode("utf-8"))
+
+    def reset(self):
+        self.text = ""
+
+    def eval(self, tokens):
+        self.text += "".join(tokens)
+        self.evaluated.append("".join(tokens))
+
+    def save_state(self):
+        return SimpleNamespace(text=self.text, n_tokens=len(self.text))
+
+    def load_state(self, state):
+        self.text = state.text
+        self.loaded.append(state.text)
+
+    def __call__(self, prompt, **kwargs):
+        self.prompts.append(prompt)
+        return {"choices": [{"text": " ok "}]}
+
+
+@pytest.fixture
+def llm(monkeypatch):
+    fake = FakeLlama()
+    ready = threading.Event()
+    ready.set()
+    monkeypatch.setattr(mistral_service, "_llm", fake)
+    monkeypatch.setattr(mistral_service, "_llm_ready", ready)
+    monkeypatch.setattr(mistral_service, "_prefix_states", OrderedDict())
+    monkeypatch.setattr(mistral_service, "prefix_cache_stats",
+                        {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "tokens_reused": 0})
+    monkeypatch.setattr(config, "PREFIX_CACHE_ON_DISK", False)
+    return fake
+
+
+def test_prefix_is_evaluated_once_then_restored(llm):
+    assert mistral_service.call_mistral("question 1", prefix="INSTRUCTIONS ") == "ok"
+    assert mistral_service.call_mistral("question 2", prefix="INSTRUCTIONS ") == "ok"
+    assert llm.evaluated == ["INSTRUCTIONS "]
+    assert llm.loaded == ["INSTRUCTIONS "]
+    assert llm.prompts == ["INSTRUCTIONS question 1", "INSTRUCTIONS question 2"]
+    stats = mistral_service.prefix_cache_stats
+    assert (stats["hits"], stats["misses"], stats["tokens_reused"]) == (1, 1, 2 * len("INSTRUCTIONS "))
+
+
+def test_least_used_prefix_is_evicted(llm, monkeypatch):
+    monkeypatch.setattr(config, "PREFIX_CACHE_MAX_ENTRIES", 2)
+    for prefix in ("a", "a", "b", "c"):
+        mistral_service.call_mistral("?", prefix=prefix)
+    assert [entry["state"].text for entry in mistral_service._prefix_states.values()] == ["a", "c"]
+    assert mistral_service.prefix_cache_stats["evictions"] == 1
+    # Le préfixe évincé est réévalué au prochain usage.
+    mistral_service.call_mistral("?", prefix="b")
+    assert llm.evaluated == ["a", "b", "c", "b"]
+
+
+def test_prefix_state_is_reloaded_from_disk(llm, monkeypatch, tmp_path):
+    monkeypatch.setattr(config, "PREFIX_CACHE_ON_DISK", True)
+    monkeypatch.setattr(config, "PREFIX_CACHE_DIR", str(tmp_path / "prefix_cache"))
+    mistral_service.call_mistral("?", prefix="EXEMPLES ")
+    mistral_service._prefix_states.clear()
+    mistral_service.call_mistral("?", prefix="EXEMPLES ")
+    assert llm.evaluated == ["EXEMPLES "]
+    assert mistral_service.prefix_cache_stats["disk_hits"] == 1
+
+
+def test_unreadable_disk_state_is_recomputed(llm, monkeypatch, tmp_path):
+    monkeypatch.setattr(config, "PREFIX_CACHE_ON_DISK", True)
+    monkeypatch.setattr(config, "PREFIX_CACHE_DIR", str(tmp_path))
+    key = mistral_service._prefix_key("EXEMPLES ")
+    (tmp_path / f"{key}.state").write_bytes(b"corrompu")
+    mistral_service.call_mistral("?", prefix="EXEMPLES ")
+    assert llm.evaluated == ["EXEMPLES "]
+
+
+SCHEMA = {
+    "type": "object",
+    "properties": {
+        "intent": {"enum": ["add_task", "get_tasks"]},
+        "summary": {"type": "string", "maxLength": 20},
+        "date": {"type": "string", "format": "date"},
+        "priority": {"enum": [1, 2, 3]},
+    },
+    "required": ["intent"],
+}
+
+
+def test_schema_budget_covers_the_longest_valid_answer():
+    longest = '{"intent": "get_tasks", "summary": "%s", "date": "2026-12-31", "priority": 1}' % ("x" * 20)
+    assert len(longest) <= mistral_service.max_tokens_for_schema(SCHEMA)
+
+
+def test_schema_constrains_generation(monkeypatch):
+    calls = []
+    monkeypatch.setattr(mistral_service, "_grammar_from_schema", lambda schema_json: "grammaire")
+    monkeypatch.setattr(mistral_service, "call_mistral",
+                        lambda prompt, max_token=500, prefix=None, grammar=None:
+                        calls.append((max_token, grammar)) or '{"intent": "get_tasks"}')
+    assert mistral_service.get_json_from_mistral("?", schema=SCHEMA) == {"intent": "get_tasks"}
+    assert calls == [(mistral_service.max_tokens_for_schema(SCHEMA), "grammaire")]
+
+
+def test_missing_grammar_falls_back_to_free_generation(monkeypatch):
+    def unavailable(schema_json):
+        raise ImportError("No module named 'llama_cpp'")
+
+    calls = []
+    monkeypatch.setattr(mistral_service, "_grammar_from_schema", unavailable)
+    monkeypatch.setattr(mistral_service, "call_mistral",
+                        lambda prompt, max_token=500, prefix=None, grammar=None:
+                        calls.append(grammar) or 'Voici :\n```json\n{"intent": "add_task"}\n```')
+    assert mistral_service.get_json_from_mistral("?", schema=SCHEMA) == {"intent": "add_task"}
+    assert calls == [None]
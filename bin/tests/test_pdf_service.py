@@ -0,0 +1,48 @@
+# tests/test_pdf_service.py
+
+import fitz
+import pytest
+import config
+from services import pdf_service
+
+
+def _make_pdf(page_texts):
+    with fitz.open() as doc:
+        for text in page_texts:
+            doc.new_page().insert_text((72, 72), text)
+        return doc.tobytes()
+
+
+def test_reads_every_page_within_budget():
+    text = pdf_service.extract_pdf_text(_make_pdf(["page un", "page deux"]))
+    assert "page un" in text and "page deux" in text
+    assert "tronqué" not in text
+
+
+def test_page_cap_truncates_the_document(monkeypatch):
+    monkeypatch.setattr(config, "PDF_MAX_PAGES", 2)
+    text = pdf_service.extract_pdf_text(_make_pdf([f"page {n}" for n in range(5)]))
+    assert "page 1" in text and "page 2" not in text
+    assert "2 page(s) lue(s) sur 5" in text
+
+
+def test_char_budget_stops_reading():
+    text = pdf_service.extract_pdf_text(_make_pdf(["a" * 50, "b" * 50, "c" * 50]), max_chars=60)
+    assert "c" not in text.split("[")[0]
+    assert "2 page(s) lue(s) sur 3" in text
+
+
+def test_second_extraction_comes_from_the_cache(monkeypatch):
+    pdf_data = _make_pdf(["contenu"])
+    first = pdf_service.extract_pdf_text(pdf_data)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("le PDF ne doit pas être reparsé")
+
+    monkeypatch.setattr(pdf_service.fitz, "open", fail)
+    assert pdf_service.extract_pdf_text(pdf_data) == first
+
+
+def test_invalid_pdf_raises():
+    with pytest.raises(Exception):
+        pdf_service.extract_pdf_text(b"pas un pdf")
@@ -0,0 +1,76 @@
+# tests/test_prompt_builder.py
+
+import pytest
+import config
+from services import prompt_builder
+from services.prompt_builder import PromptBuilder
+
+
+class FakeTokenizer:
+    """Un token par mot : suffisant pour vérifier les budgets sans charger le modèle."""
+
+    def tokenize(self, data, add_bos=False):
+        return data.decode("utf-8").split()
+
+    def detokenize(self, tokens):
+        return " ".join(tokens).encode("utf-8")
+
+
+@pytest.fixture(autouse=True)
+def tokenizer(monkeypatch):
+    monkeypatch.setattr(prompt_builder, "get_llm", FakeTokenizer)
+    monkeypatch.setattr(config, "PROMPT_SAFETY_MARGIN", 0)
+    prompt_builder._static_tokens.cache_clear()
+    yield
+    prompt_builder._static_tokens.cache_clear()
+
+
+def test_sections_are_kept_in_insertion_order():
+    builder = PromptBuilder(max_new_tokens=0, n_ctx=100)
+    builder.add("debut", "un deux ")
+    builder.add("milieu", "trois ", priority=2)
+    builder.add("fin", "quatre", static=True)
+    assert builder.build() == "un deux trois quatre"
+    assert builder.truncated == set()
+
+
+def test_low_priority_section_is_truncated_first():
+    builder = PromptBuilder(max_new_tokens=2, n_ctx=10)
+    builder.add("consigne", "a b c d ")
+    builder.add("contexte", "e f g h i j", priority=1)
+    prompt = builder.build()
+    assert prompt.startswith("a b c d ")
+    assert prompt.endswith(PromptBuilder.TRUNCATION_MARKER)
+    assert builder.truncated == {"contexte"}
+
+
+def test_reserve_consumes_the_budget():
+    builder = PromptBuilder(max_new_tokens=0, n_ctx=6)
+    builder.reserve("x y z")  # 3 tokens + BOS
+    builder.add("texte", "a b c d", priority=1)
+    builder.build()
+    assert builder.truncated == {"texte"}
+
+
+def test_items_are_capped_and_counted_when_omitted():
+    builder = PromptBuilder(max_new_tokens=0, n_ctx=13)
+    builder.add_items("taches", ["a b\n", "c d e f g h i j\n", "k l m n o p q\n", "r s\n"], item_max_tokens=6)
+    prompt = builder.build()
+    assert prompt == "a b\nc d e f g [...]\n[2 élément(s) omis (contexte plein)]\n"
+    assert builder.truncated == {"taches"}
+
+
+def test_empty_text_only_when_there_are_no_items():
+    builder = PromptBuilder(max_new_tokens=0, n_ctx=100)
+    builder.add_items("taches", [], empty_text="Aucune tâche en cours.\n")
+    assert builder.build() == "Aucune tâche en cours.\n"
+
+
+def test_items_that_do_not_fit_are_reported_not_replaced_by_empty_text():
+    builder = PromptBuilder(max_new_tokens=0, n_ctx=8)
+    builder.add("consigne", "a b ")
+    builder.add_items("taches", ["une tâche beaucoup trop longue pour le budget\n"], priority=1,
+                      empty_text="Aucune tâche en cours.\n")
+    prompt = builder.build()
+    assert "Aucune tâche" not in prompt
+    assert prompt == "a b [1 élément(s) omis (contexte plein)]\n"
@@ -0,0 +1,121 @@
+# tests/test_security_service.py
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+import config
+from services import security_service
+
+
+class FakeVirusTotal:
+    """API VirusTotal locale : chaque route renvoie, dans l'ordre, les réponses (statut, corps, en-têtes) prévues."""
+
+    def __init__(self):
+        self.routes = {}
+        self.requests = []
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _reply(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                if length:
+                    self.rfile.read(length)
+                key = f"{self.command} {self.path}"
+                stand_in.requests.append(key)
+                responses = stand_in.routes.get(key) or [(500, {"error": "route inconnue"}, {})]
+                status, body, headers = responses.pop(0) if len(responses) > 1 else responses[0]
+                payload = body if isinstance(body, bytes) else json.dumps(body).encode()
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            do_GET = do_POST = _reply
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def on(self, method, path, *responses):
+        self.routes[f"{method} {path}"] = [response if len(response) == 3 else (*response, {}) for response in responses]
+
+
+@pytest.fixture
+def virustotal(monkeypatch):
+    stand_in = FakeVirusTotal()
+    monkeypatch.setattr(config, "VIRUSTOTAL_API_KEY", "test-key")
+    monkeypatch.setattr(config, "VIRUSTOTAL_API_URL", stand_in.url)
+    monkeypatch.setattr(config, "VIRUSTOTAL_POLL_INTERVAL", 0.05)
+    monkeypatch.setattr(config, "VIRUSTOTAL_BACKOFF_SECONDS", 0.05)
+    monkeypatch.setattr(config, "VIRUSTOTAL_SCAN_TIMEOUT", 5)
+    monkeypatch.setattr(security_service, "_rate_limiter", security_service._TokenBucket(6000, 100))
+    yield stand_in
+    stand_in.server.shutdown()
+
+
+def _report(malicious=0):
+    return {"data": {"attributes": {"last_analysis_stats": {"malicious": malicious, "suspicious": 0}}}}
+
+
+def _hash(data):
+    return security_service.hashlib.sha256(data).hexdigest()
+
+
+def test_existing_report_is_used_and_cached(virustotal):
+    data = b"rapport existant"
+    virustotal.on("GET", f"/files/{_hash(data)}", (200, _report()))
+    assert security_service.scan_file_with_virustotal(data) is True
+    assert security_service.get_cached_verdict(_hash(data)) is True
+    assert security_service.scan_file_with_virustotal(data) is True
+    assert len(virustotal.requests) == 1
+
+
+def test_upload_then_poll_until_completed(virustotal):
+    data = b"nouveau fichier"
+    virustotal.on("GET", f"/files/{_hash(data)}", (404, {}))
+    virustotal.on("POST", "/files", (200, {"data": {"id": "a1"}}))
+    virustotal.on("GET", "/analyses/a1",
+                  (200, {"data": {"attributes": {"status": "queued"}}}),
+                  (200, {"data": {"attributes": {"status": "completed", "stats": {"malicious": 2}}}}))
+    assert security_service.scan_file_with_virustotal(data) is False
+    assert virustotal.requests.count("GET /analyses/a1") == 2
+
+
+@pytest.mark.parametrize("analysis", [
+    (200, {"data": {"attributes": {"status": "completed"}}}),
+    (200, b"<html>pas du json</html>"),
+    (503, {"error": "indisponible"}),
+])
+def test_unexpected_analysis_response_resolves_as_unsafe(virustotal, analysis):
+    data = repr(analysis).encode()
+    virustotal.on("GET", f"/files/{_hash(data)}", (404, {}))
+    virustotal.on("POST", "/files", (200, {"data": {"id": "a2"}}))
+    virustotal.on("GET", "/analyses/a2", analysis)
+    future = security_service.scan_file_async(data)
+    assert future.result(timeout=2) is False
+
+
+def test_quota_exceeded_is_retried_without_blocking_workers(virustotal, monkeypatch):
+    monkeypatch.setattr(security_service, "_rate_limiter", security_service._TokenBucket(600, 1))
+    files = [f"fichier {i}".encode() for i in range(3)]
+    for data in files:
+        virustotal.on("GET", f"/files/{_hash(data)}", (429, {}, {"Retry-After": "0"}), (200, _report()))
+    futures = [security_service.scan_file_async(data) for data in files]
+    assert [future.result(timeout=5) for future in futures] == [True, True, True]
+    assert len(virustotal.requests) == 6
+
+
+def test_blocking_scan_gives_up_after_timeout(virustotal, monkeypatch):
+    monkeypatch.setattr(config, "VIRUSTOTAL_SCAN_TIMEOUT", 0.3)
+    monkeypatch.setattr(config, "VIRUSTOTAL_MAX_POLLS", 1000)
+    data = b"analyse interminable"
+    virustotal.on("GET", f"/files/{_hash(data)}", (404, {}))
+    virustotal.on("POST", "/files", (200, {"data": {"id": "a3"}}))
+    virustotal.on("GET", "/analyses/a3", (200, {"data": {"attributes": {"status": "queued"}}}))
+    assert security_service.scan_file_with_virustotal(data) is False
@@ -0,0 +1,72 @@
+# tests/test_summarizer.py
+
+import pytest
+import config
+from services import summarizer
+
+
+class FakeTokenizer:
+    """Un token (entier) par mot ; le BOS vaut 0."""
+
+    def __init__(self):
+        self.vocab = {}
+
+    def tokenize(self, data, add_bos=False):
+        tokens = [self.vocab.setdefault(word, len(self.vocab) + 1) for word in data.decode("utf-8").split()]
+        return [0] + tokens if add_bos else tokens
+
+
+@pytest.fixture
+def llm(monkeypatch):
+    calls = []
+
+    def fake_call(prompt, max_token=500, **kwargs):
+        calls.append(prompt)
+        return f"résumé{len(calls)} " + "mot " * 6
+
+    tokenizer = FakeTokenizer()
+    monkeypatch.setattr(summarizer, "get_llm", lambda: tokenizer)
+    monkeypatch.setattr(summarizer, "call_mistral", fake_call)
+    monkeypatch.setattr(summarizer, "summary_stats", {"chunks": 0, "cache_hits": 0, "llm_calls": 0, "levels": 0})
+    monkeypatch.setattr(config, "N_CTX", 60)
+    monkeypatch.setattr(config, "SUMMARY_MAX_TOKENS", 10)
+    summarizer._static_tokens.cache_clear()
+    yield calls
+    summarizer._static_tokens.cache_clear()
+
+
+def _paragraph(n, words=10):
+    return " ".join(f"p{n}m{i}" for i in range(words))
+
+
+def test_chunks_fit_the_prompt_budget(llm):
+    budget = summarizer._chunk_budget(summarizer.MAP_INSTRUCTION)
+    text = "\n\n".join([_paragraph(1), _paragraph(2), _paragraph(3), _paragraph(4, words=3 * budget)])
+    chunks = summarizer.plan_chunks(text)
+    assert all(len(chunk) <= budget for chunk in chunks)
+    assert sum(len(chunk) for chunk in chunks) == 30 + 3 * budget
+    # Les paragraphes courts sont regroupés, le paragraphe trop long est coupé.
+    assert len(chunks) == 2 + 3
+
+
+def test_map_reduce_over_several_levels_and_cache(llm):
+    text = "\n\n".join(_paragraph(n, words=20) for n in range(10))
+    summary = summarizer.summarize(text)
+    assert summary.startswith(f"résumé{len(llm)} ")
+    assert summarizer.summary_stats["levels"] >= 2
+    calls = len(llm)
+    assert summarizer.summarize(text) == summary
+    assert len(llm) == calls
+    assert summarizer.summary_stats["cache_hits"] == summarizer.summary_stats["chunks"] // 2
+
+
+def test_quoted_message_reuses_the_summary_of_the_original(llm):
+    original = _paragraph(1) + "\n\n" + _paragraph(2)
+    summarizer.summarize(original)
+    calls = len(llm)
+    reply = ("Merci, je regarde.\n\nLe lundi 2 mars 2026, Alice <alice@example.com> a écrit :\n"
+             + "\n".join("> " + line for line in original.splitlines()))
+    summarizer.summarize(reply)
+    # Un seul nouveau morceau (la réponse) et un résumé combiné ; le message cité vient du cache.
+    assert len(llm) == calls + 2
+    assert summarizer.summary_stats["cache_hits"] == 1
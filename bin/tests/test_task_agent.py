@@ -0,0 +1,51 @@
+# tests/test_task_agent.py
+
+import pytest
+from agents import task_agent
+
+
+@pytest.fixture(autouse=True)
+def database():
+    task_agent.setup_database()
+
+
+def test_add_tasks_reports_the_id_of_each_inserted_row():
+    task_agent.add_task("existante")
+    results = task_agent.add_tasks([
+        {"description": "rapport", "priority": 1},
+        {"description": "   "},
+        {"description": "courses", "priority": 9},
+        {"description": "plombier", "due_date": "2099-01-01 00:00:00", "source": "email_agent"},
+    ])
+    assert [result["ok"] for result in results] == [True, False, False, True]
+    tasks = {task["id"]: task["description"] for task in task_agent.get_tasks()}
+    assert tasks[results[0]["id"]] == "rapport"
+    assert tasks[results[3]["id"]] == "plombier"
+
+
+def test_update_and_delete_tasks_report_missing_ids():
+    ids = [result["id"] for result in task_agent.add_tasks([{"description": "a"}, {"description": "b"}])]
+    results = task_agent.update_tasks_status([(ids[0], 'terminé'), (999, 'terminé'), (ids[1], 'bof')])
+    assert [result["ok"] for result in results] == [True, False, False]
+    results = task_agent.delete_tasks([ids[1], 999])
+    assert [result["ok"] for result in results] == [True, False]
+    assert [task["description"] for task in task_agent.get_tasks()] == ["a"]
+
+
+def test_bulk_completion_feeds_the_user_profile(monkeypatch):
+    recorded = []
+    monkeypatch.setattr(task_agent.user_profile, "record_completed_tasks", recorded.extend)
+    task_agent.add_tasks([{"description": "a", "priority": 1}, {"description": "b"}, {"description": "c"}])
+    task_agent.update_status_where('en cours', current_status='à faire')
+    assert recorded == []
+    assert task_agent.update_status_where('terminé', current_status='en cours') == 3
+    assert sorted(task["description"] for task in recorded) == ["a", "b", "c"]
+
+
+def test_update_status_where_reports_database_errors():
+    task_agent.add_task("a")
+    conn = task_agent.get_connection(task_agent.config.DB_PATH)
+    conn.execute("CREATE TRIGGER refuse BEFORE UPDATE ON tasks BEGIN SELECT RAISE(ABORT, 'refusé'); END")
+    assert task_agent.update_status_where('terminé') == 0
+    assert not conn.in_transaction
+    assert [task["status"] for task in task_agent.get_tasks()] == ['à faire']
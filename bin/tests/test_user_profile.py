@@ -0,0 +1,54 @@
+# tests/test_user_profile.py
+
+from services import prompt_builder, user_profile
+from services.prompt_builder import PromptBuilder
+
+
+def _events(*ids):
+    return [{"id": event_id, "start": {"dateTime": "2026-03-02T10:00:00+01:00"}} for event_id in ids]
+
+
+def test_each_event_is_counted_once():
+    user_profile.record_events("primary", _events("a", "b"))
+    user_profile.record_events("primary", _events("a", "c"))
+    counts = user_profile._connect().execute(
+        "SELECT SUM(count) FROM profile_counters WHERE category = 'meeting_weekday'").fetchone()[0]
+    assert counts == 3
+
+
+def test_old_observations_are_pruned_once_a_day(monkeypatch):
+    conn = user_profile._connect()
+    with conn:
+        conn.execute("INSERT INTO profile_observations (source, ref, seen_at) VALUES ('email', 'ancien', '2000-01-01')")
+    monkeypatch.setattr(user_profile, "_observations_pruned_on", None)
+    user_profile.record_email("récent", "Alice <alice@example.com>")
+    refs = [row["ref"] for row in conn.execute("SELECT ref FROM profile_observations ORDER BY ref")]
+    assert refs == ["récent"]
+    with conn:
+        conn.execute("INSERT INTO profile_observations (source, ref, seen_at) VALUES ('email', 'ancien', '2000-01-01')")
+    user_profile.record_email("autre", "Bob <bob@example.com>")
+    assert conn.execute("SELECT COUNT(*) FROM profile_observations").fetchone()[0] == 3
+
+
+class CountingTokenizer:
+    """Un token par mot ; compte les textes tokenisés."""
+
+    calls = []
+
+    def tokenize(self, data, add_bos=False):
+        self.calls.append(data)
+        return data.decode("utf-8").split()
+
+
+def test_profile_section_is_tokenized_once_per_digest(monkeypatch):
+    monkeypatch.setattr(prompt_builder, "get_llm", CountingTokenizer)
+    monkeypatch.setattr(CountingTokenizer, "calls", [])
+    user_profile.record_email("m1", "Alice <alice@example.com>", 4)
+    prompts = []
+    for _ in range(3):
+        builder = PromptBuilder(max_new_tokens=0, n_ctx=1000)
+        user_profile.add_to_prompt(builder)
+        prompts.append(builder.build())
+    assert "Alice" in prompts[0] and len(set(prompts)) == 1
+    sections = [data for data in CountingTokenizer.calls if b"### PROFIL" in data]
+    assert len(sections) == 1
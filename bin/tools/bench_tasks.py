@@ -0,0 +1,67 @@
+# tools/bench_tasks.py
+
+import argparse
+import contextlib
+import io
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config  # noqa: E402
+
+# Mesure du débit des opérations sur les tâches (agents/task_agent.py), dans une base temporaire :
+#   python tools/bench_tasks.py --count 2000
+# La référence « connexion + commit par tâche » reproduit l'ancien accès à tasks.db.
+
+
+def _measure(label, count, operation):
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        operation()
+        elapsed = time.perf_counter() - start
+    print(f"{label:<45} {count / elapsed:>10,.0f} tâches/s  ({elapsed:.2f} s)")
+
+
+def _insert_with_new_connection(count):
+    for i in range(count):
+        conn = sqlite3.connect(config.DB_PATH)
+        with conn:
+            conn.execute("INSERT INTO tasks (description, priority, source) VALUES (?, ?, ?)", (f"tâche {i}", 2, 'bench'))
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Débit des opérations sur les tâches.")
+    parser.add_argument("--count", type=int, default=2000, help="nombre de tâches par mesure")
+    args = parser.parse_args()
+    count = args.count
+
+    with tempfile.TemporaryDirectory() as directory:
+        config.DB_PATH = os.path.join(directory, "tasks.db")
+        config.MEMORY_DB_PATH = os.path.join(directory, "memory.db")
+        config.EMBEDDING_ENABLED = False
+        from agents import task_agent
+        with contextlib.redirect_stdout(io.StringIO()):
+            task_agent.setup_database()
+
+        print(f"SQLite {sqlite3.sqlite_version}, {count} tâches par mesure\n")
+        _measure("add_task, connexion + commit par tâche", count, lambda: _insert_with_new_connection(count))
+        _measure("add_task, connexion partagée", count,
+                 lambda: [task_agent.add_task(f"tâche {i}", 2) for i in range(count)])
+        _measure("add_tasks, une transaction", count, lambda: task_agent.add_tasks(
+            {"description": f"tâche {i}", "priority": 2, "source": "bench"} for i in range(count)))
+
+        ids = [task["id"] for task in task_agent.get_tasks()][:count]
+        _measure("update_task_status, une tâche à la fois", len(ids),
+                 lambda: [task_agent.update_task_status(task_id, 'en cours') for task_id in ids])
+        _measure("update_tasks_status, une transaction", len(ids),
+                 lambda: task_agent.update_tasks_status((task_id, 'terminé') for task_id in ids))
+        _measure("delete_tasks, une transaction", len(ids), lambda: task_agent.delete_tasks(ids))
+
+
+if __name__ == "__main__":
+    main()